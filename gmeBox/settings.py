@@ -70,9 +70,11 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'store.context_processors.empresa',
             ],
             'libraries':{
                 'page_extras': 'templatetags.page_extras',
+                'image_extras': 'templatetags.image_extras',
 
             }
         },
@@ -96,6 +98,12 @@ DATABASES = {
     }
 }
 
+# En producción debe ser una caché compartida entre procesos, por ejemplo
+# memcache://127.0.0.1:11211, manage.py check --deploy lo verifica
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -0,0 +1,116 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.models import Group
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from people.models import Usuario
+
+TRABAJADORES = getattr(settings, 'CREDENCIALES_TRABAJADORES', os.cpu_count() or 1)
+MINIMO_POOL = 64
+TAMANIO_LOTE = 1000
+
+
+def obtener_hasher():
+    """
+    Hasher de las contraseñas iniciales. CREDENCIALES_HASHER permite elegir
+    uno más barato, por ejemplo en pruebas, y debe estar en PASSWORD_HASHERS.
+    """
+    return get_hasher(getattr(settings, 'CREDENCIALES_HASHER', 'default'))
+
+
+def hashear(contrasenia, hasher=None):
+    hasher = hasher or obtener_hasher()
+    return hasher.encode(contrasenia, hasher.salt())
+
+
+def hashear_con_clase(ruta, contrasenias):
+    """
+    Se ejecuta en los procesos del pool, recibe la ruta de la clase del hasher
+    porque los procesos no comparten los settings modificados del proceso principal.
+    """
+    hasher = import_string(ruta)()
+    return [hasher.encode(contrasenia, hasher.salt()) for contrasenia in contrasenias]
+
+
+def hashear_lote(contrasenias, trabajadores=TRABAJADORES):
+    """
+    Calcula los hashes de varias contraseñas repartiéndolos en un pool de
+    procesos. Los procesos se inician con spawn para que no hereden la
+    conexión a la base de datos, que puede estar en medio de una transacción,
+    y cada uno inicializa Django al arrancar. Con pocas contraseñas se
+    calculan en el mismo proceso.
+    """
+    contrasenias = list(contrasenias)
+    hasher = obtener_hasher()
+    if trabajadores <= 1 or len(contrasenias) < MINIMO_POOL:
+        return [hashear(contrasenia, hasher) for contrasenia in contrasenias]
+    ruta = '{}.{}'.format(type(hasher).__module__, type(hasher).__qualname__)
+    tamanio = max(1, math.ceil(len(contrasenias) / (trabajadores * 4)))
+    partes = [contrasenias[inicio:inicio + tamanio] for inicio in range(0, len(contrasenias), tamanio)]
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=trabajadores, mp_context=contexto, initializer=django.setup) as pool:
+        return [hash_ for parte in pool.map(partial(hashear_con_clase, ruta), partes) for hash_ in parte]
+
+
+def crear_usuario(persona, correo_electronico, grupo):
+    """
+    Crea el usuario de la persona con su número de identificación como
+    contraseña inicial y lo agrega al grupo indicado.
+    """
+    grupo = Group.objects.get(name=grupo)
+    usuario = Usuario(nombre_de_usuario=correo_electronico, correo_electronico=correo_electronico,
+                      is_staff=True, is_active=True, persona_id=persona.id,
+                      password=hashear(persona.numero_identificacion))
+    usuario.save()
+    grupo.user_set.add(usuario)
+    return usuario
+
+
+def actualizar_usuario(persona, correo_electronico, cambio_identificacion):
+    """
+    Actualiza el correo del usuario de la persona con un solo UPDATE. La
+    contraseña solo se vuelve a generar si cambió el número de
+    identificación, editar otros datos no calcula ningún hash.
+    """
+    campos = {'correo_electronico': correo_electronico, 'nombre_de_usuario': correo_electronico,
+              'updated_at': timezone.now()}
+    if cambio_identificacion:
+        campos['password'] = hashear(persona.numero_identificacion)
+    return Usuario.objects.filter(persona_id=persona.id).update(**campos)
+
+
+def crear_usuarios(cuentas, grupo, trabajadores=TRABAJADORES, simulacion=False):
+    """
+    Crea en bloque los usuarios de varias personas, cuentas es una lista de
+    tuplas (persona_id, numero_identificacion, correo_electronico,
+    nombre_de_usuario). Los hashes se calculan con hashear_lote y los
+    usuarios y su grupo se insertan con bulk_create. En una simulación los
+    cambios se revierten, así que los usuarios quedan sin contraseña usable
+    en lugar de calcular los hashes.
+    """
+    cuentas = list(cuentas)
+    if simulacion:
+        hashes = [make_password(None) for cuenta in cuentas]
+    else:
+        hashes = hashear_lote([numero for persona_id, numero, correo, nombre in cuentas], trabajadores)
+    Usuario.objects.bulk_create([
+        Usuario(persona_id=persona_id, correo_electronico=correo, nombre_de_usuario=nombre,
+                is_staff=True, is_active=True, password=hash_)
+        for (persona_id, numero, correo, nombre), hash_ in zip(cuentas, hashes)
+    ], batch_size=TAMANIO_LOTE)
+    grupo, creado = Group.objects.get_or_create(name=grupo)
+    Miembro = Usuario.groups.through
+    correos = [correo for persona_id, numero, correo, nombre in cuentas]
+    for inicio in range(0, len(correos), TAMANIO_LOTE):
+        ids = Usuario.objects.filter(correo_electronico__in=correos[inicio:inicio + TAMANIO_LOTE]).values_list(
+            'id', flat=True)
+        Miembro.objects.bulk_create([Miembro(usuario_id=usuario_id, group_id=grupo.id) for usuario_id in ids])
+    return len(cuentas)
@@ -0,0 +1,96 @@
+import numpy as np
+
+# Coeficientes de __validar_ced_ruc para cédulas y RUC de personas naturales,
+# RUC públicos y RUC jurídicos
+MULTIP_NATURAL = np.array((2, 1, 2, 1, 2, 1, 2, 1, 2), dtype=np.int64)
+MULTIP_PUBLICO = np.array((3, 2, 7, 6, 5, 4, 3, 2), dtype=np.int64)
+MULTIP_PRIVADO = np.array((4, 3, 2, 7, 6, 5, 4, 3, 2), dtype=np.int64)
+# Tipos de documento que se verifican como cédula o RUC
+DOCUMENTOS_NUMERICOS = ('DNI', 'RUC')
+
+
+class IdentificacionInvalida(ValueError):
+    """
+    El número de identificación no tiene un formato de cédula o RUC.
+    """
+
+
+def verificar(nro):
+    l = len(nro)
+    if l == 10 or l == 13: # verificar la longitud correcta
+        cp = int(nro[0:2])
+        if cp >= 1 and cp <= 22: # verificar codigo de provincia
+            tercer_dig = int(nro[2])
+            if tercer_dig >= 0 and tercer_dig < 6 : # numeros enter 0 y 6
+                if l == 10:
+                    return __validar_ced_ruc(nro,0)                       
+                elif l == 13:
+                    return __validar_ced_ruc(nro,0) and nro[10:13] != '000' # se verifica q los ultimos numeros no sean 000
+            elif tercer_dig == 6:
+                return __validar_ced_ruc(nro,1) # sociedades publicas
+            elif tercer_dig == 9: # si es ruc
+                return __validar_ced_ruc(nro,2) # sociedades privadas
+            else:
+                raise IdentificacionInvalida(u'Tercer digito invalido') 
+        else:
+            raise IdentificacionInvalida(u'Codigo de provincia incorrecto') 
+    else:
+        raise IdentificacionInvalida(u'Longitud incorrecta del numero ingresado')
+
+def __validar_ced_ruc(nro,tipo):
+    total = 0
+    if tipo == 0: # cedula y r.u.c persona natural
+        base = 10
+        d_ver = int(nro[9])# digito verificador
+        multip = (2, 1, 2, 1, 2, 1, 2, 1, 2)
+    elif tipo == 1: # r.u.c. publicos
+        base = 11
+        d_ver = int(nro[8])
+        multip = (3, 2, 7, 6, 5, 4, 3, 2 )
+    elif tipo == 2: # r.u.c. juridicos y extranjeros sin cedula
+        base = 11
+        d_ver = int(nro[9])
+        multip = (4, 3, 2, 7, 6, 5, 4, 3, 2)
+    for i in range(0,len(multip)):
+        p = int(nro[i]) * multip[i]
+        if tipo == 0:
+            total+=p if p < 10 else int(str(p)[0])+int(str(p)[1])
+        else:
+            total+=p
+    mod = total % base
+    val = base - mod if mod != 0 else 0
+    return val == d_ver
+
+def verificar_lote(numeros):
+    """
+    Verifica varios números de identificación con las mismas reglas que
+    verificar, pero sobre una matriz de dígitos: los dígitos verificadores
+    de todos los números se calculan a la vez con numpy. Devuelve un
+    diccionario {número: válido}, los números con un formato que verificar
+    no acepta se consideran incorrectos.
+    """
+    validos = dict.fromkeys(numeros, False)
+    candidatos = [nro for nro in validos if len(nro) in (10, 13) and nro.isascii() and nro.isdigit()]
+    if not candidatos:
+        return validos
+    digitos = (np.frombuffer(''.join(nro[:10] for nro in candidatos).encode('ascii'), dtype=np.uint8).reshape(
+        -1, 10) - ord('0')).astype(np.int64)
+    provincia = digitos[:, 0] * 10 + digitos[:, 1]
+    tercer_dig = digitos[:, 2]
+    establecimiento = np.array([len(nro) == 10 or nro[10:13] != '000' for nro in candidatos])
+
+    productos = digitos[:, :9] * MULTIP_NATURAL
+    productos = np.where(productos < 10, productos, productos - 9)
+    natural = verificador(productos.sum(axis=1), 10) == digitos[:, 9]
+    publico = verificador(digitos[:, :8] @ MULTIP_PUBLICO, 11) == digitos[:, 8]
+    privado = verificador(digitos[:, :9] @ MULTIP_PRIVADO, 11) == digitos[:, 9]
+
+    resultado = (provincia >= 1) & (provincia <= 22) & np.select(
+        (tercer_dig < 6, tercer_dig == 6, tercer_dig == 9), (natural & establecimiento, publico, privado), False)
+    validos.update(zip(candidatos, resultado.tolist()))
+    return validos
+
+
+def verificador(totales, base):
+    residuo = totales % base
+    return np.where(residuo != 0, base - residuo, 0)
@@ -0,0 +1,17 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0004_auto_20201022_1456'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='persona',
+            index=models.Index(fields=['numero_identificacion'], name='persona_identificacion_idx'),
+        ),
+    ]
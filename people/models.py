@@ -22,6 +22,11 @@ class Persona(models.Model):
         verbose_name='Tipo de Identificación'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['numero_identificacion'], name='persona_identificacion_idx'),
+        ]
+
     def __str__(self):
         return '{} {}'.format(self.nombre, self.apellido)
 
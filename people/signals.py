@@ -0,0 +1,28 @@
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from people.models import Usuario
+from utils.permissions import invalidar_permisos
+
+
+@receiver(m2m_changed, sender=Usuario.groups.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidar_permisos_relacion(sender, action, **kwargs):
+    """
+    Invalida los permisos en caché cuando cambian los grupos de un usuario o
+    los permisos de un grupo.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar_permisos()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidar_permisos_modelo(sender, **kwargs):
+    """
+    Invalida los permisos en caché cuando se modifica un grupo o un permiso.
+    """
+    invalidar_permisos()
@@ -1,3 +1,203 @@
-from django.test import TestCase
+import random
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from people import credentials, identification
+from people.models import Usuario
+from store.models import Cliente
+from utils import permissions
+
+HASHER_PRUEBAS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+@override_settings(PASSWORD_HASHERS=HASHER_PRUEBAS)
+class CredencialesTest(TestCase):
+    """
+    Verifica que las contraseñas iniciales solo se calculan cuando hace falta.
+    """
+
+    def setUp(self):
+        Group.objects.create(name='CLIENTE')
+        administrador = Usuario.objects.create(
+            correo_electronico='admin@gmebox.com', nombre_de_usuario='admin', is_active=True, is_superuser=True)
+        self.client.force_login(administrador)
+
+    def datos(self, **kwargs):
+        datos = {'tipo_documento_identificacion': 'PASAPORTE', 'nombre': 'Ana', 'apellido': 'Ruiz',
+                 'numero_identificacion': 'A123', 'correo_electronico': 'ana@gmebox.com'}
+        datos.update(kwargs)
+        return datos
+
+    def test_crear_y_actualizar_cliente(self):
+        self.client.post(reverse('client-add'), self.datos())
+        cliente = Cliente.objects.get(numero_identificacion='A123')
+        usuario = Usuario.objects.get(persona_id=cliente.id)
+        self.assertTrue(usuario.check_password('A123'))
+        self.assertTrue(usuario.groups.filter(name='CLIENTE').exists())
+
+        url = reverse('client-update', kwargs={'pk': cliente.id})
+        with mock.patch.object(credentials, 'hashear', wraps=credentials.hashear) as hashear:
+            self.client.post(url, self.datos(correo_electronico='ana.ruiz@gmebox.com'))
+            self.assertFalse(hashear.called)
+            self.client.post(url, self.datos(correo_electronico='ana.ruiz@gmebox.com', numero_identificacion='B456'))
+            self.assertTrue(hashear.called)
+        usuario.refresh_from_db()
+        self.assertEqual(usuario.correo_electronico, 'ana.ruiz@gmebox.com')
+        self.assertTrue(usuario.check_password('B456'))
+
+    def test_identificacion_incorrecta_es_error_del_formulario(self):
+        for numero, mensaje in (('123', 'Longitud incorrecta'), ('9910034065', 'Codigo de provincia'),
+                                ('1710034066', 'Número de Identificación incorrecto'),
+                                ('17100340AB', 'Número de Identificación incorrecto')):
+            response = self.client.post(reverse('client-add'), self.datos(
+                tipo_documento_identificacion='DNI', numero_identificacion=numero))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(mensaje, response.context['form'].errors['numero_identificacion'][0])
+        self.assertFalse(Cliente.objects.exists())
+        self.client.post(reverse('client-add'), self.datos(
+            tipo_documento_identificacion='DNI', numero_identificacion='1710034065'))
+        cliente = Cliente.objects.get(numero_identificacion='1710034065')
+        response = self.client.post(reverse('client-update', kwargs={'pk': cliente.id}), self.datos(
+            tipo_documento_identificacion='RUC', numero_identificacion='17100340'))
+        self.assertIn('Longitud incorrecta', response.context['form'].errors['numero_identificacion'][0])
+
+    def test_hashear_lote_en_procesos(self):
+        with mock.patch.object(credentials, 'MINIMO_POOL', 1):
+            hashes = credentials.hashear_lote(['1', '2', '3'], trabajadores=2)
+        self.assertEqual([hash_.split('$')[0] for hash_ in hashes], ['md5'] * 3)
+        hasher = credentials.obtener_hasher()
+        self.assertTrue(all(hasher.verify(contrasenia, hash_) for contrasenia, hash_ in zip('123', hashes)))
+
+    def test_simulacion_sin_hashes(self):
+        cliente = Cliente.objects.create(nombre='Ana', apellido='Ruiz', numero_identificacion='A123')
+        with mock.patch.object(credentials, 'hashear_lote') as hashear_lote:
+            credentials.crear_usuarios([(cliente.id, 'A123', 'ana@gmebox.com', 'ana')], 'CLIENTE', simulacion=True)
+        self.assertFalse(hashear_lote.called)
+        self.assertFalse(Usuario.objects.get(correo_electronico='ana@gmebox.com').has_usable_password())
+
+
+class IdentificacionTest(TestCase):
+    """
+    Verifica la validación de cédulas y RUC.
+    """
+
+    def test_verificar(self):
+        self.assertTrue(identification.verificar('1710034065'))
+        self.assertFalse(identification.verificar('1710034066'))
+        with self.assertRaises(identification.IdentificacionInvalida):
+            identification.verificar('9910034065')
+
+    def test_verificar_lote(self):
+        self.assertEqual(identification.verificar_lote(['1710034065', '1710034065', '123', 'abc', '9910034065']),
+                         {'1710034065': True, '123': False, 'abc': False, '9910034065': False})
+
+    def test_verificar_lote_coincide_con_verificar(self):
+        generador = random.Random(7)
+        numeros = ['{:02d}{}{}'.format(generador.randint(0, 24), generador.choice('0123456789'),
+                                       ''.join(generador.choice('0123456789') for _ in range(largo - 3)))
+                   for largo in (10, 13) for _ in range(2000)]
+        numeros += ['1710034065000', '1760001550001', '1790010937001', '0960001540001']
+
+        def verificar(nro):
+            try:
+                return identification.verificar(nro)
+            except identification.IdentificacionInvalida:
+                return False
+        self.assertEqual(identification.verificar_lote(numeros), {nro: verificar(nro) for nro in numeros})
+
+
+class PermisosTest(TestCase):
+    """
+    Verifica que los permisos en caché se invalidan al cambiar los grupos del
+    usuario o los permisos de un grupo, y que la copia del proceso vence.
+    """
+
+    def setUp(self):
+        cache.clear()
+        permissions.permisos_locales.clear()
+        self.grupo = Group.objects.create(name='TECNICO')
+        self.usuario = Usuario.objects.create(
+            correo_electronico='tecnico@gmebox.com', nombre_de_usuario='tecnico', is_active=True)
+        self.usuario.groups.add(self.grupo)
+        self.permiso = Permission.objects.get(codename='view_factura')
+
+    def permisos(self):
+        # Cada petición trae una instancia nueva del usuario
+        return permissions.obtener_permisos(Usuario.objects.get(pk=self.usuario.pk))
+
+    def test_invalidacion(self):
+        self.assertEqual(self.permisos(), frozenset())
+        self.grupo.permissions.add(self.permiso)
+        self.assertEqual(self.permisos(), {'view_factura'})
+        self.usuario.groups.remove(self.grupo)
+        self.assertEqual(self.permisos(), frozenset())
+        self.usuario.groups.add(self.grupo)
+        self.assertEqual(self.permisos(), {'view_factura'})
+        self.grupo.permissions.clear()
+        self.assertEqual(self.permisos(), frozenset())
+        self.grupo.permissions.add(self.permiso)
+        self.grupo.delete()
+        self.assertEqual(self.permisos(), frozenset())
+
+    def test_copia_local_vence(self):
+        locales = permissions.CacheLRU(2, duracion=30)
+        with mock.patch.object(permissions.time, 'monotonic', return_value=100):
+            locales.set('accesos', {'view_factura'})
+        with mock.patch.object(permissions.time, 'monotonic', return_value=129):
+            self.assertEqual(locales.get('accesos'), {'view_factura'})
+        with mock.patch.object(permissions.time, 'monotonic', return_value=130):
+            self.assertIsNone(locales.get('accesos'))
+
+    def test_cache_compartida_requerida(self):
+        self.assertEqual([error.id for error in permissions.verificar_cache(None)], ['utils.E001'])
+        compartida = {'default': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+                                  'LOCATION': '127.0.0.1:11211'}}
+        with override_settings(CACHES=compartida):
+            self.assertEqual(permissions.verificar_cache(None), [])
+
+
+class EtiquetasPermisosTest(TestCase):
+    """
+    Verifica que las etiquetas de permisos y roles consultan los grupos del
+    usuario una sola vez por petición.
+    """
+    plantilla = Template(
+        '{% load page_extras %}'
+        '{% has_permission user "view_factura" as factura %}{% has_permission user "view_cliente" as cliente %}'
+        '{% has_permission user "add_factura" as agregar %}{% has_role user "TECNICO" as tecnico %}'
+        '{% has_role user "CLIENTE" as rol_cliente %}'
+        '{{ factura }} {{ cliente }} {{ agregar }} {{ tecnico }} {{ rol_cliente }}')
+
+    def setUp(self):
+        cache.clear()
+        permissions.permisos_locales.clear()
+        grupo = Group.objects.create(name='TECNICO')
+        grupo.permissions.add(Permission.objects.get(codename='view_factura'))
+        usuario = Usuario.objects.create(
+            correo_electronico='tecnico@gmebox.com', nombre_de_usuario='tecnico', is_active=True)
+        usuario.groups.add(grupo)
+        self.usuario_id = usuario.pk
+
+    def renderizar(self, usuario):
+        return self.plantilla.render(Context({'user': usuario}))
+
+    def test_una_consulta_por_peticion(self):
+        usuario = Usuario.objects.get(pk=self.usuario_id)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.renderizar(usuario), 'True False False True False')
+            self.renderizar(usuario)
+        with self.assertNumQueries(0):
+            self.renderizar(Usuario(pk=self.usuario_id, is_active=True))
+
+    def test_superusuario_e_inactivo_sin_consultas(self):
+        permisos = Template('{% load page_extras %}{% has_permission user "add_factura" as agregar %}{{ agregar }}')
+        with self.assertNumQueries(0):
+            self.assertEqual(permisos.render(Context({'user': Usuario(pk=0, is_active=True, is_superuser=True)})),
+                             'True')
+            self.assertEqual(self.renderizar(Usuario(pk=self.usuario_id, is_active=False)),
+                             'False False False False False')
@@ -1,11 +1,79 @@
-from django.contrib import admin
+import json
+from collections import defaultdict
+
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from people.models import Direccion
 
-from store.models import (Categoria, Empresa, Producto,
-                          Proveedor, OrdenMantenimiento, DetalleOrden, RevisionTecnica, Compra, DetalleCompra)
+from store import importer, stock
+from store.forms import ImportacionForm
+from store.models import (Categoria, Cliente, Empresa, Producto,
+                          Proveedor, OrdenMantenimiento, DetalleOrden, RevisionTecnica, Compra, DetalleCompra,
+                          TrabajoPdf)
 import nested_admin
 import admin_thumbnails
 
+
+class ImportacionAdminMixin(object):
+    """
+    Agrega al listado del administrador una página para importar un archivo
+    CSV o JSON con store.importer
+    """
+    tipo_importacion = None
+    change_list_template = 'admin/store/importacion_change_list.html'
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('importar/', self.admin_site.admin_view(self.importar_view), name='%s_%s_importar' % info),
+        ] + super(ImportacionAdminMixin, self).get_urls()
+
+    def importar_view(self, request):
+        """
+        El archivo se importa en un trabajo en segundo plano, la página
+        muestra su avance y el resultado cuando termina
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        info = self.model._meta.app_label, self.model._meta.model_name
+        form = ImportacionForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            try:
+                trabajo = importer.solicitar(self.tipo_importacion, form.cleaned_data['archivo'],
+                                             form.cleaned_data['simulacion'], request.user)
+            except importer.ArchivoInvalido as e:
+                form.add_error('archivo', str(e))
+            else:
+                return redirect('{}?trabajo={}'.format(reverse('admin:%s_%s_importar' % info), trabajo.pk))
+        trabajo = None
+        if request.method == 'GET' and request.GET.get('trabajo', '').isdigit():
+            trabajo = get_object_or_404(TrabajoPdf, pk=request.GET['trabajo'], usuario=request.user,
+                                        tipo='IMPORTACION')
+        resultado = None
+        if trabajo is not None and trabajo.estado == 'TERMINADO':
+            resultado = importer.Resultado.desde_resumen(json.loads(trabajo.resultado))
+            if resultado.valido and not resultado.simulacion:
+                self.message_user(request, 'Importados: {}'.format(', '.join(
+                    '{} {}'.format(cantidad, nombre) for nombre, cantidad in resultado.creados.items())),
+                    messages.SUCCESS)
+                return redirect('admin:%s_%s_changelist' % info)
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Importar {}'.format(self.model._meta.verbose_name_plural),
+            opts=self.model._meta,
+            form=form,
+            ayuda=importer.IMPORTADORES[self.tipo_importacion].__doc__,
+            trabajo=trabajo,
+            filas=importer.avance(trabajo) if trabajo else 0,
+            resultado=resultado,
+            errores=resultado.errores if resultado else [],
+        )
+        return TemplateResponse(request, 'admin/store/importar.html', context)
+
 class DirecionAdminInline(admin.TabularInline):
     model = Direccion
 
@@ -39,15 +107,19 @@ class CategoriaAdmin(admin.ModelAdmin):
     )
 
 
-@admin_thumbnails.thumbnail('image')
-class ProductoAdmin(admin.ModelAdmin):
-    list_display = ('nombre', 'cantidad', 'descripcion', 'categoria','image_thumbnail')
+@admin_thumbnails.thumbnail('miniatura', 'Imagen')
+class ProductoAdmin(ImportacionAdminMixin, admin.ModelAdmin):
+    tipo_importacion = 'PRODUCTO'
+    list_display = ('nombre', 'cantidad', 'descripcion', 'categoria','miniatura_thumbnail')
     search_fields = ('nombre', 'categoria')
     list_filter = ('nombre', 'categoria')
+    readonly_fields = ('cantidad',)
 
     def save_model(self, request, obj, form, change):
-        obj.calcular_cantidad()
-        obj.save()
+        if change:
+            obj.save(update_fields=form.changed_data)
+        else:
+            obj.save()
    
 
 class RevisionTecnicaAdminInline(nested_admin.NestedTabularInline):
@@ -73,7 +145,14 @@ class DetalleCompraInline(admin.TabularInline):
     fields = ('producto', 'cantidad', 'precio_unitario', 'impuesto')
 
 
-class CompraAdmin(admin.ModelAdmin):
+class ClienteAdmin(ImportacionAdminMixin, admin.ModelAdmin):
+    tipo_importacion = 'CLIENTE'
+    list_display = ('nombre', 'apellido', 'numero_identificacion', 'tipo_documento_identificacion')
+    search_fields = ('nombre', 'apellido', 'numero_identificacion')
+
+
+class CompraAdmin(ImportacionAdminMixin, admin.ModelAdmin):
+    tipo_importacion = 'COMPRA'
     fields = ('fecha_compra', 'proveedor', 'estado',)
     list_display = ('fecha_compra', 'proveedor', 'estado',
                     'subtotal', 'impuesto', 'total')
@@ -82,17 +161,28 @@ class CompraAdmin(admin.ModelAdmin):
     inlines = (DetalleCompraInline,)
 
     def save_formset(self, request, form, formset, change):
+        """
+        Guarda las líneas en bloque y aplica al stock la diferencia de todas
+        ellas con un UPDATE por producto.
+        """
         instances = formset.save(commit=False)
+        for instance in formset.deleted_objects:
+            instance.delete()
+        anteriores = {pk: (producto_id, cantidad) for pk, producto_id, cantidad in DetalleCompra.objects.filter(
+            pk__in=[instance.pk for instance in instances if instance.pk]).values_list('id', 'producto_id', 'cantidad')}
+        cantidades = defaultdict(int)
         for instance in instances:
             instance.calcular_total()
-            instance.save()
-            producto = Producto.objects.get(id=instance.producto.id)
-            producto.cantidad = producto.cantidad+instance.cantidad
-            producto.save()
-        formset.instance.calcular_impuesto()
-        formset.instance.calcular_subtotal()
-        formset.instance.calcular_total()
-        formset.instance.save()
+            cantidades[instance.producto_id] += instance.cantidad
+            if instance.pk in anteriores:
+                producto_id, cantidad = anteriores[instance.pk]
+                cantidades[producto_id] -= cantidad
+        with transaction.atomic():
+            DetalleCompra.objects.bulk_create([instance for instance in instances if instance.pk is None])
+            DetalleCompra.objects.bulk_update([instance for instance in instances if instance.pk is not None],
+                                              ('producto', 'cantidad', 'precio_unitario', 'impuesto', 'total'))
+            stock.ajustar_lote(cantidades)
+        formset.instance.actualizar_totales()
 
 
 admin.site.register(Empresa, EmpresaAdmin)
@@ -100,4 +190,5 @@ admin.site.register(Proveedor, ProveedorAdmin)
 admin.site.register(Categoria, CategoriaAdmin)
 admin.site.register(Producto, ProductoAdmin)
 admin.site.register(OrdenMantenimiento, OrdenMantenimientoAdmin)
+admin.site.register(Cliente, ClienteAdmin)
 admin.site.register(Compra, CompraAdmin)
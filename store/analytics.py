@@ -0,0 +1,248 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+from store import catalog
+from store.models import CambioVenta, Categoria, DetalleFactura, Factura, MarcaAgregacion, Producto, VentaDiaria
+from utils.permissions import CacheLRU
+
+MARCA = 'VENTAS'
+LRU_MAX_VERSIONES = 2
+TAMANIO_LOTE = getattr(settings, 'VENTAS_TAMANIO_LOTE', 1000)
+DIAS_POR_CONSULTA = 31
+SIN_CLAVE = 0
+
+PERIODOS = {
+    'dia': 'datetime64[D]',
+    'mes': 'datetime64[M]',
+    'anio': 'datetime64[Y]',
+}
+DIMENSIONES = ('producto', 'categoria')
+
+Hechos = namedtuple('Hechos', ('fecha', 'producto', 'lineas', 'cantidad', 'monto', 'impuesto'))
+Catalogo = namedtuple('Catalogo', ('productos', 'categorias', 'nombres_productos', 'nombres_categorias'))
+FilaReporte = namedtuple('FilaReporte', ('periodo', 'clave', 'nombre', 'lineas', 'cantidad', 'monto', 'impuesto'))
+
+datos_locales = CacheLRU(LRU_MAX_VERSIONES)
+
+
+def dia(valor):
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+def partes(valores, tamanio):
+    valores = list(valores)
+    for inicio in range(0, len(valores), tamanio):
+        yield valores[inicio:inicio + tamanio]
+
+
+def marcar(fechas=(), facturas=()):
+    """
+    Registra los días o facturas cuyas ventas deben volver a sumarse.
+    """
+    cambios = [CambioVenta(fecha=fecha) for fecha in {dia(fecha) for fecha in fechas if fecha}]
+    cambios += [CambioVenta(factura_id=factura_id) for factura_id in set(facturas) if factura_id]
+    if cambios:
+        CambioVenta.objects.bulk_create(cambios, batch_size=TAMANIO_LOTE)
+
+
+def sumar_ventas(detalles):
+    """
+    Suma por día y producto los detalles indicados en una consulta.
+    """
+    filas = detalles.order_by().values('factura__fecha_venta', 'producto_id').annotate(
+        numero=Count('id'), unidades=Sum('cantidad'), suma_total=Sum('total'), suma_impuesto=Sum('impuesto'))
+    return [VentaDiaria(fecha=dia(fila['factura__fecha_venta']), producto_id=fila['producto_id'],
+                        lineas=fila['numero'], cantidad=fila['unidades'] or 0,
+                        monto=fila['suma_total'] or 0, impuesto=fila['suma_impuesto'] or 0)
+            for fila in filas]
+
+
+def reemplazar_dias(dias):
+    """
+    Vuelve a sumar los días indicados, de a un mes de días por consulta.
+    """
+    for lote in partes(sorted(set(dias)), DIAS_POR_CONSULTA):
+        ventas = sumar_ventas(DetalleFactura.objects.filter(factura__fecha_venta__in=lote))
+        VentaDiaria.objects.filter(fecha__in=lote).delete()
+        VentaDiaria.objects.bulk_create(ventas, batch_size=TAMANIO_LOTE)
+    return len(set(dias))
+
+
+def reconstruir_todo():
+    """
+    Vuelve a sumar todas las ventas recorriendo el historial por meses, cada
+    consulta agrupa solo los detalles de un mes.
+    """
+    VentaDiaria.objects.all().delete()
+    rango = Factura.objects.aggregate(desde=Min('fecha_venta'), hasta=Max('fecha_venta'))
+    if rango['desde'] is None:
+        return 0
+    inicio, fin = dia(rango['desde']), dia(rango['hasta'])
+    while inicio <= fin:
+        siguiente = (inicio.replace(day=1) + timedelta(days=32)).replace(day=1)
+        ventas = sumar_ventas(DetalleFactura.objects.filter(
+            factura__fecha_venta__gte=inicio, factura__fecha_venta__lt=siguiente))
+        VentaDiaria.objects.bulk_create(ventas, batch_size=TAMANIO_LOTE)
+        inicio = siguiente
+    return (fin - dia(rango['desde'])).days + 1
+
+
+def dias_pendientes(cambios):
+    """
+    Días afectados por los cambios registrados, las facturas se traducen a
+    su fecha actual; las eliminadas registran su fecha al eliminarse.
+    """
+    dias = {fecha for fecha, factura_id in cambios if fecha}
+    facturas = {factura_id for fecha, factura_id in cambios if factura_id}
+    for lote in partes(facturas, TAMANIO_LOTE):
+        dias.update(dia(fecha) for fecha in Factura.objects.filter(pk__in=lote).values_list('fecha_venta', flat=True))
+    return dias
+
+
+def actualizar(completo=False):
+    """
+    Procesa los cambios registrados y vuelve a sumar solo los días afectados.
+    La primera vez, o con completo, suma todo el historial. La marca guarda
+    el último cambio procesado; los cambios procesados se eliminan en lugar
+    de filtrar por id mayor a la marca, porque una transacción puede
+    confirmar un id menor después. Devuelve el número de días procesados y
+    la marca.
+    """
+    with transaction.atomic():
+        marca, creada = MarcaAgregacion.objects.select_for_update().get_or_create(nombre=MARCA)
+        cambios = list(CambioVenta.objects.order_by('id').values_list('id', 'fecha', 'factura_id'))
+        if completo or creada:
+            dias = reconstruir_todo()
+        else:
+            dias = reemplazar_dias(dias_pendientes([(fecha, factura_id) for id_, fecha, factura_id in cambios]))
+        if cambios:
+            marca.ultimo_cambio = cambios[-1][0]
+            for lote in partes([id_ for id_, fecha, factura_id in cambios], TAMANIO_LOTE):
+                CambioVenta.objects.filter(id__in=lote).delete()
+        marca.fecha_actualizacion = timezone.now()
+        marca.save()
+    return dias, marca
+
+
+def obtener_marca():
+    return MarcaAgregacion.objects.filter(nombre=MARCA).first()
+
+
+def centavos(valores):
+    return np.array([int(valor * 100) for valor in valores], dtype=np.int64)
+
+
+def cargar_hechos():
+    """
+    Lee la tabla de ventas diarias en arreglos de NumPy, los montos se guardan
+    en centavos para sumarlos sin perder precisión.
+    """
+    filas = list(VentaDiaria.objects.order_by().values_list(
+        'fecha', 'producto_id', 'lineas', 'cantidad', 'monto', 'impuesto'))
+    if not filas:
+        vacio = np.zeros(0, dtype=np.int64)
+        return Hechos(np.zeros(0, dtype='datetime64[D]'), vacio, vacio, vacio, vacio, vacio)
+    fechas, productos, lineas, cantidades, montos, impuestos = zip(*filas)
+    return Hechos(
+        np.array(fechas, dtype='datetime64[D]'),
+        np.array([producto or SIN_CLAVE for producto in productos], dtype=np.int64),
+        np.array(lineas, dtype=np.int64),
+        np.array(cantidades, dtype=np.int64),
+        centavos(montos),
+        centavos(impuestos),
+    )
+
+
+def cargar_catalogo():
+    filas = list(Producto.objects.order_by('id').values_list('id', 'nombre', 'categoria_id'))
+    return Catalogo(
+        np.array([producto_id for producto_id, nombre, categoria_id in filas], dtype=np.int64),
+        np.array([categoria_id or SIN_CLAVE for producto_id, nombre, categoria_id in filas], dtype=np.int64),
+        {producto_id: nombre for producto_id, nombre, categoria_id in filas},
+        dict(Categoria.objects.values_list('id', 'nombre')),
+    )
+
+
+def obtener_datos(marca=None):
+    """
+    Ventas diarias y catálogo en memoria del proceso, se vuelven a leer solo
+    cuando cambia la fecha de la marca de las ventas, que se lee de la base
+    de datos y así cambia para todos los procesos, o la versión del catálogo.
+    """
+    marca = marca or obtener_marca()
+    clave = (marca.fecha_actualizacion.timestamp() if marca else None, catalog.obtener_version())
+    datos = datos_locales.get(clave)
+    if datos is None:
+        datos = (cargar_hechos(), cargar_catalogo())
+        datos_locales.set(clave, datos)
+    return datos
+
+
+def categorias_de(catalogo, productos):
+    """
+    Traduce un arreglo de ids de producto a ids de categoría.
+    """
+    if not len(catalogo.productos):
+        return np.zeros(len(productos), dtype=np.int64)
+    posiciones = np.searchsorted(catalogo.productos, productos)
+    posiciones = np.minimum(posiciones, len(catalogo.productos) - 1)
+    encontrados = catalogo.productos[posiciones] == productos
+    return np.where(encontrados, catalogo.categorias[posiciones], SIN_CLAVE)
+
+
+def nombre(catalogo, dimension, clave):
+    if dimension == 'producto':
+        return catalogo.nombres_productos.get(clave, 'Sin producto')
+    if dimension == 'categoria':
+        return catalogo.nombres_categorias.get(clave, 'Sin categoría')
+    return ''
+
+
+def decimal(centavos_):
+    return Decimal(int(np.rint(centavos_))).scaleb(-2)
+
+
+def reporte(periodo='mes', dimension=None, desde=None, hasta=None, marca=None):
+    """
+    Ventas agrupadas por día, mes o año y opcionalmente por producto o
+    categoría. Se agrupa en memoria sobre los arreglos de ventas diarias:
+    cada fila recibe una clave de periodo y dimensión, np.unique asigna su
+    grupo y np.bincount suma las columnas. Solo se consulta la marca si no
+    se recibe.
+    """
+    hechos, catalogo = obtener_datos(marca)
+    mascara = np.ones(len(hechos.fecha), dtype=bool)
+    if desde:
+        mascara &= hechos.fecha >= np.datetime64(desde, 'D')
+    if hasta:
+        mascara &= hechos.fecha <= np.datetime64(hasta, 'D')
+    if not mascara.any():
+        return []
+
+    tipo_periodo = PERIODOS[periodo]
+    periodos = hechos.fecha[mascara].astype(tipo_periodo).astype(np.int64)
+    if dimension == 'producto':
+        claves = hechos.producto[mascara]
+    elif dimension == 'categoria':
+        claves = categorias_de(catalogo, hechos.producto[mascara])
+    else:
+        claves = np.zeros(len(periodos), dtype=np.int64)
+
+    base = int(claves.max()) + 1
+    grupos, inverso = np.unique(periodos * base + claves, return_inverse=True)
+    sumas = [np.bincount(inverso, weights=columna[mascara], minlength=len(grupos))
+             for columna in (hechos.lineas, hechos.cantidad, hechos.monto, hechos.impuesto)]
+    periodos_grupo, claves_grupo = np.divmod(grupos, base)
+    etiquetas = periodos_grupo.astype(tipo_periodo).astype(str)
+    return [
+        FilaReporte(etiqueta, int(clave) if dimension else None, nombre(catalogo, dimension, int(clave)),
+                    int(lineas), int(cantidad), decimal(monto), decimal(impuesto))
+        for etiqueta, clave, lineas, cantidad, monto, impuesto in zip(etiquetas, claves_grupo, *sumas)
+    ]
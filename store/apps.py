@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class StoreConfig(AppConfig):
     name = 'store'
+
+    def ready(self):
+        import store.signals  # noqa
+        from store.company import verificar_empresa
+        checks.register(verificar_empresa)
+        from utils.permissions import verificar_cache
+        checks.register(verificar_cache, checks.Tags.caches, deploy=True)
@@ -0,0 +1,109 @@
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+
+from store.models import Categoria, Producto
+from utils.permissions import CacheLRU
+
+CACHE_VERSION_KEY = 'catalogo:version'
+CACHE_INDICE_KEY = 'catalogo:indice'
+CACHE_CATEGORIA_KEY = 'catalogo:categoria:{}'
+CACHE_TIMEOUT = 60 * 60 * 24
+LRU_MAX_VERSIONES = 4
+# Segundos que un proceso conserva el catálogo armado aunque no vea la nueva versión
+DURACION_LOCAL = getattr(settings, 'CATALOGO_DURACION_LOCAL', 60)
+
+Grupo = namedtuple('Grupo', ('grouper', 'list'))
+ProductoCatalogo = namedtuple('ProductoCatalogo', ('nombre', 'precio', 'image', 'image_hash'))
+
+catalogos_locales = CacheLRU(LRU_MAX_VERSIONES, DURACION_LOCAL)
+
+
+def obtener_version():
+    """
+    Devuelve la versión vigente del catálogo, que es la marca de tiempo en
+    milisegundos de su última modificación.
+    """
+    version = cache.get(CACHE_VERSION_KEY)
+    if version is None:
+        cache.add(CACHE_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CACHE_VERSION_KEY)
+    return version
+
+
+def invalidar_catalogo(*categorias):
+    """
+    Elimina de caché las categorías indicadas y el índice, el resto de
+    categorías se conservan y no se vuelven a consultar.
+    """
+    claves = [CACHE_CATEGORIA_KEY.format(categoria_id) for categoria_id in categorias if categoria_id]
+    cache.delete_many(claves + [CACHE_INDICE_KEY])
+    version = max(int(time.time() * 1000), (cache.get(CACHE_VERSION_KEY) or 0) + 1)
+    cache.set(CACHE_VERSION_KEY, version, None)
+    catalogos_locales.clear()
+
+
+def cargar_indice():
+    """
+    Categorías que tienen productos ordenadas por nombre.
+    """
+    return list(Categoria.objects.filter(productos__isnull=False).distinct().order_by(
+        'nombre', 'id').values_list('id', 'nombre'))
+
+
+def cargar_categorias(categorias):
+    """
+    Consulta en una sola query los productos de las categorías indicadas.
+    """
+    productos = {categoria_id: [] for categoria_id in categorias}
+    filas = Producto.objects.filter(categoria_id__in=categorias).order_by('id').values_list(
+        'categoria_id', 'nombre', 'precio', 'image', 'image_hash')
+    for categoria_id, *producto in filas:
+        productos[categoria_id].append(ProductoCatalogo(*producto))
+    return productos
+
+
+def construir_catalogo():
+    indice = cache.get(CACHE_INDICE_KEY)
+    if indice is None:
+        indice = cargar_indice()
+        cache.set(CACHE_INDICE_KEY, indice, CACHE_TIMEOUT)
+    claves = {categoria_id: CACHE_CATEGORIA_KEY.format(categoria_id) for categoria_id, nombre in indice}
+    guardados = cache.get_many(claves.values())
+    faltantes = [categoria_id for categoria_id, clave in claves.items() if clave not in guardados]
+    if faltantes:
+        cargados = cargar_categorias(faltantes)
+        cache.set_many({claves[categoria_id]: productos for categoria_id, productos in cargados.items()},
+                       CACHE_TIMEOUT)
+        guardados.update({claves[categoria_id]: productos for categoria_id, productos in cargados.items()})
+    return [Grupo(nombre, guardados[claves[categoria_id]]) for categoria_id, nombre in indice]
+
+
+def obtener_catalogo():
+    """
+    Devuelve los productos agrupados por categoría. El catálogo armado se
+    guarda en memoria del proceso para la versión vigente de la caché
+    compartida, por lo que una petición con la caché caliente no consulta la
+    base de datos. La copia local vence a los DURACION_LOCAL segundos.
+    """
+    version = obtener_version()
+    catalogo = catalogos_locales.get(version)
+    if catalogo is None:
+        catalogo = construir_catalogo()
+        catalogos_locales.set(version, catalogo)
+    return catalogo
+
+
+def ultima_modificacion():
+    return datetime.fromtimestamp(obtener_version() / 1000, tz=timezone.utc)
+
+
+def etag_catalogo(request):
+    """
+    La página muestra el menú del usuario autenticado, por eso el usuario es
+    parte del ETag.
+    """
+    return '"catalogo-{}-{}"'.format(obtener_version(), request.user.pk or 0)
@@ -0,0 +1,78 @@
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+
+from store.models import Empresa
+from utils.permissions import CacheLRU
+
+CACHE_VERSION_KEY = 'empresa:version'
+CACHE_KEY = 'empresa:{}'
+CACHE_TIMEOUT = 60 * 60 * 24
+SIN_EMPRESA = 'sin-empresa'
+# Segundos que un proceso conserva la empresa aunque no vea la nueva versión
+DURACION_LOCAL = getattr(settings, 'EMPRESA_DURACION_LOCAL', 60)
+
+empresas_locales = CacheLRU(1, DURACION_LOCAL)
+
+
+def obtener_version():
+    version = cache.get(CACHE_VERSION_KEY)
+    if version is None:
+        cache.add(CACHE_VERSION_KEY, int(time.time()), None)
+        version = cache.get(CACHE_VERSION_KEY)
+    return version
+
+
+def invalidar_empresa():
+    """
+    Invalida la empresa en todos los procesos incrementando la versión
+    """
+    try:
+        cache.incr(CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(CACHE_VERSION_KEY, int(time.time()), None)
+    empresas_locales.clear()
+
+
+def obtener_empresa():
+    """
+    Devuelve la empresa del sistema o None si aún no se registra. Se guarda en
+    memoria del proceso para la versión vigente de la caché compartida, la
+    copia local vence a los DURACION_LOCAL segundos.
+    """
+    version = obtener_version()
+    empresa = empresas_locales.get(version)
+    if empresa is None:
+        clave = CACHE_KEY.format(version)
+        empresa = cache.get(clave)
+        if empresa is None:
+            empresa = Empresa.objects.order_by('id').first() or SIN_EMPRESA
+            cache.set(clave, empresa, CACHE_TIMEOUT)
+        empresas_locales.set(version, empresa)
+    return None if empresa == SIN_EMPRESA else empresa
+
+
+def verificar_empresa(app_configs, **kwargs):
+    """
+    Verifica al iniciar que los datos de la empresa estén registrados. Se
+    registra sin la etiqueta database, que Django solo ejecuta si se pide,
+    así corre con runserver, check y migrate; antes de crear la tabla o sin
+    conexión a la base de datos no se verifica nada.
+    """
+    try:
+        if Empresa._meta.db_table not in connection.introspection.table_names():
+            return []
+        existe = Empresa.objects.exists()
+    except DatabaseError:
+        return []
+    if existe:
+        return []
+    return [checks.Warning(
+        'No existen datos de empresa',
+        hint='Registre la empresa desde el administrador antes de crear órdenes o facturas.',
+        obj=Empresa,
+        id='store.W001',
+    )]
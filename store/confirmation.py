@@ -0,0 +1,69 @@
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+from store import analytics, dashboard, receivables, search, workflow
+from store.models import DetalleFactura, DetalleOrden, Factura
+
+TAMANIO_LOTE = 500
+ESTADOS_CONFIRMADOS = ('CONFIRMADO', 'FINALIZADO')
+
+
+def crear_facturas(facturas):
+    """
+    Inserta las facturas y devuelve las instancias con su id. Si el motor no
+    devuelve los ids en un bulk_create se insertan una por una.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        facturas = Factura.objects.bulk_create(facturas)
+        search.indexar_facturas([factura.id for factura in facturas])
+        dashboard.registrar_creados(Factura, facturas)
+        return facturas
+    for factura in facturas:
+        factura.save()
+    return facturas
+
+
+def confirmar_lote(ordenes):
+    """
+    Confirma un lote de órdenes: crea una factura por orden con una línea por
+    cada detalle y marca las órdenes y sus detalles como confirmados.
+    """
+    ids = [orden.id for orden in ordenes]
+    detalles = defaultdict(list)
+    for orden_id, precio in DetalleOrden.objects.filter(orden_mantenimiento_id__in=ids).order_by(
+            'id').values_list('orden_mantenimiento_id', 'precio_servicio'):
+        detalles[orden_id].append(precio)
+
+    fecha = datetime.now()
+    facturas = []
+    for orden in ordenes:
+        subtotal = sum(detalles[orden.id], Decimal('0.00'))
+        facturas.append(Factura(fecha_venta=fecha, cliente_id=orden.cliente_id, empresa_id=orden.empresa_id,
+                                subtotal=subtotal, impuesto=0, total=subtotal))
+    facturas = crear_facturas(facturas)
+
+    DetalleFactura.objects.bulk_create([
+        DetalleFactura(factura_id=factura.id, precio_unitario=precio, cantidad=1, impuesto=0, total=precio)
+        for orden, factura in zip(ordenes, facturas) for precio in detalles[orden.id]
+    ], batch_size=TAMANIO_LOTE)
+    analytics.marcar(facturas=[factura.id for factura in facturas])
+    receivables.invalidar()
+    workflow.confirmar(ids)
+    return facturas
+
+
+def confirmar_ordenes(queryset):
+    """
+    Confirma todas las órdenes del queryset que aún no han sido confirmadas en
+    una sola transacción. Devuelve las facturas creadas.
+    """
+    facturas = []
+    with transaction.atomic():
+        ordenes = list(queryset.exclude(estado__in=ESTADOS_CONFIRMADOS).select_for_update().order_by(
+            'id').only('id', 'cliente_id', 'empresa_id'))
+        for inicio in range(0, len(ordenes), TAMANIO_LOTE):
+            facturas.extend(confirmar_lote(ordenes[inicio:inicio + TAMANIO_LOTE]))
+    return facturas
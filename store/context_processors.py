@@ -0,0 +1,8 @@
+from store.company import obtener_empresa
+
+
+def empresa(request):
+    """
+    Agrega la empresa a todos los templates
+    """
+    return {'empresa': obtener_empresa()}
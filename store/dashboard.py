@@ -0,0 +1,308 @@
+from collections import OrderedDict, defaultdict, namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from store.models import DetalleOrden, Factura, OrdenMantenimiento, ResumenOperacion
+
+DIAS = getattr(settings, 'TABLERO_DIAS', 30)
+TAMANIO_LOTE = 500
+CERO = Decimal('0.00')
+
+Seguimiento = namedtuple('Seguimiento', ('tipo', 'titulo', 'empresa', 'fecha', 'monto', 'pagado', 'estados'))
+
+SEGUIMIENTOS = OrderedDict((
+    (OrdenMantenimiento, Seguimiento(
+        'ORDEN', 'Órdenes de mantenimiento', 'empresa_id', 'fecha_registro', 'monto_servicio', None,
+        OrdenMantenimiento.ESTADO)),
+    (DetalleOrden, Seguimiento(
+        'DETALLE_ORDEN', 'Equipos en reparación', 'orden_mantenimiento__empresa_id',
+        'orden_mantenimiento__fecha_registro', 'precio_servicio', None, DetalleOrden.ESTADO)),
+    (Factura, Seguimiento(
+        'FACTURA', 'Facturas', 'empresa_id', 'fecha_venta', 'total', 'monto_pagado', Factura.ESTADO)),
+))
+
+
+def campos(seguimiento):
+    """
+    Columnas de las que depende el aporte de una fila al resumen.
+    """
+    nombres = [seguimiento.empresa, seguimiento.fecha, 'estado', seguimiento.monto]
+    if seguimiento.pagado:
+        nombres.append(seguimiento.pagado)
+    return nombres
+
+
+def decimal(valor):
+    return Decimal(str(valor or 0)).quantize(CERO)
+
+
+def dia(valor):
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+class Cambios(object):
+    """
+    Acumula las diferencias de cantidad, monto y saldo por empresa, tipo,
+    estado y día antes de escribirlas en el resumen.
+    """
+
+    def __init__(self):
+        self.valores = defaultdict(lambda: [0, CERO, CERO])
+
+    def sumar(self, seguimiento, datos, signo=1, cantidad=1):
+        if datos is None or datos[seguimiento.empresa] is None:
+            return
+        monto = decimal(datos[seguimiento.monto])
+        saldo = monto - decimal(datos[seguimiento.pagado]) if seguimiento.pagado else CERO
+        valores = self.valores[(datos[seguimiento.empresa], seguimiento.tipo, datos['estado'],
+                                dia(datos[seguimiento.fecha]))]
+        valores[0] += signo * cantidad
+        valores[1] += signo * monto
+        valores[2] += signo * saldo
+
+    def aplicar(self):
+        """
+        Escribe las diferencias en las filas del día y en las del total, en
+        un orden fijo para que dos transacciones no se bloqueen entre sí.
+        """
+        cambios = sorted((clave, valores) for clave, valores in self.valores.items() if any(valores))
+        for (empresa_id, tipo, estado, fecha), valores in cambios:
+            incrementar(empresa_id, tipo, estado, fecha, *valores)
+        for (empresa_id, tipo, estado, fecha), valores in cambios:
+            incrementar(empresa_id, tipo, estado, None, *valores)
+        self.valores.clear()
+
+
+def incrementar(empresa_id, tipo, estado, fecha, cantidad, monto, saldo):
+    """
+    Suma las diferencias a la fila con F() para que los guardados simultáneos
+    no se pisen. La fila se crea la primera vez que se registra algo; una
+    resta sobre una fila que no existe (por ejemplo al eliminar la empresa)
+    se descarta y la corrige reconstruir.
+    """
+    filas = ResumenOperacion.objects.filter(empresa_id=empresa_id, tipo=tipo, estado=estado, fecha=fecha)
+    incrementos = {'cantidad': F('cantidad') + cantidad, 'monto': F('monto') + monto, 'saldo': F('saldo') + saldo}
+    if filas.update(**incrementos) or cantidad <= 0:
+        return
+    try:
+        with transaction.atomic():
+            ResumenOperacion.objects.create(empresa_id=empresa_id, tipo=tipo, estado=estado, fecha=fecha,
+                                            cantidad=cantidad, monto=monto, saldo=saldo)
+    except IntegrityError:
+        filas.update(**incrementos)
+
+
+def datos_instancia(model, instance, anterior=None):
+    """
+    Valores de la instancia para calcular su aporte. Los detalles toman la
+    empresa y fecha de su orden, que no se vuelve a consultar si no cambió.
+    """
+    seguimiento = SEGUIMIENTOS[model]
+    datos = {campo: getattr(instance, campo) for campo in campos(seguimiento) if '__' not in campo}
+    if model is DetalleOrden:
+        relacionados = (seguimiento.empresa, seguimiento.fecha)
+        if anterior is None or anterior.get('orden_mantenimiento_id') != instance.orden_mantenimiento_id:
+            orden = OrdenMantenimiento.objects.filter(pk=instance.orden_mantenimiento_id).values_list(
+                'empresa_id', 'fecha_registro').first()
+            if orden is None:
+                return None
+            anterior = dict(zip(relacionados, orden))
+        datos.update({campo: anterior[campo] for campo in relacionados})
+        datos['orden_mantenimiento_id'] = instance.orden_mantenimiento_id
+    return datos
+
+
+def recordar(model, instance):
+    """
+    Se llama antes de guardar una instancia para registrar su aporte anterior.
+    """
+    anterior = None
+    if instance.pk is not None:
+        valores = campos(SEGUIMIENTOS[model])
+        if model is DetalleOrden:
+            valores = valores + ['orden_mantenimiento_id']
+        anterior = model.objects.filter(pk=instance.pk).values(*valores).first()
+    instance._resumen_anterior = anterior
+
+
+def registrar_guardado(model, instance):
+    """
+    Se llama después de guardar una instancia, aplica la diferencia entre su
+    aporte anterior y el nuevo.
+    """
+    seguimiento = SEGUIMIENTOS[model]
+    anterior = getattr(instance, '_resumen_anterior', None)
+    cambios = Cambios()
+    cambios.sumar(seguimiento, anterior, -1)
+    cambios.sumar(seguimiento, datos_instancia(model, instance, anterior))
+    cambios.aplicar()
+
+
+def registrar_eliminado(model, instance):
+    cambios = Cambios()
+    cambios.sumar(SEGUIMIENTOS[model], datos_instancia(model, instance), -1)
+    cambios.aplicar()
+
+
+def registrar_creados(model, instances):
+    """
+    Registra las instancias insertadas con bulk_create, que no envía señales.
+    """
+    cambios = Cambios()
+    for instance in instances:
+        cambios.sumar(SEGUIMIENTOS[model], datos_instancia(model, instance))
+    cambios.aplicar()
+
+
+def registrar_actualizacion(model, fila, cambios_fila):
+    """
+    Registra una fila modificada con update(), fila tiene los valores
+    guardados y cambios_fila las columnas nuevas. Los modelos sin resumen se
+    ignoran.
+    """
+    seguimiento = SEGUIMIENTOS.get(model)
+    if seguimiento is None or not set(cambios_fila) & set(campos(seguimiento)):
+        return
+    cambios = Cambios()
+    cambios.sumar(seguimiento, fila, -1)
+    cambios.sumar(seguimiento, dict(fila, **cambios_fila))
+    cambios.aplicar()
+
+
+def agrupar(queryset):
+    """
+    Suma las filas del queryset por empresa, día y estado en una sola consulta.
+    """
+    seguimiento = SEGUIMIENTOS[queryset.model]
+    sumas = {seguimiento.monto: Sum(seguimiento.monto)}
+    if seguimiento.pagado:
+        sumas[seguimiento.pagado] = Sum(seguimiento.pagado)
+    return queryset.order_by().values(seguimiento.empresa, seguimiento.fecha, 'estado').annotate(
+        numero=Count('pk'), **{'suma_' + campo: suma for campo, suma in sumas.items()}).values(
+        seguimiento.empresa, seguimiento.fecha, 'estado', 'numero', *['suma_' + campo for campo in sumas])
+
+
+def sumar_grupos(cambios, seguimiento, grupos, signo=1, estado=None):
+    for grupo in grupos:
+        datos = dict(grupo)
+        for campo in (seguimiento.monto, seguimiento.pagado):
+            if campo:
+                datos[campo] = datos.pop('suma_' + campo)
+        if estado is not None:
+            datos['estado'] = estado
+        cambios.sumar(seguimiento, datos, signo, datos['numero'])
+
+
+def cambiar_estado(queryset, estado):
+    """
+    Cambia el estado de las filas del queryset con un solo UPDATE y mueve sus
+    cantidades y montos en el resumen. Devuelve el número de filas cambiadas.
+    """
+    seguimiento = SEGUIMIENTOS[queryset.model]
+    queryset = queryset.exclude(estado=estado)
+    grupos = list(agrupar(queryset))
+    actualizados = queryset.update(estado=estado)
+    cambios = Cambios()
+    sumar_grupos(cambios, seguimiento, grupos, -1)
+    sumar_grupos(cambios, seguimiento, grupos, 1, estado)
+    cambios.aplicar()
+    return actualizados
+
+
+def calcular():
+    """
+    Calcula el resumen completo desde las tablas de órdenes, detalles y
+    facturas, devuelve un diccionario por empresa, tipo, estado y fecha.
+    """
+    cambios = Cambios()
+    for model, seguimiento in SEGUIMIENTOS.items():
+        sumar_grupos(cambios, seguimiento, agrupar(model.objects.all()))
+    resumen = {}
+    for (empresa_id, tipo, estado, fecha), valores in cambios.valores.items():
+        resumen[(empresa_id, tipo, estado, fecha)] = tuple(valores)
+        total = resumen.get((empresa_id, tipo, estado, None), (0, CERO, CERO))
+        resumen[(empresa_id, tipo, estado, None)] = tuple(a + b for a, b in zip(total, valores))
+    return resumen
+
+
+def guardado():
+    return {(fila.empresa_id, fila.tipo, fila.estado, fila.fecha): (fila.cantidad, fila.monto, fila.saldo)
+            for fila in ResumenOperacion.objects.all()
+            if fila.cantidad or fila.monto or fila.saldo}
+
+
+def diferencias():
+    """
+    Filas del resumen que no coinciden con lo calculado desde las tablas,
+    como tuplas (clave, guardado, calculado).
+    """
+    calculado = calcular()
+    actual = guardado()
+    vacio = (0, CERO, CERO)
+    return [(clave, actual.get(clave, vacio), calculado.get(clave, vacio))
+            for clave in sorted(set(calculado) | set(actual), key=str)
+            if actual.get(clave, vacio) != calculado.get(clave, vacio)]
+
+
+def reconstruir():
+    """
+    Vuelve a generar todo el resumen desde las tablas de origen.
+    """
+    with transaction.atomic():
+        resumen = calcular()
+        ResumenOperacion.objects.all().delete()
+        ResumenOperacion.objects.bulk_create([
+            ResumenOperacion(empresa_id=empresa_id, tipo=tipo, estado=estado, fecha=fecha,
+                             cantidad=cantidad, monto=monto, saldo=saldo)
+            for (empresa_id, tipo, estado, fecha), (cantidad, monto, saldo) in resumen.items()
+        ], batch_size=TAMANIO_LOTE)
+    return len(resumen)
+
+
+def tablero(empresa_id, dias=DIAS, hoy=None):
+    """
+    Datos del tablero de la empresa: totales por estado de cada tipo y la
+    actividad de los últimos días. Lee solo filas del resumen, cuyo número no
+    depende del historial.
+    """
+    totales = {(fila.tipo, fila.estado): fila
+               for fila in ResumenOperacion.objects.filter(empresa_id=empresa_id, fecha__isnull=True)}
+    tipos = []
+    for seguimiento in SEGUIMIENTOS.values():
+        estados = []
+        for estado, nombre in seguimiento.estados:
+            fila = totales.get((seguimiento.tipo, estado))
+            estados.append({
+                'estado': estado,
+                'nombre': nombre,
+                'cantidad': fila.cantidad if fila else 0,
+                'monto': fila.monto if fila else CERO,
+                'saldo': fila.saldo if fila else CERO,
+            })
+        tipos.append({
+            'tipo': seguimiento.tipo,
+            'titulo': seguimiento.titulo,
+            'estados': estados,
+            'cantidad': sum(estado['cantidad'] for estado in estados),
+            'monto': sum((estado['monto'] for estado in estados), CERO),
+            'saldo': sum((estado['saldo'] for estado in estados), CERO),
+        })
+
+    desde = (hoy or date.today()) - timedelta(days=dias - 1)
+    actividad = OrderedDict()
+    filas = ResumenOperacion.objects.filter(
+        empresa_id=empresa_id, fecha__gte=desde, tipo__in=('ORDEN', 'FACTURA')).values(
+        'fecha', 'tipo').annotate(numero=Sum('cantidad'), suma=Sum('monto')).order_by('-fecha', 'tipo')
+    for fila in filas:
+        registro = actividad.setdefault(fila['fecha'], {'fecha': fila['fecha'], 'ordenes': 0, 'facturas': 0,
+                                                          'facturado': CERO})
+        if fila['tipo'] == 'ORDEN':
+            registro['ordenes'] = fila['numero']
+        else:
+            registro['facturas'] = fila['numero']
+            registro['facturado'] = fila['suma']
+    return {'tipos': tipos, 'actividad': list(actividad.values()), 'dias': dias}
@@ -0,0 +1,211 @@
+import csv
+import zipfile
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+
+from store.pdf_batch import SalidaZip
+
+TAMANIO_LOTE = getattr(settings, 'EXPORTACION_TAMANIO_LOTE', 2000)
+FILAS_POR_BLOQUE = 500
+FORMATOS = ('csv', 'xlsx')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+Columna = namedtuple('Columna', ('campo', 'titulo'))
+
+COLUMNAS = {
+    'FACTURA': OrderedDict((
+        ('id', Columna('id', 'Id')),
+        ('fecha_venta', Columna('fecha_venta', 'Fecha de venta')),
+        ('cliente_identificacion', Columna('cliente__numero_identificacion', 'Número de Identificación')),
+        ('cliente_nombre', Columna('cliente__nombre', 'Nombre')),
+        ('cliente_apellido', Columna('cliente__apellido', 'Apellido')),
+        ('cliente_correo', Columna('cliente__usuario__correo_electronico', 'Correo electrónico')),
+        ('estado', Columna('estado', 'Estado')),
+        ('subtotal', Columna('subtotal', 'SubTotal')),
+        ('impuesto', Columna('impuesto', 'Impuesto')),
+        ('total', Columna('total', 'Total')),
+        ('monto_pagado', Columna('monto_pagado', 'Monto Pagado')),
+    )),
+    'DETALLE_FACTURA': OrderedDict((
+        ('id', Columna('id', 'Id')),
+        ('factura', Columna('factura_id', 'Factura')),
+        ('fecha_venta', Columna('factura__fecha_venta', 'Fecha de venta')),
+        ('producto', Columna('producto__nombre', 'Producto')),
+        ('detalle', Columna('detalle', 'Detalle')),
+        ('cantidad', Columna('cantidad', 'Cantidad')),
+        ('precio_unitario', Columna('precio_unitario', 'Precio Unitario')),
+        ('impuesto', Columna('impuesto', 'Impuesto')),
+        ('total', Columna('total', 'Total')),
+    )),
+    'PAGO': OrderedDict((
+        ('id', Columna('id', 'Id')),
+        ('factura', Columna('factura_id', 'Factura')),
+        ('fecha_pago', Columna('fecha_pago', 'Fecha de pago')),
+        ('monto', Columna('monto', 'Monto')),
+        ('descripcion', Columna('descripcion', 'Descripción')),
+    )),
+    'ORDEN': OrderedDict((
+        ('id', Columna('id', 'Id')),
+        ('fecha_registro', Columna('fecha_registro', 'Fecha de registro')),
+        ('cliente_identificacion', Columna('cliente__numero_identificacion', 'Número de Identificación')),
+        ('cliente_nombre', Columna('cliente__nombre', 'Nombre')),
+        ('cliente_apellido', Columna('cliente__apellido', 'Apellido')),
+        ('descripcion', Columna('descripcion', 'Descripción')),
+        ('estado', Columna('estado', 'Estado')),
+        ('monto_servicio', Columna('monto_servicio', 'Monto')),
+    )),
+}
+
+
+class ColumnaInvalida(ValueError):
+    """
+    Se lanza cuando se pide una columna que no existe para el tipo exportado.
+    """
+
+
+def columnas_predeterminadas(tipo):
+    """
+    Columnas que se exportan si no se indican otras, se pueden configurar por
+    tipo con EXPORTACION_COLUMNAS.
+    """
+    configuradas = getattr(settings, 'EXPORTACION_COLUMNAS', {})
+    return list(configuradas.get(tipo, COLUMNAS[tipo].keys()))
+
+
+def elegir_columnas(tipo, nombres=None):
+    """
+    Devuelve las columnas indicadas en el orden pedido.
+    """
+    nombres = nombres or columnas_predeterminadas(tipo)
+    faltantes = [nombre for nombre in nombres if nombre not in COLUMNAS[tipo]]
+    if faltantes:
+        raise ColumnaInvalida('Columnas no disponibles: {}'.format(', '.join(faltantes)))
+    return [COLUMNAS[tipo][nombre] for nombre in nombres]
+
+
+def filas(queryset, columnas, ordenamiento=('id',)):
+    """
+    Recorre el queryset con un cursor del lado del servidor leyendo solo las
+    columnas exportadas, de modo que la memoria no depende del número de filas.
+    """
+    if not queryset.query.order_by:
+        queryset = queryset.order_by(*ordenamiento)
+    valores = queryset.values_list(*[columna.campo for columna in columnas])
+    return valores.iterator(chunk_size=TAMANIO_LOTE)
+
+
+def texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return str(valor)
+
+
+class Eco(object):
+    """
+    Archivo que devuelve lo escrito en lugar de guardarlo, para que csv.writer
+    genere cada fila como texto.
+    """
+
+    def write(self, valor):
+        return valor
+
+
+def escribir_csv(columnas, registros):
+    escritor = csv.writer(Eco())
+    yield '\ufeff' + escritor.writerow([columna.titulo for columna in columnas])
+    bloque = []
+    for registro in registros:
+        bloque.append(escritor.writerow([texto(valor) for valor in registro]))
+        if len(bloque) >= FILAS_POR_BLOQUE:
+            yield ''.join(bloque)
+            bloque = []
+    if bloque:
+        yield ''.join(bloque)
+
+
+XLSX_TIPOS_CONTENIDO = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>')
+XLSX_RELACIONES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>')
+XLSX_LIBRO = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+XLSX_LIBRO_RELACIONES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+    '</Relationships>')
+XLSX_HOJA_INICIO = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+XLSX_HOJA_FIN = '</sheetData></worksheet>'
+
+
+def celda(valor):
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        return '<c><v>{}</v></c>'.format(valor)
+    return '<c t="inlineStr"><is><t>{}</t></is></c>'.format(escape(texto(valor)))
+
+
+def fila_xlsx(valores):
+    return '<row>{}</row>'.format(''.join(celda(valor) for valor in valores))
+
+
+def escribir_xlsx(columnas, registros, hoja='Datos'):
+    """
+    Genera un libro de Excel por partes. La hoja se escribe fila a fila en el
+    ZIP, que se vacía cada cierto número de filas, sin armar el libro en memoria.
+    """
+    salida = SalidaZip()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as libro:
+        libro.writestr('[Content_Types].xml', XLSX_TIPOS_CONTENIDO)
+        libro.writestr('_rels/.rels', XLSX_RELACIONES)
+        libro.writestr('xl/workbook.xml', XLSX_LIBRO.format(escape(hoja)))
+        libro.writestr('xl/_rels/workbook.xml.rels', XLSX_LIBRO_RELACIONES)
+        with libro.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as archivo:
+            archivo.write((XLSX_HOJA_INICIO + fila_xlsx(columna.titulo for columna in columnas)).encode('utf-8'))
+            bloque = []
+            for registro in registros:
+                bloque.append(fila_xlsx(registro))
+                if len(bloque) >= FILAS_POR_BLOQUE:
+                    archivo.write(''.join(bloque).encode('utf-8'))
+                    bloque = []
+                    yield salida.vaciar()
+            archivo.write((''.join(bloque) + XLSX_HOJA_FIN).encode('utf-8'))
+        yield salida.vaciar()
+    yield salida.vaciar()
+
+
+def exportar(queryset, tipo, formato, nombres=None, ordenamiento=('id',)):
+    """
+    Devuelve el generador con el contenido del archivo exportado.
+    """
+    columnas = elegir_columnas(tipo, nombres)
+    registros = filas(queryset, columnas, ordenamiento)
+    if formato == 'xlsx':
+        return escribir_xlsx(columnas, registros)
+    return escribir_csv(columnas, registros)
@@ -0,0 +1,154 @@
+import math
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from store import catalog
+from store.models import DetalleFactura, MarcaAgregacion, Producto, PronosticoStock
+
+MARCA = 'PRONOSTICO'
+CACHE_REPORTE_KEY = 'pronostico:{}:{}'
+CACHE_TIMEOUT = getattr(settings, 'PRONOSTICO_CACHE_TIMEOUT', 24 * 60 * 60)
+TAMANIO_LOTE = 1000
+
+VENTANA = getattr(settings, 'PRONOSTICO_VENTANA', 90)
+VENTANA_MEDIA = getattr(settings, 'PRONOSTICO_VENTANA_MEDIA', 28)
+ALFA = getattr(settings, 'PRONOSTICO_ALFA', 0.2)
+# Días que tarda en llegar un pedido y días de venta que debe cubrir al llegar
+DIAS_REPOSICION = getattr(settings, 'PRONOSTICO_DIAS_REPOSICION', 14)
+DIAS_COBERTURA = getattr(settings, 'PRONOSTICO_DIAS_COBERTURA', 30)
+METODOS = ('media', 'exponencial')
+METODO = getattr(settings, 'PRONOSTICO_METODO', 'exponencial')
+# Por debajo de la tasa mínima o por encima de los días máximos el stock no se agota
+TASA_MINIMA = 0.001
+DIAS_MAXIMOS = 99999
+
+Pronostico = namedtuple('Pronostico', ('productos', 'cantidades', 'tasa_media', 'tasa_exponencial', 'dias',
+                                       'sugeridos', 'reponer'))
+FilaPronostico = namedtuple('FilaPronostico', ('producto_id', 'nombre', 'cantidad', 'tasa_media', 'tasa_exponencial',
+                                               'dias_hasta_agotar', 'cantidad_sugerida', 'reponer'))
+
+
+def series(productos, hasta, dias=VENTANA):
+    """
+    Matriz de unidades vendidas por producto y día en los días que terminan
+    en hasta, sumadas con una sola consulta agrupada. Las filas siguen el
+    orden de productos, que debe estar ordenado por id.
+    """
+    inicio = hasta - timedelta(days=dias - 1)
+    filas = list(DetalleFactura.objects.filter(
+        producto__isnull=False, factura__fecha_venta__gte=inicio, factura__fecha_venta__lte=hasta,
+    ).order_by().values('producto_id', 'factura__fecha_venta').annotate(unidades=Sum('cantidad')).values_list(
+        'producto_id', 'factura__fecha_venta', 'unidades'))
+    matriz = np.zeros((len(productos), dias), dtype=np.float64)
+    if not filas or not len(productos):
+        return matriz
+    ids, fechas, unidades = zip(*filas)
+    posiciones = np.searchsorted(productos, np.array(ids, dtype=np.int64))
+    columnas = (np.array(fechas, dtype='datetime64[D]') - np.datetime64(inicio, 'D')).astype(np.int64)
+    np.add.at(matriz, (posiciones, columnas), np.array(unidades, dtype=np.float64))
+    return matriz
+
+
+def pesos_exponenciales(dias, alfa=ALFA):
+    """
+    Pesos del suavizado exponencial simple sobre una serie de dias valores,
+    el primero sirve de valor inicial. Suman uno, así el suavizado de todas
+    las series es un solo producto de matriz por vector.
+    """
+    pesos = alfa * (1 - alfa) ** np.arange(dias - 1, -1, -1, dtype=np.float64)
+    pesos[0] = (1 - alfa) ** (dias - 1)
+    return pesos
+
+
+def tasa_media(matriz, ventana=VENTANA_MEDIA):
+    return matriz[:, -ventana:].mean(axis=1)
+
+
+def tasa_exponencial(matriz, alfa=ALFA):
+    return matriz @ pesos_exponenciales(matriz.shape[1], alfa)
+
+
+def calcular(hasta=None, metodo=METODO):
+    """
+    Ritmo de venta de todos los productos hasta el día indicado, por omisión
+    ayer, y los días que alcanza su stock. Se reponen los productos que se
+    agotan antes de que llegue un pedido, la cantidad sugerida cubre la
+    reposición y los días de cobertura.
+    """
+    hasta = hasta or timezone.localdate() - timedelta(days=1)
+    filas = list(Producto.objects.order_by('id').values_list('id', 'cantidad'))
+    productos = np.array([producto_id for producto_id, cantidad in filas], dtype=np.int64)
+    cantidades = np.array([cantidad for producto_id, cantidad in filas], dtype=np.float64)
+    matriz = series(productos, hasta)
+    media, exponencial = tasa_media(matriz), tasa_exponencial(matriz)
+    tasa = media if metodo == 'media' else exponencial
+    vende = tasa >= TASA_MINIMA
+    dias = np.divide(cantidades, tasa, out=np.full(len(tasa), np.inf), where=vende)
+    dias[dias > DIAS_MAXIMOS] = np.inf
+    objetivo = np.ceil(np.round(tasa * (DIAS_REPOSICION + DIAS_COBERTURA), 6))
+    sugeridos = np.where(vende, np.maximum(objetivo - cantidades, 0), 0).astype(np.int64)
+    return Pronostico(productos, cantidades.astype(np.int64), media, exponencial, dias, sugeridos,
+                      vende & (dias <= DIAS_REPOSICION))
+
+
+def decimal(valor, decimales):
+    if not math.isfinite(valor):
+        return None
+    return Decimal(str(round(float(valor), decimales)))
+
+
+def guardar(pronostico, fecha):
+    """
+    Reemplaza los pronósticos guardados y registra la fecha de cálculo.
+    """
+    with transaction.atomic():
+        PronosticoStock.objects.all().delete()
+        PronosticoStock.objects.bulk_create([
+            PronosticoStock(producto_id=int(producto_id), fecha=fecha, cantidad=int(cantidad),
+                            tasa_media=decimal(media, 3), tasa_exponencial=decimal(exponencial, 3),
+                            dias_hasta_agotar=decimal(dias, 1), cantidad_sugerida=int(sugerido),
+                            reponer=bool(reponer))
+            for producto_id, cantidad, media, exponencial, dias, sugerido, reponer in zip(*pronostico)
+        ], batch_size=TAMANIO_LOTE)
+        marca, creada = MarcaAgregacion.objects.get_or_create(nombre=MARCA)
+        marca.fecha_actualizacion = timezone.now()
+        marca.save()
+    return marca
+
+
+def actualizar(hasta=None, metodo=METODO):
+    hasta = hasta or timezone.localdate() - timedelta(days=1)
+    pronostico = calcular(hasta, metodo)
+    return pronostico, guardar(pronostico, hasta)
+
+
+def obtener_marca():
+    return MarcaAgregacion.objects.filter(nombre=MARCA).first()
+
+
+def reporte(marca=None):
+    """
+    Pronósticos guardados ordenados por urgencia, primero los que hay que
+    reponer. Se guardan en caché hasta el siguiente cálculo o hasta que
+    cambie el catálogo.
+    """
+    marca = marca or obtener_marca()
+    if marca is None:
+        return []
+    clave = CACHE_REPORTE_KEY.format(marca.fecha_actualizacion.timestamp(), catalog.obtener_version())
+    filas = cache.get(clave)
+    if filas is None:
+        filas = [FilaPronostico(*valores) for valores in PronosticoStock.objects.order_by(
+            '-reponer', F('dias_hasta_agotar').asc(nulls_last=True), 'producto_id').values_list(
+            'producto_id', 'producto__nombre', 'cantidad', 'tasa_media', 'tasa_exponencial',
+            'dias_hasta_agotar', 'cantidad_sugerida', 'reponer')]
+        cache.set(clave, filas, CACHE_TIMEOUT)
+    return filas
@@ -1,9 +1,30 @@
 from django import forms
 from store.models import Tecnico, OrdenMantenimiento, Cliente, DetalleOrden, RevisionTecnica, Factura, DetalleFactura, PagoFactura
 from django.forms import ModelForm
+from people import identification
+from store import workflow
 
 
-class TecnicoForm(ModelForm):
+class IdentificacionFormMixin(object):
+    """
+    Verifica el número de identificación cuando el documento es una cédula o
+    un RUC, los números mal formados se marcan como error del campo.
+    """
+
+    def clean_numero_identificacion(self):
+        numero = self.cleaned_data['numero_identificacion']
+        if self.cleaned_data.get('tipo_documento_identificacion') not in identification.DOCUMENTOS_NUMERICOS:
+            return numero
+        try:
+            valido = numero.isdigit() and identification.verificar(numero)
+        except identification.IdentificacionInvalida as e:
+            raise forms.ValidationError(str(e), code='identificacion_invalida')
+        if not valido:
+            raise forms.ValidationError('Número de Identificación incorrecto', code='identificacion_incorrecta')
+        return numero
+
+
+class TecnicoForm(IdentificacionFormMixin, ModelForm):
     correo_electronico = forms.EmailField(
         widget=forms.EmailInput(attrs={'class': 'form-control'}))
 
@@ -55,6 +76,11 @@ class DetalleOrdenForm(ModelForm):
             estado=forms.Select(attrs={'class': 'form-control'}),
         )
 
+    def clean_estado(self):
+        estado = self.cleaned_data['estado']
+        workflow.validar_detalle(self.instance.estado if self.instance.pk else None, estado)
+        return estado
+
 
 class OrdenMantenimientoConfirmarForm(ModelForm):
     """
@@ -65,7 +91,7 @@ class OrdenMantenimientoConfirmarForm(ModelForm):
         fields = ('id',)
 
 
-class ClienteForm(ModelForm):
+class ClienteForm(IdentificacionFormMixin, ModelForm):
     """
     Formulario personalizado para crear y editar un cliente.
     """
@@ -112,7 +138,7 @@ class GestionarRevisionTecnicaForm(ModelForm):
     ESTADO = (
         ('EN_REVISION', 'En revisión'),
         ('REVISADO', 'Revisado'),
-        ('Arregado', 'Arreglado'),
+        ('ARREGLADO', 'Arreglado'),
     )
     estado = forms.ChoiceField(
         choices=ESTADO,
@@ -183,3 +209,98 @@ class PagoFacturaForm(ModelForm):
                 attrs={'class': 'form-control', 'type': 'number', "step":"0.01"}),
             descripcion=forms.Textarea(attrs={'class': 'form-control'}),
         )
+
+
+class ExportacionPdfForm(forms.Form):
+    """
+    Filtros de la exportación de documentos en PDF.
+    """
+    FORMATO = (
+        ('zip', 'ZIP con un PDF por documento'),
+        ('pdf', 'Un solo PDF'),
+    )
+    desde = forms.DateField(required=False)
+    hasta = forms.DateField(required=False)
+    cliente = forms.IntegerField(required=False)
+    estado = forms.CharField(required=False, max_length=50)
+    formato = forms.ChoiceField(choices=FORMATO, required=False)
+
+    def clean_formato(self):
+        return self.cleaned_data['formato'] or 'zip'
+
+
+class ExportacionDatosForm(forms.Form):
+    """
+    Formato y columnas de la exportación de un listado.
+    """
+    FORMATO = (
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel'),
+    )
+    formato = forms.ChoiceField(choices=FORMATO, required=False)
+    columnas = forms.CharField(required=False)
+
+    def clean_formato(self):
+        return self.cleaned_data['formato'] or 'csv'
+
+    def clean_columnas(self):
+        return [columna.strip() for columna in self.cleaned_data['columnas'].split(',') if columna.strip()]
+
+
+class ReporteVentasForm(forms.Form):
+    """
+    Agrupación y rango de fechas del reporte de ventas.
+    """
+    PERIODO = (
+        ('dia', 'Día'),
+        ('mes', 'Mes'),
+        ('anio', 'Año'),
+    )
+    DIMENSION = (
+        ('', 'Total'),
+        ('producto', 'Producto'),
+        ('categoria', 'Categoría'),
+    )
+    FORMATO = (
+        ('html', 'Página'),
+        ('csv', 'CSV'),
+    )
+    periodo = forms.ChoiceField(choices=PERIODO, required=False)
+    dimension = forms.ChoiceField(choices=DIMENSION, required=False)
+    desde = forms.DateField(required=False)
+    hasta = forms.DateField(required=False)
+    formato = forms.ChoiceField(choices=FORMATO, required=False)
+
+    def clean_periodo(self):
+        return self.cleaned_data['periodo'] or 'mes'
+
+    def clean_dimension(self):
+        return self.cleaned_data['dimension'] or None
+
+    def clean_formato(self):
+        return self.cleaned_data['formato'] or 'html'
+
+
+class ReporteCarteraForm(forms.Form):
+    """
+    Fecha de corte y formato del reporte de cartera.
+    """
+    FORMATO = (
+        ('html', 'Página'),
+        ('csv', 'CSV'),
+        ('pdf', 'PDF'),
+    )
+    fecha = forms.DateField(required=False)
+    formato = forms.ChoiceField(choices=FORMATO, required=False)
+
+    def clean_formato(self):
+        return self.cleaned_data['formato'] or 'html'
+
+
+class ImportacionForm(forms.Form):
+    """
+    Archivo a importar desde el administrador.
+    """
+    archivo = forms.FileField(help_text='Archivo .csv o .json')
+    simulacion = forms.BooleanField(
+        required=False, initial=True, help_text='Valida el archivo sin guardar los cambios')
@@ -0,0 +1,152 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.db.models.fields.files import FieldFile
+from PIL import Image
+
+from store import catalog, jobs
+from store.models import Producto
+
+ANCHOS = tuple(getattr(settings, 'MINIATURAS_ANCHOS', (100, 200, 400)))
+FORMATOS = tuple(getattr(settings, 'MINIATURAS_FORMATOS', ('webp', 'jpeg')))
+CALIDAD = getattr(settings, 'MINIATURAS_CALIDAD', 80)
+DIRECTORIO = getattr(settings, 'MINIATURAS_DIRECTORIO', 'gallery/products/derivados')
+TRABAJADORES = getattr(settings, 'MINIATURAS_TRABAJADORES', 2)
+SINCRONO = getattr(settings, 'MINIATURAS_SINCRONO', False)
+EXTENSIONES = {'webp': 'webp', 'jpeg': 'jpg', 'png': 'png'}
+TIPOS = {'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+# Formatos que muestran todos los navegadores, sirven para la imagen de respaldo
+COMPATIBLES = ('jpeg', 'png')
+
+logger = logging.getLogger(__name__)
+campo_imagen = Producto._meta.get_field('image')
+
+
+def formato_respaldo(formatos):
+    """
+    Formato de la imagen de respaldo del elemento picture: el último de los
+    formatos configurados que todos los navegadores muestran, o el último
+    configurado si ninguno lo es.
+    """
+    compatibles = [formato for formato in formatos if formato in COMPATIBLES]
+    return (compatibles or list(formatos))[-1]
+
+
+FORMATO_RESPALDO = formato_respaldo(FORMATOS)
+
+
+def ruta_derivado(image_hash, ancho, formato):
+    """
+    El nombre del derivado depende del contenido de la imagen, por lo que
+    puede cachearse indefinidamente en el navegador.
+    """
+    return '{}/{}-{}w.{}'.format(DIRECTORIO, image_hash, ancho, EXTENSIONES[formato])
+
+
+def url_derivado(image_hash, ancho, formato):
+    return campo_imagen.storage.url(ruta_derivado(image_hash, ancho, formato))
+
+
+def srcset(image_hash, formato):
+    return ', '.join('{} {}w'.format(url_derivado(image_hash, ancho, formato), ancho) for ancho in ANCHOS)
+
+
+def miniatura(producto):
+    """
+    Devuelve la miniatura más pequeña como FieldFile para usarla igual que la
+    imagen original, o la imagen original si los derivados no están listos.
+    """
+    if producto.image and producto.image_hash:
+        return FieldFile(producto, campo_imagen, ruta_derivado(producto.image_hash, ANCHOS[0], FORMATO_RESPALDO))
+    return producto.image
+
+
+def redimensionar(imagen, ancho, formato):
+    """
+    Reduce la imagen al ancho indicado manteniendo la proporción, nunca la amplía.
+    """
+    if ancho < imagen.width:
+        alto = max(1, round(imagen.height * ancho / imagen.width))
+        imagen = imagen.resize((ancho, alto), Image.LANCZOS)
+    if formato == 'jpeg' and imagen.mode != 'RGB':
+        transparente = imagen.convert('RGBA')
+        imagen = Image.new('RGB', transparente.size, (255, 255, 255))
+        imagen.paste(transparente, mask=transparente.split()[3])
+    elif imagen.mode not in ('RGB', 'RGBA'):
+        imagen = imagen.convert('RGBA')
+    salida = BytesIO()
+    imagen.save(salida, formato.upper(), quality=CALIDAD)
+    return salida.getvalue()
+
+
+def generar_derivados(producto_id):
+    """
+    Genera las miniaturas de la imagen del producto en todos los anchos y
+    formatos configurados y guarda el hash de la imagen cuando terminan.
+    Devuelve el hash o None si el producto no tiene imagen.
+    """
+    producto = Producto.objects.filter(pk=producto_id).only('id', 'image', 'image_hash', 'categoria_id').first()
+    if producto is None or not producto.image:
+        return None
+    nombre = producto.image.name
+    with producto.image.open('rb') as archivo:
+        contenido = archivo.read()
+    image_hash = hashlib.sha256(contenido).hexdigest()
+    imagen = Image.open(BytesIO(contenido))
+    imagen.load()
+    storage = campo_imagen.storage
+    for ancho in ANCHOS:
+        for formato in FORMATOS:
+            ruta = ruta_derivado(image_hash, ancho, formato)
+            if not storage.exists(ruta):
+                storage.save(ruta, ContentFile(redimensionar(imagen, ancho, formato)))
+    actualizados = Producto.objects.filter(pk=producto_id, image=nombre).exclude(
+        image_hash=image_hash).update(image_hash=image_hash)
+    if actualizados:
+        catalog.invalidar_catalogo(producto.categoria_id)
+    return image_hash
+
+
+def ejecutar(producto_id):
+    try:
+        return generar_derivados(producto_id)
+    except Exception:
+        logger.exception('No se pudieron generar las miniaturas del producto %s', producto_id)
+    finally:
+        connections.close_all()
+
+
+def clave_trabajo(producto_id, imagen):
+    """
+    Cada imagen tiene su propio trabajo, así una imagen nueva no se descarta
+    por haber en curso un trabajo con la anterior.
+    """
+    return 'MINIATURAS:{}:{}'.format(producto_id, hashlib.sha1(imagen.encode()).hexdigest()[:16])
+
+
+def programar(producto_id, imagen=''):
+    """
+    Encola la generación de miniaturas del producto como un trabajo que
+    atiende store.jobs.procesar, fuera del proceso web.
+    """
+    if SINCRONO:
+        return generar_derivados(producto_id)
+    return jobs.solicitar('MINIATURAS', producto_id, None, clave=clave_trabajo(producto_id, imagen))
+
+
+def generar_trabajo(trabajo):
+    generar_derivados(trabajo.objeto_id)
+
+
+def generar_lote(ids, trabajadores=TRABAJADORES):
+    """
+    Genera las miniaturas de varios productos en paralelo y devuelve cuántos
+    productos se procesaron.
+    """
+    with ThreadPoolExecutor(max_workers=trabajadores) as pool:
+        return sum(1 for image_hash in pool.map(ejecutar, ids) if image_hash)
@@ -0,0 +1,502 @@
+import csv
+import hashlib
+import io
+import json
+import os
+from collections import Counter, defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models.functions import Lower
+
+from people import credentials
+from people.identification import DOCUMENTOS_NUMERICOS, verificar_lote
+from people.models import Persona, Usuario
+from store import catalog, jobs, search, stock
+from store.models import Categoria, Cliente, Compra, DetalleCompra, Producto, Proveedor, TrabajoPdf
+
+TAMANIO_LOTE = getattr(settings, 'IMPORTACION_TAMANIO_LOTE', 1000)
+FORMATOS = ('csv', 'json')
+# Errores que se guardan en el resumen de una importación en segundo plano
+MAX_ERRORES = getattr(settings, 'IMPORTACION_MAX_ERRORES', 500)
+CACHE_AVANCE_KEY = 'importacion:avance:{}'
+
+
+class ErrorFila(ValueError):
+    """
+    Se lanza cuando una fila del archivo no se puede importar.
+    """
+
+
+class ArchivoInvalido(ValueError):
+    """
+    Se lanza cuando el archivo no tiene un formato que se pueda leer.
+    """
+
+
+class Resultado(object):
+    """
+    Resumen de una importación: filas leídas, objetos creados y errores por fila.
+    """
+
+    def __init__(self, tipo, simulacion=False):
+        self.tipo = tipo
+        self.simulacion = simulacion
+        self.filas = 0
+        self.creados = Counter()
+        self.errores = []
+        self.errores_omitidos = 0
+
+    @property
+    def valido(self):
+        return not self.errores
+
+    @property
+    def cantidad_errores(self):
+        return len(self.errores) + self.errores_omitidos
+
+    def resumen(self, maximo_errores):
+        return {'tipo': self.tipo, 'simulacion': self.simulacion, 'filas': self.filas, 'creados': self.creados,
+                'errores': self.errores[:maximo_errores], 'cantidad_errores': self.cantidad_errores}
+
+    @classmethod
+    def desde_resumen(cls, datos):
+        resultado = cls(datos['tipo'], datos['simulacion'])
+        resultado.filas = datos['filas']
+        resultado.creados.update(datos['creados'])
+        resultado.errores = [tuple(error) for error in datos['errores']]
+        resultado.errores_omitidos = datos['cantidad_errores'] - len(resultado.errores)
+        return resultado
+
+    def agregar_error(self, numero, mensaje):
+        self.errores.append((numero, mensaje))
+
+    def escribir_errores(self, archivo):
+        escritor = csv.writer(archivo)
+        escritor.writerow(['fila', 'error'])
+        escritor.writerows(self.errores)
+
+
+def detectar_formato(nombre):
+    formato = os.path.splitext(nombre or '')[1].lstrip('.').lower()
+    if formato not in FORMATOS:
+        raise ArchivoInvalido('Formato no soportado, use un archivo .csv o .json')
+    return formato
+
+
+def leer_archivo(archivo, formato=None):
+    """
+    Devuelve las filas del archivo como tuplas (número de fila, diccionario).
+    En los CSV el número es la línea del archivo, en los JSON la posición en
+    la lista empezando en 1.
+    """
+    formato = formato or detectar_formato(getattr(archivo, 'name', None))
+    if formato == 'json':
+        try:
+            filas = json.load(io.TextIOWrapper(archivo, encoding='utf-8-sig'))
+        except ValueError as e:
+            raise ArchivoInvalido('JSON inválido: {}'.format(e))
+        if not isinstance(filas, list) or not all(isinstance(fila, dict) for fila in filas):
+            raise ArchivoInvalido('El JSON debe ser una lista de objetos')
+        return enumerate(filas, start=1)
+    lector = csv.DictReader(io.TextIOWrapper(archivo, encoding='utf-8-sig', newline=''))
+    return ((lector.line_num, fila) for fila in lector)
+
+
+def lotes(filas, tamanio=None):
+    tamanio = tamanio or TAMANIO_LOTE
+    filas = iter(filas)
+    lote = list(islice(filas, tamanio))
+    while lote:
+        yield lote
+        lote = list(islice(filas, tamanio))
+
+
+def valor(fila, campo):
+    dato = fila.get(campo)
+    if isinstance(dato, str):
+        dato = dato.strip()
+    return dato
+
+
+def limpiar(model, campo, dato):
+    """
+    Convierte y valida el valor con el campo del modelo. Los valores vacíos
+    toman el valor por defecto del campo.
+    """
+    field = model._meta.get_field(campo)
+    if dato is None or dato == '':
+        if field.has_default():
+            return field.to_python(field.get_default())
+        if field.null:
+            return None
+        raise ErrorFila('{}: este campo es obligatorio'.format(campo))
+    try:
+        return field.clean(dato, None)
+    except ValidationError as e:
+        raise ErrorFila('{}: {}'.format(campo, ' '.join(e.messages)))
+
+
+def limpiar_campos(model, fila, campos):
+    return {campo: limpiar(model, campo, valor(fila, campo)) for campo in campos}
+
+
+def clave(texto):
+    return (texto or '').strip().lower()
+
+
+def insertar(model, objetos):
+    """
+    Inserta los objetos y los devuelve con su id. Si el motor no devuelve los
+    ids en un bulk_create se insertan uno por uno.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objetos, batch_size=TAMANIO_LOTE)
+    for objeto in objetos:
+        objeto.save(force_insert=True)
+    return objetos
+
+
+class Importador(object):
+    """
+    Base de los importadores. validar recibe un lote de filas y devuelve los
+    datos de las válidas, guardar escribe esos datos en bloque y terminar
+    aplica lo que debe hacerse una sola vez al final de la importación.
+    """
+    tipo = None
+
+    def validar(self, lote, resultado):
+        validos = []
+        for numero, fila in lote:
+            try:
+                validos.append(self.validar_fila(fila))
+            except ErrorFila as e:
+                resultado.agregar_error(numero, str(e))
+        return validos
+
+    def validar_fila(self, fila):
+        raise NotImplementedError
+
+    def guardar(self, validos, resultado):
+        raise NotImplementedError
+
+    def terminar(self, resultado):
+        pass
+
+
+class ImportadorProductos(Importador):
+    """
+    Columnas: nombre, categoria (nombre de la categoría), precio, impuesto_iva
+    y descripcion. El stock no se importa, se obtiene de las compras.
+    """
+    tipo = 'PRODUCTO'
+    campos = ('nombre', 'precio', 'impuesto_iva', 'descripcion')
+
+    def __init__(self):
+        self.categorias = {clave(nombre): categoria_id
+                           for categoria_id, nombre in Categoria.objects.values_list('id', 'nombre')}
+        self.vistos = set()
+        self.categorias_modificadas = set()
+
+    def validar(self, lote, resultado):
+        nombres = [valor(fila, 'nombre') for numero, fila in lote if valor(fila, 'nombre')]
+        self.existentes = set(Producto.objects.filter(nombre__in=nombres).values_list('nombre', flat=True))
+        return super(ImportadorProductos, self).validar(lote, resultado)
+
+    def validar_fila(self, fila):
+        datos = limpiar_campos(Producto, fila, self.campos)
+        nombre = datos['nombre']
+        if nombre in self.existentes or nombre in self.vistos:
+            raise ErrorFila('nombre: ya existe un producto con este nombre')
+        categoria_id = self.categorias.get(clave(valor(fila, 'categoria')))
+        if categoria_id is None:
+            raise ErrorFila('categoria: no existe la categoría "{}"'.format(valor(fila, 'categoria') or ''))
+        self.vistos.add(nombre)
+        datos['categoria_id'] = categoria_id
+        return datos
+
+    def guardar(self, validos, resultado):
+        Producto.objects.bulk_create([Producto(**datos) for datos in validos], batch_size=TAMANIO_LOTE)
+        self.categorias_modificadas.update(datos['categoria_id'] for datos in validos)
+        resultado.creados['productos'] += len(validos)
+
+    def terminar(self, resultado):
+        if self.categorias_modificadas:
+            catalog.invalidar_catalogo(*self.categorias_modificadas)
+
+
+class ImportadorClientes(Importador):
+    """
+    Columnas: nombre, apellido, numero_identificacion,
+    tipo_documento_identificacion y opcionalmente correo_electronico y
+    nombre_de_usuario para crear el usuario del cliente, con el número de
+    identificación como contraseña inicial igual que al crearlo en el sistema.
+    """
+    tipo = 'CLIENTE'
+    campos = ('nombre', 'apellido', 'numero_identificacion', 'tipo_documento_identificacion')
+
+    def __init__(self):
+        self.identificaciones = set()
+        self.correos = set()
+        self.usuarios = set()
+        self.cuentas = []
+
+    def validar(self, lote, resultado):
+        """
+        Las identificaciones, correos y nombres de usuario del lote se verifican
+        contra la base de datos con una consulta por columna, y las cédulas y
+        RUC del lote juntas con people.identification.verificar_lote.
+        """
+        columnas = defaultdict(list)
+        for numero, fila in lote:
+            for campo in ('numero_identificacion', 'correo_electronico', 'nombre_de_usuario'):
+                if valor(fila, campo):
+                    columnas[campo].append(valor(fila, campo))
+        self.identificaciones_existentes = set(Cliente.objects.filter(
+            numero_identificacion__in=columnas['numero_identificacion']).values_list(
+            'numero_identificacion', flat=True))
+        self.correos_existentes = set(Usuario.objects.annotate(correo=Lower('correo_electronico')).filter(
+            correo__in=[clave(correo) for correo in columnas['correo_electronico']]).values_list('correo', flat=True))
+        self.identificaciones_validas = verificar_lote([
+            valor(fila, 'numero_identificacion') or '' for numero, fila in lote
+            if valor(fila, 'tipo_documento_identificacion') in DOCUMENTOS_NUMERICOS])
+        self.usuarios_existentes = set(Usuario.objects.filter(
+            nombre_de_usuario__in=columnas['nombre_de_usuario'] + columnas['correo_electronico']).values_list(
+            'nombre_de_usuario', flat=True))
+        return super(ImportadorClientes, self).validar(lote, resultado)
+
+    def verificar_identificacion(self, datos):
+        numero = datos['numero_identificacion']
+        if (datos['tipo_documento_identificacion'] in DOCUMENTOS_NUMERICOS
+                and not self.identificaciones_validas.get(numero)):
+            raise ErrorFila('numero_identificacion: número de identificación incorrecto')
+        if numero in self.identificaciones_existentes or numero in self.identificaciones:
+            raise ErrorFila('numero_identificacion: ya existe un cliente con esta identificación')
+
+    def validar_fila(self, fila):
+        datos = limpiar_campos(Persona, fila, self.campos)
+        self.verificar_identificacion(datos)
+        usuario = None
+        if valor(fila, 'correo_electronico'):
+            usuario = {'correo_electronico': limpiar(Usuario, 'correo_electronico', valor(fila, 'correo_electronico'))}
+            usuario['nombre_de_usuario'] = limpiar(
+                Usuario, 'nombre_de_usuario', valor(fila, 'nombre_de_usuario') or usuario['correo_electronico'])
+            correo = clave(usuario['correo_electronico'])
+            if correo in self.correos_existentes or correo in self.correos:
+                raise ErrorFila('correo_electronico: ya existe un usuario con este correo')
+            nombre_usuario = usuario['nombre_de_usuario']
+            if nombre_usuario in self.usuarios_existentes or nombre_usuario in self.usuarios:
+                raise ErrorFila('nombre_de_usuario: ya existe un usuario con este nombre')
+            self.correos.add(correo)
+            self.usuarios.add(nombre_usuario)
+        self.identificaciones.add(datos['numero_identificacion'])
+        return datos, usuario
+
+    def crear_clientes(self, validos):
+        """
+        Los clientes heredan de Persona y Django no permite crearlos con
+        bulk_create, por eso se insertan las personas en bloque y luego las
+        filas de la tabla de clientes. Si el motor no devuelve los ids se
+        guardan uno por uno.
+        """
+        if not connection.features.can_return_rows_from_bulk_insert:
+            clientes = [Cliente(**datos) for datos, usuario in validos]
+            for cliente in clientes:
+                cliente.save()
+            return clientes
+        personas = Persona.objects.bulk_create([Persona(**datos) for datos, usuario in validos],
+                                               batch_size=TAMANIO_LOTE)
+        sql = 'INSERT INTO {} ({}) VALUES (%s)'.format(
+            connection.ops.quote_name(Cliente._meta.db_table),
+            connection.ops.quote_name(Cliente._meta.pk.column))
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [(persona.id,) for persona in personas])
+        search.indexar_clientes([persona.id for persona in personas])
+        return personas
+
+    def guardar(self, validos, resultado):
+        personas = self.crear_clientes(validos)
+        self.cuentas.extend((persona.id, datos['numero_identificacion'], usuario['correo_electronico'],
+                             usuario['nombre_de_usuario'])
+                            for persona, (datos, usuario) in zip(personas, validos) if usuario)
+        resultado.creados['clientes'] += len(personas)
+
+    def terminar(self, resultado):
+        """
+        Los usuarios se crean al final para calcular todas las contraseñas en
+        un solo pool de procesos, en una simulación no se calculan.
+        """
+        resultado.creados['usuarios'] += credentials.crear_usuarios(
+            self.cuentas, 'CLIENTE', simulacion=resultado.simulacion)
+
+
+class ImportadorCompras(Importador):
+    """
+    Columnas: compra (referencia que agrupa las líneas de una misma compra),
+    fecha_compra, proveedor (nombre), estado, producto (nombre), cantidad,
+    precio_unitario, impuesto y detalle. Los datos de la compra se toman de
+    la primera línea de cada referencia.
+    """
+    tipo = 'COMPRA'
+    campos_compra = ('fecha_compra', 'estado')
+    campos_detalle = ('detalle', 'cantidad', 'precio_unitario', 'impuesto')
+
+    def __init__(self):
+        self.proveedores = {clave(nombre): proveedor_id
+                            for proveedor_id, nombre in Proveedor.objects.values_list('id', 'nombre')}
+        self.compras = {}
+        self.cantidades = defaultdict(int)
+
+    def validar(self, lote, resultado):
+        nombres = {valor(fila, 'producto') for numero, fila in lote if valor(fila, 'producto')}
+        self.productos = defaultdict(list)
+        for producto_id, nombre in Producto.objects.filter(nombre__in=nombres).values_list('id', 'nombre'):
+            self.productos[nombre].append(producto_id)
+        return super(ImportadorCompras, self).validar(lote, resultado)
+
+    def validar_fila(self, fila):
+        referencia = valor(fila, 'compra')
+        if not referencia:
+            raise ErrorFila('compra: este campo es obligatorio')
+        compra = None
+        if referencia not in self.compras:
+            compra = limpiar_campos(Compra, fila, self.campos_compra)
+            compra['proveedor_id'] = self.proveedores.get(clave(valor(fila, 'proveedor')))
+            if compra['proveedor_id'] is None:
+                raise ErrorFila('proveedor: no existe el proveedor "{}"'.format(valor(fila, 'proveedor') or ''))
+            compra['subtotal'] = compra['impuesto'] = Decimal('0.00')
+        detalle = limpiar_campos(DetalleCompra, fila, self.campos_detalle)
+        productos = self.productos.get(valor(fila, 'producto'), [])
+        if len(productos) != 1:
+            raise ErrorFila('producto: {} el producto "{}"'.format(
+                'hay más de un producto con el nombre de' if productos else 'no existe',
+                valor(fila, 'producto') or ''))
+        detalle['producto_id'] = productos[0]
+        if compra is not None:
+            self.compras[referencia] = Compra(**compra)
+        return referencia, detalle
+
+    def guardar(self, validos, resultado):
+        """
+        Crea las compras nuevas del lote y sus líneas. El stock no se mueve
+        línea por línea, las cantidades se acumulan y se aplican al terminar.
+        """
+        nuevas = [self.compras[referencia] for referencia in dict.fromkeys(
+            referencia for referencia, detalle in validos) if self.compras[referencia].pk is None]
+        detalles = []
+        for referencia, datos in validos:
+            detalle = DetalleCompra(**datos)
+            detalle.calcular_total()
+            compra = self.compras[referencia]
+            compra.subtotal += detalle.total
+            compra.impuesto += detalle.impuesto
+            compra.calcular_total()
+            detalles.append((compra, detalle))
+            self.cantidades[detalle.producto_id] += detalle.cantidad
+        insertar(Compra, nuevas)
+        for compra, detalle in detalles:
+            detalle.compra_id = compra.id
+        DetalleCompra.objects.bulk_create([detalle for compra, detalle in detalles], batch_size=TAMANIO_LOTE)
+        resultado.creados['compras'] += len(nuevas)
+        resultado.creados['detalles'] += len(detalles)
+
+    def terminar(self, resultado):
+        """
+        Guarda los totales de las compras, que pueden haber recibido líneas en
+        varios lotes, y suma el stock con un UPDATE por producto.
+        """
+        Compra.objects.bulk_update(list(self.compras.values()), ('subtotal', 'impuesto', 'total'),
+                                   batch_size=TAMANIO_LOTE)
+        stock.ajustar_lote(self.cantidades)
+
+
+IMPORTADORES = {
+    'PRODUCTO': ImportadorProductos,
+    'CLIENTE': ImportadorClientes,
+    'COMPRA': ImportadorCompras,
+}
+
+
+def importar(tipo, filas, simulacion=False, al_avanzar=None):
+    """
+    Importa las filas por lotes en una sola transacción. Si alguna fila tiene
+    errores se siguen validando las demás para reportarlas todas, pero no se
+    guarda nada. En modo simulación se hace todo el trabajo y se revierte.
+    """
+    importador = IMPORTADORES[tipo]()
+    resultado = Resultado(tipo, simulacion)
+    with transaction.atomic():
+        for lote in lotes(filas):
+            resultado.filas += len(lote)
+            validos = importador.validar(lote, resultado)
+            if resultado.valido:
+                importador.guardar(validos, resultado)
+            if al_avanzar is not None:
+                al_avanzar(resultado)
+        if resultado.valido:
+            importador.terminar(resultado)
+        if simulacion or not resultado.valido:
+            transaction.set_rollback(True)
+    return resultado
+
+
+def importar_archivo(tipo, archivo, formato=None, simulacion=False, al_avanzar=None):
+    return importar(tipo, leer_archivo(archivo, formato), simulacion, al_avanzar)
+
+
+def solicitar(tipo, archivo, simulacion, usuario):
+    """
+    Encola la importación de un archivo subido. El mismo archivo enviado otra
+    vez por el usuario mientras se importa devuelve el trabajo en curso.
+    """
+    formato = detectar_formato(archivo.name)
+    huella = hashlib.sha1()
+    for parte in archivo.chunks():
+        huella.update(parte)
+    clave = 'IMPORTACION:{}:{}:{}:{}'.format(tipo, usuario.pk, int(simulacion), huella.hexdigest()[:16])
+    parametros = json.dumps({'tipo': tipo, 'formato': formato, 'simulacion': simulacion}, sort_keys=True)
+    return jobs.solicitar('IMPORTACION', 0, usuario, clave=clave, parametros=parametros, archivo=archivo)
+
+
+def guardar_avance(trabajo_id, filas):
+    """
+    Guarda las filas leídas en la caché compartida y no en el trabajo, la
+    importación corre dentro de una transacción y un UPDATE del trabajo no se
+    vería hasta confirmarla, ni sobreviviría a una simulación.
+    """
+    cache.set(CACHE_AVANCE_KEY.format(trabajo_id), filas, int(jobs.TIEMPO_MAXIMO.total_seconds()))
+
+
+def avance(trabajo):
+    """
+    Filas leídas de un trabajo de importación, mientras se importa se leen de la caché.
+    """
+    if trabajo.estado == 'EN_PROCESO':
+        return cache.get(CACHE_AVANCE_KEY.format(trabajo.pk), trabajo.hechos)
+    return trabajo.hechos
+
+
+def generar_trabajo(trabajo):
+    """
+    Importa el archivo de un trabajo, el avance son las filas leídas y el
+    resumen queda en el trabajo. El archivo subido se elimina al terminar.
+    """
+    parametros = json.loads(trabajo.parametros)
+
+    def al_avanzar(resultado):
+        guardar_avance(trabajo.pk, resultado.filas)
+
+    try:
+        with trabajo.archivo.open('rb') as archivo:
+            resultado = importar_archivo(parametros['tipo'], archivo, parametros['formato'],
+                                         parametros['simulacion'], al_avanzar)
+    finally:
+        trabajo.archivo.delete(save=False)
+        cache.delete(CACHE_AVANCE_KEY.format(trabajo.pk))
+    TrabajoPdf.objects.filter(pk=trabajo.pk).update(hechos=resultado.filas)
+    trabajo.resultado = json.dumps(resultado.resumen(MAX_ERRORES))
+    return None
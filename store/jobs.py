@@ -0,0 +1,176 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from store import pdf, pdf_cache
+from store.models import TrabajoPdf
+
+TRABAJADORES = getattr(settings, 'PDF_TRABAJADORES', 2)
+TIEMPO_MAXIMO = timedelta(seconds=getattr(settings, 'PDF_TIEMPO_MAXIMO', 300))
+RETENCION = timedelta(seconds=getattr(settings, 'PDF_RETENCION', 60 * 60 * 24))
+INTERVALO = getattr(settings, 'PDF_INTERVALO', 1)
+INTERVALO_LIMPIEZA = 60
+EN_CURSO = ('PENDIENTE', 'EN_PROCESO')
+
+logger = logging.getLogger(__name__)
+
+
+def clave_trabajo(tipo, objeto_id, usuario_id):
+    return '{}:{}:{}'.format(tipo, objeto_id, usuario_id or 0)
+
+
+def solicitar(tipo, objeto_id, usuario, clave=None, parametros='', nombre_archivo='', archivo=None):
+    """
+    Encola un trabajo, por omisión la generación del PDF del documento. Si ya
+    hay un trabajo con la misma clave en curso se devuelve ese trabajo en
+    lugar de crear otro. La restricción única sobre los trabajos en curso
+    resuelve dos solicitudes simultáneas: la que pierde toma el trabajo de
+    la otra. El archivo, si se indica, es la entrada del trabajo y se guarda
+    antes de encolarlo.
+    """
+    clave = clave or clave_trabajo(tipo, objeto_id, usuario.pk if usuario else None)
+    en_curso = TrabajoPdf.objects.filter(clave=clave, estado__in=EN_CURSO)
+    trabajo = en_curso.first()
+    if trabajo is None:
+        try:
+            with transaction.atomic():
+                trabajo = TrabajoPdf.objects.create(tipo=tipo, objeto_id=objeto_id, clave=clave, usuario=usuario,
+                                                    parametros=parametros, nombre_archivo=nombre_archivo,
+                                                    archivo=archivo)
+        except IntegrityError:
+            trabajo = en_curso.get()
+    return trabajo
+
+
+def tomar(trabajo_id):
+    """
+    Marca el trabajo como en proceso solo si sigue pendiente, de modo que dos
+    procesos nunca generan el mismo trabajo.
+    """
+    return TrabajoPdf.objects.filter(pk=trabajo_id, estado='PENDIENTE').update(
+        estado='EN_PROCESO', fecha_inicio=timezone.now()) == 1
+
+
+def generar_archivado(tipo, objeto):
+    """
+    Genera el PDF de un documento final y lo guarda en la caché de PDF, si ya
+    existe no se vuelve a generar.
+    """
+    html = pdf.renderizar_html(tipo, objeto, None, archivado=True)
+    clave = pdf_cache.calcular_clave(html)
+    if pdf_cache.obtener(tipo, objeto.pk, clave) is None:
+        pdf_cache.guardar(tipo, objeto.pk, clave, pdf.convertir_pdf(html))
+    return clave
+
+
+def generar_documento(trabajo):
+    """
+    Genera el PDF de un documento, los documentos finales se guardan en la
+    caché de PDF en lugar del trabajo.
+    """
+    documento = pdf.DOCUMENTOS[trabajo.tipo]
+    objeto = documento.model.objects.get(pk=trabajo.objeto_id)
+    if pdf_cache.es_final(trabajo.tipo, objeto):
+        generar_archivado(trabajo.tipo, objeto)
+        return None
+    return documento.nombre_archivo, pdf.renderizar_pdf(trabajo.tipo, objeto, trabajo.usuario)
+
+
+def tareas():
+    """
+    Funciones que ejecutan los trabajos que no son documentos PDF, reciben el
+    trabajo y devuelven (nombre, contenido) del archivo generado o None, el
+    contenido son bytes o un File. Se importan aquí porque esos módulos
+    encolan sus trabajos con este.
+    """
+    from store import images, importer, pdf_batch, receivables
+    return {
+        'MINIATURAS': images.generar_trabajo,
+        'CARTERA': receivables.generar_trabajo,
+        'IMPORTACION': importer.generar_trabajo,
+        'EXPORTACION_FACTURA': pdf_batch.generar_trabajo,
+        'EXPORTACION_ORDEN': pdf_batch.generar_trabajo,
+    }
+
+
+def generar(trabajo_id):
+    """
+    Ejecuta un trabajo y guarda el archivo que genera. Se ejecuta en los
+    procesos del pool.
+    """
+    trabajo = TrabajoPdf.objects.select_related('usuario').get(pk=trabajo_id)
+    try:
+        resultado = tareas().get(trabajo.tipo, generar_documento)(trabajo)
+        if resultado is not None:
+            nombre, contenido = resultado
+            trabajo.archivo.save(nombre, contenido if isinstance(contenido, File) else ContentFile(contenido),
+                                 save=False)
+        trabajo.estado = 'TERMINADO'
+    except Exception as e:
+        logger.exception('No se pudo completar el trabajo %s', trabajo_id)
+        trabajo.estado = 'ERROR'
+        trabajo.error = str(e)
+    trabajo.fecha_fin = timezone.now()
+    trabajo.save(update_fields=['archivo', 'resultado', 'estado', 'error', 'fecha_fin'])
+    return trabajo.estado
+
+
+def recuperar_abandonados(excluir=()):
+    """
+    Vuelve a encolar los trabajos que quedaron en proceso más tiempo del
+    permitido, por ejemplo si el proceso que los generaba terminó.
+    """
+    return TrabajoPdf.objects.filter(
+        estado='EN_PROCESO', fecha_inicio__lt=timezone.now() - TIEMPO_MAXIMO).exclude(
+        pk__in=list(excluir)).update(estado='PENDIENTE')
+
+
+def limpiar():
+    """
+    Elimina los trabajos terminados hace más tiempo del configurado junto con sus archivos.
+    """
+    trabajos = TrabajoPdf.objects.filter(fecha_fin__lt=timezone.now() - RETENCION)
+    for trabajo in trabajos.exclude(archivo='').only('id', 'archivo'):
+        trabajo.archivo.delete(save=False)
+    return trabajos.delete()[0]
+
+
+def inicializar_proceso():
+    connections.close_all()
+
+
+def procesar(trabajadores=TRABAJADORES, continuo=True):
+    """
+    Atiende la cola de trabajos ejecutándolos en un pool de procesos. El
+    tamaño del pool limita cuántos trabajos se ejecutan a la vez.
+    """
+    connections.close_all()
+    en_curso = {}
+    ultima_limpieza = 0
+    with ProcessPoolExecutor(max_workers=trabajadores, initializer=inicializar_proceso) as pool:
+        while True:
+            for trabajo_id, futuro in list(en_curso.items()):
+                if futuro.done():
+                    del en_curso[trabajo_id]
+                    if futuro.exception() is not None:
+                        TrabajoPdf.objects.filter(pk=trabajo_id).update(
+                            estado='ERROR', error=str(futuro.exception()), fecha_fin=timezone.now())
+            recuperar_abandonados(en_curso)
+            libres = trabajadores - len(en_curso)
+            pendientes = list(TrabajoPdf.objects.filter(estado='PENDIENTE').order_by('id').values_list(
+                'id', flat=True)[:libres]) if libres else []
+            for trabajo_id in pendientes:
+                if tomar(trabajo_id):
+                    en_curso[trabajo_id] = pool.submit(generar, trabajo_id)
+            if not continuo and not en_curso and not pendientes:
+                return
+            if time.monotonic() - ultima_limpieza > INTERVALO_LIMPIEZA:
+                limpiar()
+                ultima_limpieza = time.monotonic()
+            time.sleep(INTERVALO if not pendientes else 0)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from store import analytics
+
+
+class Command(BaseCommand):
+    help = 'Suma en la tabla de ventas diarias los días con facturas modificadas desde la última ejecución'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--completo', action='store_true',
+            help='Vuelve a sumar todo el historial de ventas en lugar de solo los días modificados')
+
+    def handle(self, *args, **options):
+        dias, marca = analytics.actualizar(completo=options['completo'])
+        self.stdout.write(self.style.SUCCESS('{} días sumados, último cambio procesado {}'.format(
+            dias, marca.ultimo_cambio)))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from store.confirmation import confirmar_ordenes
+from store.models import OrdenMantenimiento
+
+
+class Command(BaseCommand):
+    help = 'Confirma en lote las órdenes revisadas y genera sus facturas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hasta', help='Solo confirma las órdenes registradas hasta esta fecha (AAAA-MM-DD)')
+        parser.add_argument(
+            '--cliente', type=int, help='Solo confirma las órdenes de este cliente')
+
+    def handle(self, *args, **options):
+        ordenes = OrdenMantenimiento.objects.filter(estado='REVISADO')
+        if options['hasta']:
+            ordenes = ordenes.filter(fecha_registro__lte=options['hasta'])
+        if options['cliente']:
+            ordenes = ordenes.filter(cliente_id=options['cliente'])
+        facturas = confirmar_ordenes(ordenes)
+        self.stdout.write(self.style.SUCCESS(
+            '{} órdenes confirmadas'.format(len(facturas))))
@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import URLPattern
+from django.views.generic.list import BaseListView
+
+from people.models import Persona, Usuario
+from store import urls
+from utils.pagination import condicion_cursor
+from utils.queries import explicar, recorridos_por_clave, recorridos_secuenciales
+
+
+def listados():
+    """
+    Vistas de listado de la tienda con su ruta, se omiten las que heredan de
+    un listado pero responden otra cosa, como las exportaciones.
+    """
+    for patron in urls.urlpatterns:
+        vista = getattr(getattr(patron, 'callback', None), 'view_class', None)
+        if not isinstance(patron, URLPattern) or vista is None:
+            continue
+        if issubclass(vista, BaseListView) and vista.get is BaseListView.get:
+            yield patron, vista
+
+
+def usuario_ficticio():
+    """
+    Superusuario sin guardar para armar los querysets sin depender de los
+    datos, las vistas de clientes filtran por su persona.
+    """
+    usuario = Usuario(id=0, is_superuser=True, is_active=True, is_staff=True)
+    usuario.persona = Persona(id=0)
+    return usuario
+
+
+def consultas(vista, queryset):
+    """
+    Consultas que hace el listado para mostrar la primera página y una página
+    intermedia, que con paginación por cursor filtra por los campos del orden.
+    """
+    tamanio = vista.paginate_by or 20
+    if not getattr(vista, 'cursor_ordering', None) or not vista.uses_cursor_pagination(queryset):
+        yield 'primera página', queryset[:tamanio]
+        yield 'página intermedia', queryset[tamanio:tamanio * 2]
+        return
+    ordering = vista.cursor_ordering
+    yield 'primera página', queryset.order_by(*ordering)[:tamanio + 1]
+    valores = queryset.order_by(*ordering).values_list(*[campo.lstrip('-') for campo in ordering]).first()
+    if valores is not None:
+        siguiente = queryset.filter(condicion_cursor(ordering, valores))
+        yield 'página siguiente', siguiente.order_by(*ordering)[:tamanio + 1]
+
+
+class Command(BaseCommand):
+    help = 'Muestra el plan de ejecución de las consultas de cada listado e indica los recorridos secuenciales'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--filtro', help='Texto de búsqueda con el que se arman los listados')
+        parser.add_argument(
+            '--ignorar', action='append', default=[],
+            help='Tabla cuyo recorrido secuencial se acepta, se puede repetir')
+        parser.add_argument(
+            '--planes', action='store_true', help='Muestra el plan completo de cada consulta')
+
+    def handle(self, *args, **options):
+        fabrica = RequestFactory()
+        parametros = {'filter': options['filtro']} if options['filtro'] else {}
+        usuario = usuario_ficticio()
+        marcadas = 0
+        for patron, clase in listados():
+            kwargs = {nombre: 1 for nombre in patron.pattern.converters}
+            request = fabrica.get('/', parametros)
+            request.user = usuario
+            vista = clase()
+            vista.setup(request, **kwargs)
+            queryset = vista.get_queryset()
+            if queryset.query.is_empty():
+                self.stdout.write('{}: sin resultados, no hace consultas'.format(patron.name))
+                continue
+            for descripcion, consulta in consultas(vista, queryset):
+                plan = explicar(consulta)
+                tablas = [tabla for tabla in recorridos_secuenciales(plan, recorridos_por_clave(consulta))
+                          if tabla not in options['ignorar']]
+                titulo = '{} ({})'.format(patron.name, descripcion)
+                if tablas:
+                    marcadas += 1
+                    self.stdout.write(self.style.WARNING('{}: recorrido secuencial de {}'.format(
+                        titulo, ', '.join(tablas))))
+                else:
+                    self.stdout.write('{}: usa índices'.format(titulo))
+                if options['planes'] or tablas:
+                    self.stdout.write(plan)
+        if marcadas:
+            raise CommandError('{} consultas con recorridos secuenciales'.format(marcadas))
+        self.stdout.write(self.style.SUCCESS('Ninguna consulta con recorridos secuenciales'))
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import pdf_batch
+
+
+class Command(BaseCommand):
+    help = 'Exporta facturas u órdenes en un ZIP de PDF o en un solo PDF'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=('facturas', 'ordenes'))
+        parser.add_argument('salida', help='Archivo donde se guarda la exportación')
+        parser.add_argument('--desde', help='Fecha inicial (AAAA-MM-DD)')
+        parser.add_argument('--hasta', help='Fecha final (AAAA-MM-DD)')
+        parser.add_argument('--cliente', type=int)
+        parser.add_argument('--estado')
+        parser.add_argument('--formato', choices=('zip', 'pdf'), default='zip')
+        parser.add_argument('--trabajadores', type=int, default=pdf_batch.TRABAJADORES)
+
+    def mostrar_avance(self, hechos, total):
+        self.stderr.write('\r{}/{} documentos'.format(hechos, total), ending='')
+        sys.stderr.flush()
+
+    def handle(self, *args, **options):
+        tipo = 'FACTURA' if options['tipo'] == 'facturas' else 'ORDEN'
+        try:
+            ids = pdf_batch.filtrar(tipo, options['desde'], options['hasta'], options['cliente'], options['estado'])
+        except pdf_batch.ExportacionExcedida as e:
+            raise CommandError(' '.join(e.messages))
+        if options['formato'] == 'pdf':
+            partes = pdf_batch.exportar_pdf(tipo, ids, al_avanzar=self.mostrar_avance)
+        else:
+            partes = pdf_batch.exportar_zip(tipo, ids, options['trabajadores'], al_avanzar=self.mostrar_avance)
+        with open(options['salida'], 'wb') as salida:
+            for parte in partes:
+                salida.write(parte)
+        self.stderr.write('')
+        self.stdout.write(self.style.SUCCESS(
+            '{} documentos exportados en {}'.format(len(ids), options['salida'])))
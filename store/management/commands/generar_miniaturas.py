@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from store import images
+from store.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas de las imágenes de productos que aún no las tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos', action='store_true',
+            help='Vuelve a procesar todos los productos con imagen')
+        parser.add_argument(
+            '--trabajadores', type=int, default=images.TRABAJADORES,
+            help='Número de hilos que generan miniaturas en paralelo')
+
+    def handle(self, *args, **options):
+        productos = Producto.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['todos']:
+            productos = productos.filter(image_hash='')
+        ids = list(productos.values_list('id', flat=True))
+        procesados = images.generar_lote(ids, options['trabajadores'])
+        self.stdout.write(self.style.SUCCESS(
+            '{} de {} productos con miniaturas'.format(procesados, len(ids))))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store import importer
+
+TIPOS = {
+    'productos': 'PRODUCTO',
+    'clientes': 'CLIENTE',
+    'compras': 'COMPRA',
+}
+
+
+class Command(BaseCommand):
+    help = 'Importa productos, clientes o compras desde un archivo CSV o JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(TIPOS))
+        parser.add_argument('archivo', help='Archivo .csv o .json a importar')
+        parser.add_argument(
+            '--formato', choices=importer.FORMATOS, help='Formato del archivo si no se deduce de su extensión')
+        parser.add_argument(
+            '--simulacion', action='store_true', help='Valida e importa sin guardar los cambios')
+        parser.add_argument(
+            '--errores', help='Archivo CSV donde se escriben los errores por fila')
+
+    def handle(self, *args, **options):
+        def al_avanzar(resultado):
+            self.stderr.write('{} filas procesadas'.format(resultado.filas))
+
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resultado = importer.importar_archivo(
+                    TIPOS[options['tipo']], archivo, options['formato'], options['simulacion'], al_avanzar)
+        except (OSError, importer.ArchivoInvalido) as e:
+            raise CommandError(e)
+
+        if options['errores']:
+            with open(options['errores'], 'w', newline='', encoding='utf-8') as archivo:
+                resultado.escribir_errores(archivo)
+        else:
+            for numero, mensaje in resultado.errores:
+                self.stdout.write('Fila {}: {}'.format(numero, mensaje))
+
+        creados = ', '.join('{} {}'.format(cantidad, nombre) for nombre, cantidad in sorted(resultado.creados.items()))
+        if not resultado.valido:
+            raise CommandError('{} filas con errores, no se importó nada'.format(len(resultado.errores)))
+        if resultado.simulacion:
+            self.stdout.write(self.style.WARNING('Simulación sin cambios: {}'.format(creados or 'nada que importar')))
+        else:
+            self.stdout.write(self.style.SUCCESS('Importados: {}'.format(creados or 'nada')))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from store import jobs
+
+
+class Command(BaseCommand):
+    help = 'Atiende la cola de trabajos en segundo plano: documentos PDF y miniaturas de productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--trabajadores', type=int, default=jobs.TRABAJADORES,
+            help='Número máximo de trabajos que se ejecutan a la vez')
+        parser.add_argument(
+            '--una-vez', action='store_true',
+            help='Termina cuando la cola queda vacía en lugar de esperar nuevos trabajos')
+
+    def handle(self, *args, **options):
+        jobs.procesar(options['trabajadores'], continuo=not options['una_vez'])
@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from store import forecast
+
+
+class Command(BaseCommand):
+    help = 'Calcula el ritmo de venta de cada producto y los días hasta agotar su stock, se ejecuta cada noche'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hasta', type=date.fromisoformat,
+            help='Último día de ventas considerado en formato AAAA-MM-DD, por omisión ayer')
+        parser.add_argument(
+            '--metodo', choices=forecast.METODOS, default=forecast.METODO,
+            help='Promedio de los últimos días o suavizado exponencial')
+
+    def handle(self, *args, **options):
+        pronostico, marca = forecast.actualizar(options['hasta'], options['metodo'])
+        self.stdout.write(self.style.SUCCESS('{} productos, {} por reponer'.format(
+            len(pronostico.productos), int(pronostico.reponer.sum()))))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store import stock
+
+
+class Command(BaseCommand):
+    help = 'Verifica o reconstruye el stock de los productos a partir del historial de compras y ventas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='Solo muestra los productos con diferencias sin modificarlos')
+
+    def handle(self, *args, **options):
+        if options['verificar']:
+            productos = stock.diferencias()
+        else:
+            productos = stock.reconstruir()
+        for producto_id, cantidad, saldo in productos:
+            self.stdout.write('Producto {}: guardado {}, historial {}'.format(
+                producto_id, cantidad, saldo))
+        if options['verificar'] and productos:
+            raise CommandError('{} productos con diferencias'.format(len(productos)))
+        accion = 'con diferencias' if options['verificar'] else 'corregidos'
+        self.stdout.write(self.style.SUCCESS(
+            '{} productos {}'.format(len(productos), accion)))
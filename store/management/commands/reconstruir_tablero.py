@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store import dashboard
+
+
+class Command(BaseCommand):
+    help = 'Verifica o reconstruye el resumen del tablero a partir de las órdenes, detalles y facturas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='Solo muestra las filas del resumen con diferencias sin modificarlas')
+
+    def handle(self, *args, **options):
+        filas = dashboard.diferencias()
+        for (empresa_id, tipo, estado, fecha), guardado, calculado in filas:
+            self.stdout.write('Empresa {} {} {} {}: guardado {}, calculado {}'.format(
+                empresa_id, tipo, estado, fecha or 'total', guardado, calculado))
+        if options['verificar']:
+            if filas:
+                raise CommandError('{} filas con diferencias'.format(len(filas)))
+            self.stdout.write(self.style.SUCCESS('0 filas con diferencias'))
+            return
+        total = dashboard.reconstruir()
+        self.stdout.write(self.style.SUCCESS(
+            '{} filas corregidas, {} filas en el resumen'.format(len(filas), total)))
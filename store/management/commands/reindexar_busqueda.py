@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from store import search
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los documentos de búsqueda de órdenes, facturas y personas'
+
+    def handle(self, *args, **options):
+        total = search.reindexar()
+        self.stdout.write(self.style.SUCCESS(
+            '{} documentos indexados'.format(total)))
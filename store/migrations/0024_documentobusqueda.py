@@ -0,0 +1,105 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:45
+
+from django.db import migrations, models
+
+TABLA = 'store_documentobusqueda'
+
+INDICES = {
+    'postgresql': [
+        "ALTER TABLE {0} ADD COLUMN vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', texto)) STORED",
+        "CREATE INDEX {0}_vector ON {0} USING GIN (vector)",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE {0}_fts USING fts5(texto, content='{0}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER {0}_ai AFTER INSERT ON {0} BEGIN "
+        "INSERT INTO {0}_fts(rowid, texto) VALUES (new.id, new.texto); END",
+        "CREATE TRIGGER {0}_ad AFTER DELETE ON {0} BEGIN "
+        "INSERT INTO {0}_fts({0}_fts, rowid, texto) VALUES ('delete', old.id, old.texto); END",
+        "CREATE TRIGGER {0}_au AFTER UPDATE ON {0} BEGIN "
+        "INSERT INTO {0}_fts({0}_fts, rowid, texto) VALUES ('delete', old.id, old.texto); "
+        "INSERT INTO {0}_fts(rowid, texto) VALUES (new.id, new.texto); END",
+    ],
+    'mysql': [
+        "CREATE FULLTEXT INDEX {0}_texto ON {0} (texto)",
+    ],
+}
+
+ELIMINAR_INDICES = {
+    'postgresql': [
+        "DROP INDEX {0}_vector",
+        "ALTER TABLE {0} DROP COLUMN vector",
+    ],
+    'sqlite': [
+        "DROP TRIGGER {0}_ai",
+        "DROP TRIGGER {0}_ad",
+        "DROP TRIGGER {0}_au",
+        "DROP TABLE {0}_fts",
+    ],
+    'mysql': [
+        "DROP INDEX {0}_texto ON {0}",
+    ],
+}
+
+
+def ejecutar(schema_editor, sentencias):
+    for sentencia in sentencias.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sentencia.format(TABLA))
+
+
+def crear_indices(apps, schema_editor):
+    ejecutar(schema_editor, INDICES)
+
+
+def eliminar_indices(apps, schema_editor):
+    ejecutar(schema_editor, ELIMINAR_INDICES)
+
+
+def componer_texto(*partes):
+    return ' '.join(str(parte) for parte in partes if parte)
+
+
+def indexar_documentos(apps, schema_editor):
+    DocumentoBusqueda = apps.get_model('store', 'DocumentoBusqueda')
+    OrdenMantenimiento = apps.get_model('store', 'OrdenMantenimiento')
+    Factura = apps.get_model('store', 'Factura')
+    Persona = apps.get_model('people', 'Persona')
+    documentos = []
+    for fila in OrdenMantenimiento.objects.values_list(
+            'id', 'descripcion', 'cliente__nombre', 'cliente__apellido', 'cliente__numero_identificacion'):
+        documentos.append(DocumentoBusqueda(
+            tipo='ORDEN', objeto_id=fila[0], texto=componer_texto(*fila[1:])))
+    for fila in Factura.objects.values_list(
+            'id', 'cliente__nombre', 'cliente__apellido', 'cliente__numero_identificacion'):
+        documentos.append(DocumentoBusqueda(
+            tipo='FACTURA', objeto_id=fila[0], texto=componer_texto(*fila[1:])))
+    for fila in Persona.objects.values_list('id', 'nombre', 'apellido', 'numero_identificacion'):
+        documentos.append(DocumentoBusqueda(
+            tipo='PERSONA', objeto_id=fila[0], texto=componer_texto(*fila[1:])))
+    DocumentoBusqueda.objects.bulk_create(documentos, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0004_auto_20201022_1456'),
+        ('store', '0023_auto_20201201_2205'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusqueda',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('ORDEN', 'Orden de mantenimiento'), ('FACTURA', 'Factura'), ('PERSONA', 'Persona')], max_length=20, verbose_name='Tipo')),
+                ('objeto_id', models.PositiveIntegerField(verbose_name='Objeto')),
+                ('texto', models.TextField(verbose_name='Texto')),
+            ],
+            options={
+                'unique_together': {('tipo', 'objeto_id')},
+            },
+        ),
+        migrations.RunPython(crear_indices, eliminar_indices),
+        migrations.RunPython(indexar_documentos, migrations.RunPython.noop),
+    ]
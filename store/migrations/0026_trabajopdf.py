@@ -0,0 +1,32 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0025_producto_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoPdf',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('ORDEN', 'Orden de mantenimiento'), ('FACTURA', 'Factura'), ('PAGO', 'Pago de factura')], max_length=20, verbose_name='Tipo')),
+                ('objeto_id', models.PositiveIntegerField(verbose_name='Objeto')),
+                ('clave', models.CharField(db_index=True, max_length=64, verbose_name='Clave')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En proceso'), ('TERMINADO', 'Terminado'), ('ERROR', 'Error')], db_index=True, default='PENDIENTE', max_length=20, verbose_name='Estado')),
+                ('archivo', models.FileField(blank=True, null=True, upload_to='pdf/trabajos')),
+                ('error', models.TextField(blank=True, default='')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trabajos_pdf', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0026_trabajopdf'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detalleorden',
+            index=models.Index(fields=['orden_mantenimiento', 'estado'], name='detalleorden_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['fecha_venta', 'id'], name='factura_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(condition=models.Q(estado='POR_PAGAR'), fields=['cliente', 'fecha_venta'], name='factura_por_pagar_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmantenimiento',
+            index=models.Index(fields=['fecha_registro', 'id'], name='orden_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmantenimiento',
+            index=models.Index(fields=['cliente', 'fecha_registro', 'id'], name='orden_cliente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmantenimiento',
+            index=models.Index(fields=['estado', 'fecha_registro'], name='orden_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmantenimiento',
+            index=models.Index(condition=models.Q(estado__in=['NUEVO', 'EN_REVISION', 'REVISADO']), fields=['fecha_registro'], name='orden_abierta_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pagofactura',
+            index=models.Index(fields=['factura', 'fecha_pago', 'id'], name='pago_factura_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tecnico',
+            index=models.Index(fields=['fecha_ingreso', 'persona_ptr'], name='tecnico_ingreso_idx'),
+        ),
+    ]
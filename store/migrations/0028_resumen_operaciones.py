@@ -0,0 +1,39 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0027_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenOperacion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('ORDEN', 'Orden de mantenimiento'), ('DETALLE_ORDEN', 'Detalle de orden'), ('FACTURA', 'Factura')], max_length=20, verbose_name='Tipo')),
+                ('estado', models.CharField(max_length=50, verbose_name='Estado')),
+                ('fecha', models.DateField(blank=True, null=True, verbose_name='Fecha')),
+                ('cantidad', models.IntegerField(default=0, verbose_name='Cantidad')),
+                ('monto', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto')),
+                ('saldo', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Saldo por pagar')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='store.Empresa')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='resumenoperacion',
+            index=models.Index(fields=['empresa', 'fecha'], name='resumen_empresa_fecha_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenoperacion',
+            constraint=models.UniqueConstraint(fields=('empresa', 'tipo', 'estado', 'fecha'), name='resumen_dia_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenoperacion',
+            constraint=models.UniqueConstraint(condition=models.Q(fecha__isnull=True), fields=('empresa', 'tipo', 'estado'), name='resumen_total_unico'),
+        ),
+    ]
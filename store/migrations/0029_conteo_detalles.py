@@ -0,0 +1,49 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+TAMANIO_LOTE = 1000
+
+
+def contar_detalles(apps, schema_editor):
+    """
+    Corrige el estado 'Arregado' que guardaba el formulario de revisión y
+    cuenta los detalles existentes de cada orden por estado.
+    """
+    DetalleOrden = apps.get_model('store', 'DetalleOrden')
+    ConteoDetalles = apps.get_model('store', 'ConteoDetalles')
+    DetalleOrden.objects.filter(estado='Arregado').update(estado='ARREGLADO')
+    conteos = {}
+    filas = DetalleOrden.objects.order_by().values('orden_mantenimiento_id', 'estado').annotate(
+        numero=models.Count('id')).values_list('orden_mantenimiento_id', 'estado', 'numero')
+    for orden_id, estado, numero in filas:
+        conteo = conteos.setdefault(orden_id, ConteoDetalles(orden_id=orden_id))
+        conteo.total += numero
+        columna = estado.lower()
+        setattr(conteo, columna, getattr(conteo, columna) + numero)
+    ConteoDetalles.objects.bulk_create(conteos.values(), batch_size=TAMANIO_LOTE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0028_resumen_operaciones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoDetalles',
+            fields=[
+                ('orden', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='conteo_detalles', serialize=False, to='store.OrdenMantenimiento')),
+                ('total', models.IntegerField(default=0)),
+                ('nuevo', models.IntegerField(default=0)),
+                ('en_revision', models.IntegerField(default=0)),
+                ('revisado', models.IntegerField(default=0)),
+                ('confirmado', models.IntegerField(default=0)),
+                ('arreglado', models.IntegerField(default=0)),
+                ('finalizado', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(contar_detalles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0029_conteo_detalles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioVenta',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(blank=True, null=True)),
+                ('factura_id', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MarcaAgregacion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('ultimo_cambio', models.BigIntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('lineas', models.IntegerField(default=0, verbose_name='Líneas')),
+                ('cantidad', models.IntegerField(default=0, verbose_name='Cantidad')),
+                ('monto', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto')),
+                ('impuesto', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Impuesto')),
+                ('producto', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='store.Producto')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ventadiaria',
+            constraint=models.UniqueConstraint(fields=('fecha', 'producto'), name='venta_diaria_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='ventadiaria',
+            constraint=models.UniqueConstraint(condition=models.Q(producto__isnull=True), fields=('fecha',), name='venta_diaria_sin_producto_unica'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0030_ventas_diarias'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PronosticoStock',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pronostico', serialize=False, to='store.Producto')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('cantidad', models.IntegerField(default=0, verbose_name='Cantidad')),
+                ('tasa_media', models.DecimalField(decimal_places=3, default=0, max_digits=12, verbose_name='Venta diaria promedio')),
+                ('tasa_exponencial', models.DecimalField(decimal_places=3, default=0, max_digits=12, verbose_name='Venta diaria suavizada')),
+                ('dias_hasta_agotar', models.DecimalField(blank=True, decimal_places=1, max_digits=10, null=True, verbose_name='Días hasta agotar')),
+                ('cantidad_sugerida', models.PositiveIntegerField(default=0, verbose_name='Cantidad sugerida')),
+                ('reponer', models.BooleanField(default=False, verbose_name='Reponer')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pronosticostock',
+            index=models.Index(fields=['reponer', 'dias_hasta_agotar'], name='pronostico_reponer_idx'),
+        ),
+    ]
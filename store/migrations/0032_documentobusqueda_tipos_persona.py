@@ -0,0 +1,49 @@
+# Generated by Django 3.0.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+TAMANIO_LOTE = 1000
+
+
+def componer_texto(*partes):
+    return ' '.join(str(parte) for parte in partes if parte)
+
+
+def indexar_personas(DocumentoBusqueda, tipo, model):
+    DocumentoBusqueda.objects.bulk_create([
+        DocumentoBusqueda(tipo=tipo, objeto_id=fila[0], texto=componer_texto(*fila[1:]))
+        for fila in model.objects.values_list('id', 'nombre', 'apellido', 'numero_identificacion')
+    ], batch_size=TAMANIO_LOTE)
+
+
+def separar_personas(apps, schema_editor):
+    DocumentoBusqueda = apps.get_model('store', 'DocumentoBusqueda')
+    DocumentoBusqueda.objects.filter(tipo='PERSONA').delete()
+    indexar_personas(DocumentoBusqueda, 'CLIENTE', apps.get_model('store', 'Cliente'))
+    indexar_personas(DocumentoBusqueda, 'TECNICO', apps.get_model('store', 'Tecnico'))
+
+
+def unir_personas(apps, schema_editor):
+    DocumentoBusqueda = apps.get_model('store', 'DocumentoBusqueda')
+    DocumentoBusqueda.objects.filter(tipo__in=('CLIENTE', 'TECNICO')).delete()
+    indexar_personas(DocumentoBusqueda, 'PERSONA', apps.get_model('people', 'Persona'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0031_pronostico_stock'),
+    ]
+
+    # Las opciones no cambian la columna, y en SQLite alterarla recrea la tabla
+    # y elimina los disparadores del índice de texto
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='documentobusqueda',
+                name='tipo',
+                field=models.CharField(choices=[('ORDEN', 'Orden de mantenimiento'), ('FACTURA', 'Factura'), ('CLIENTE', 'Cliente'), ('TECNICO', 'Técnico')], max_length=20, verbose_name='Tipo'),
+            ),
+        ]),
+        migrations.RunPython(separar_personas, unir_personas),
+    ]
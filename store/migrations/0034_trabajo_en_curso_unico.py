@@ -0,0 +1,34 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:46
+
+from django.db import migrations, models
+from django.db.models import Count
+
+EN_CURSO = ('PENDIENTE', 'EN_PROCESO')
+
+
+def descartar_duplicados(apps, schema_editor):
+    """
+    Deja en curso solo el trabajo más reciente de cada clave, los demás se
+    marcan con error para poder crear la restricción.
+    """
+    TrabajoPdf = apps.get_model('store', 'TrabajoPdf')
+    en_curso = TrabajoPdf.objects.filter(estado__in=EN_CURSO)
+    repetidas = en_curso.values('clave').annotate(cantidad=Count('id')).filter(cantidad__gt=1)
+    for clave in repetidas.values_list('clave', flat=True):
+        ultimo = en_curso.filter(clave=clave).order_by('-id').values_list('id', flat=True)[0]
+        en_curso.filter(clave=clave).exclude(pk=ultimo).update(estado='ERROR', error='Trabajo duplicado')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0033_trabajopdf_miniaturas'),
+    ]
+
+    operations = [
+        migrations.RunPython(descartar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='trabajopdf',
+            constraint=models.UniqueConstraint(condition=models.Q(estado__in=('PENDIENTE', 'EN_PROCESO')), fields=('clave',), name='trabajo_en_curso_unico'),
+        ),
+    ]
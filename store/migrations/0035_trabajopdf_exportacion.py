@@ -0,0 +1,38 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0034_trabajo_en_curso_unico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajopdf',
+            name='hechos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajopdf',
+            name='nombre_archivo',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='trabajopdf',
+            name='parametros',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='trabajopdf',
+            name='total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='trabajopdf',
+            name='tipo',
+            field=models.CharField(choices=[('ORDEN', 'Orden de mantenimiento'), ('FACTURA', 'Factura'), ('PAGO', 'Pago de factura'), ('MINIATURAS', 'Miniaturas de producto'), ('EXPORTACION_FACTURA', 'Exportación de facturas'), ('EXPORTACION_ORDEN', 'Exportación de órdenes')], max_length=20, verbose_name='Tipo'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0035_trabajopdf_exportacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajopdf',
+            name='resultado',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='trabajopdf',
+            name='tipo',
+            field=models.CharField(choices=[('ORDEN', 'Orden de mantenimiento'), ('FACTURA', 'Factura'), ('PAGO', 'Pago de factura'), ('MINIATURAS', 'Miniaturas de producto'), ('EXPORTACION_FACTURA', 'Exportación de facturas'), ('EXPORTACION_ORDEN', 'Exportación de órdenes'), ('IMPORTACION', 'Importación de archivo')], max_length=20, verbose_name='Tipo'),
+        ),
+    ]
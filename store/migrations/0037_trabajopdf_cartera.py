@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0036_trabajopdf_importacion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trabajopdf',
+            name='tipo',
+            field=models.CharField(choices=[('ORDEN', 'Orden de mantenimiento'), ('FACTURA', 'Factura'), ('PAGO', 'Pago de factura'), ('MINIATURAS', 'Miniaturas de producto'), ('EXPORTACION_FACTURA', 'Exportación de facturas'), ('EXPORTACION_ORDEN', 'Exportación de órdenes'), ('IMPORTACION', 'Importación de archivo'), ('CARTERA', 'Reporte de cartera')], max_length=20, verbose_name='Tipo'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+
+TAMANIO_LOTE = 500
+CERO = Decimal('0.00')
+
+# (modelo, tipo, empresa, fecha, monto, pagado) como en store.dashboard.SEGUIMIENTOS
+SEGUIMIENTOS = (
+    ('OrdenMantenimiento', 'ORDEN', 'empresa_id', 'fecha_registro', 'monto_servicio', None),
+    ('DetalleOrden', 'DETALLE_ORDEN', 'orden_mantenimiento__empresa_id', 'orden_mantenimiento__fecha_registro',
+     'precio_servicio', None),
+    ('Factura', 'FACTURA', 'empresa_id', 'fecha_venta', 'total', 'monto_pagado'),
+)
+
+
+def decimal(valor):
+    return Decimal(str(valor or 0)).quantize(CERO)
+
+
+def rellenar_resumen(apps, schema_editor):
+    """
+    Genera el resumen del tablero desde las órdenes, detalles y facturas
+    existentes con el mismo cálculo que store.dashboard.calcular, así el
+    tablero no cuenta solo lo modificado después de la migración. Las filas
+    que ya se hubieran registrado se reemplazan.
+    """
+    ResumenOperacion = apps.get_model('store', 'ResumenOperacion')
+    resumen = defaultdict(lambda: [0, CERO, CERO])
+    for nombre, tipo, empresa, fecha, monto, pagado in SEGUIMIENTOS:
+        sumas = {'suma_monto': models.Sum(monto)}
+        if pagado:
+            sumas['suma_pagado'] = models.Sum(pagado)
+        filas = apps.get_model('store', nombre).objects.order_by().values(empresa, fecha, 'estado').annotate(
+            numero=models.Count('pk'), **sumas)
+        for fila in filas:
+            if fila[empresa] is None:
+                continue
+            suma = decimal(fila['suma_monto'])
+            saldo = suma - decimal(fila['suma_pagado']) if pagado else CERO
+            for dia in (fila[fecha], None):
+                valores = resumen[(fila[empresa], tipo, fila['estado'], dia)]
+                valores[0] += fila['numero']
+                valores[1] += suma
+                valores[2] += saldo
+    ResumenOperacion.objects.all().delete()
+    ResumenOperacion.objects.bulk_create([
+        ResumenOperacion(empresa_id=empresa_id, tipo=tipo, estado=estado, fecha=fecha,
+                         cantidad=cantidad, monto=monto, saldo=saldo)
+        for (empresa_id, tipo, estado, fecha), (cantidad, monto, saldo) in resumen.items()
+    ], batch_size=TAMANIO_LOTE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0037_trabajopdf_cartera'),
+    ]
+
+    operations = [
+        migrations.RunPython(rellenar_resumen, migrations.RunPython.noop),
+    ]
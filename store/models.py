@@ -1,7 +1,7 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from people.models import Persona
 from django.urls import reverse
-from datetime import datetime
 from django.utils.html import format_html
 class Empresa(models.Model):
     """
@@ -56,6 +56,11 @@ class Tecnico(Persona):
     """
     fecha_ingreso = models.DateField(verbose_name="Fecha de ingreso")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha_ingreso', 'persona_ptr'], name='tecnico_ingreso_idx'),
+        ]
+
 
 class Cliente(Persona):
     def __str__(self):
@@ -90,41 +95,61 @@ class OrdenMantenimiento(models.Model):
     empresa = models.ForeignKey(
         Empresa, on_delete=models.CASCADE, related_name='ordenes')
 
+    class Meta:
+        indexes = [
+            # Listado de órdenes y paginación por cursor
+            models.Index(fields=['fecha_registro', 'id'], name='orden_fecha_idx'),
+            # Órdenes de un cliente
+            models.Index(fields=['cliente', 'fecha_registro', 'id'], name='orden_cliente_fecha_idx'),
+            # Confirmación por estado hasta una fecha
+            models.Index(fields=['estado', 'fecha_registro'], name='orden_estado_fecha_idx'),
+            # Órdenes abiertas por fecha
+            models.Index(fields=['fecha_registro'], name='orden_abierta_fecha_idx',
+                         condition=models.Q(estado__in=['NUEVO', 'EN_REVISION', 'REVISADO'])),
+        ]
+
     def get_absolute_url(self):
         return reverse('order-update', kwargs={'pk': self.pk})
 
     def verificar_estado_detalles(self, estado):
         """
-        Permite verificar el estado actual de todos los detalles de la orden.
+        Permite verificar si todos los detalles de la orden están en el estado
+        indicado comparando los contadores de la orden.
         """
-        if self.detalles.count() == 0:
-            return False
-
-        for detalle in self.detalles.all():
-            if detalle.estado != estado:
-                return False
-        return True
+        from store import workflow
+        return workflow.todos_en_estado(self.pk, estado)
 
     def calcular_monto(self):
-        self.monto_servicio = sum(
-            map(lambda detalle: detalle.precio_servicio, self.detalles.all()))
-
-    def confirmar(self):
-        factura = Factura.objects.create(fecha_venta=datetime.now(), cliente=self.cliente, empresa=self.empresa, subtotal=0.0, impuesto=0.0,
-                                         total=0.0)
+        """
+        Calcula el monto de servicio sumando los precios de los detalles en la base de datos.
+        """
+        from store import totals
+        for fila, valores in totals.montos_ordenes(OrdenMantenimiento.objects.filter(pk=self.pk)):
+            self.monto_servicio = valores['monto_servicio']
 
-        for detalle in self.detalles.all():
+    def actualizar_monto(self):
+        """
+        Recalcula el monto de servicio y guarda solo si cambió.
+        """
+        from store import totals
+        for fila, valores in totals.montos_ordenes(OrdenMantenimiento.objects.filter(pk=self.pk)):
+            totals.escribir_cambios(OrdenMantenimiento, fila, valores)
+            self.monto_servicio = valores['monto_servicio']
 
-            detalle.estado = "CONFIRMADO"
-            detalle.save()
-            detalle_factura = DetalleFactura(
-                precio_unitario=detalle.precio_servicio, cantidad=1, impuesto=0.0)
-            detalle_factura.calcular_total()
-            factura.detalles.add(detalle_factura, bulk=False)
-        factura.calcular_subtotal()
-        factura.calcular_impuesto()
-        factura.calcular_total()
-        factura.save()
+    def confirmar(self):
+        """
+        Confirma la orden y genera su factura, ver store.confirmation.confirmar_ordenes.
+        Lanza TransicionInvalida si el estado guardado no permite confirmarla,
+        si ya estaba confirmada no se genera otra factura ni cambia su estado.
+        """
+        from store import workflow
+        from store.confirmation import confirmar_ordenes
+        ordenes = OrdenMantenimiento.objects.filter(pk=self.pk)
+        with transaction.atomic():
+            workflow.validar_orden(ordenes.select_for_update().values_list('estado', flat=True).get(), 'CONFIRMADO')
+            facturas = confirmar_ordenes(ordenes)
+        self.refresh_from_db(fields=['estado'])
+        return facturas[0] if facturas else None
 
 
 class DetalleOrden(models.Model):
@@ -155,6 +180,27 @@ class DetalleOrden(models.Model):
     orden_mantenimiento = models.ForeignKey(
         OrdenMantenimiento, on_delete=models.CASCADE, related_name='detalles')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['orden_mantenimiento', 'estado'], name='detalleorden_estado_idx'),
+        ]
+
+
+class ConteoDetalles(models.Model):
+    """
+    Número de detalles de una orden en cada estado, lo mantiene store.workflow
+    para decidir el estado de la orden sin recorrer sus detalles.
+    """
+    orden = models.OneToOneField(
+        OrdenMantenimiento, on_delete=models.CASCADE, primary_key=True, related_name='conteo_detalles')
+    total = models.IntegerField(default=0)
+    nuevo = models.IntegerField(default=0)
+    en_revision = models.IntegerField(default=0)
+    revisado = models.IntegerField(default=0)
+    confirmado = models.IntegerField(default=0)
+    arreglado = models.IntegerField(default=0)
+    finalizado = models.IntegerField(default=0)
+
 
 class RevisionTecnica(models.Model):
     """
@@ -191,6 +237,7 @@ class Producto(models.Model):
     nombre = models.CharField(max_length=255, verbose_name='Nombre')
     cantidad = models.PositiveIntegerField(verbose_name='Cantidad', default=0)
     image = models.ImageField(upload_to='gallery/products', null= True, default=None)
+    image_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     precio = models.DecimalField(
         max_digits=12, decimal_places=2, verbose_name='Precio', default=0.0)
     impuesto_iva = models.DecimalField(
@@ -203,11 +250,31 @@ class Producto(models.Model):
     def __str__(self):
         return '{} Precio: {}'.format(self.nombre, self.precio)
 
-   
+
+    @property
+    def miniatura(self):
+        """
+        Miniatura más pequeña de la imagen, o la imagen original si aún no se generan.
+        """
+        from store import images
+        return images.miniatura(self)
+
     def calcular_cantidad(self):
-        self.cantidad = sum(
-            map(lambda detalle: detalle.cantidad, self.compras.all())) - sum(
-            map(lambda detalle: detalle.cantidad, self.ventas.all()))
+        """
+        Calcula el stock a partir del historial de compras y ventas en una sola consulta.
+        """
+        from store import stock
+        for producto_id, cantidad, saldo in stock.saldos(Producto.objects.filter(pk=self.pk)):
+            self.cantidad = saldo
+
+    def reservar(self, cantidad):
+        """
+        Descuenta del stock la cantidad indicada de forma atómica, lanza
+        StockInsuficiente si no hay suficientes unidades.
+        """
+        from store import stock
+        stock.reservar_lote([(self.pk, cantidad)])
+        self.refresh_from_db(fields=['cantidad'])
 
 
 class Precio (models.Model):
@@ -258,16 +325,27 @@ class Compra (models.Model):
     proveedor = models.ForeignKey(
         Proveedor, on_delete=models.CASCADE, related_name='compras')
 
-    def calcular_subtotal(self):
-        self.subtotal = sum(
-            map(lambda detalle: detalle.total, self.detalles.all()))
-
     def calcular_total(self):
         self.total = self.subtotal + self.impuesto
 
-    def calcular_impuesto(self):
-        self.impuesto = sum(
-            map(lambda detalle: detalle.impuesto, self.detalles.all()))
+    def calcular_totales(self):
+        """
+        Calcula el subtotal, impuesto y total con una sola consulta sobre los detalles.
+        """
+        from store import totals
+        for fila, valores in totals.totales_compras(Compra.objects.filter(pk=self.pk)):
+            for campo, valor in valores.items():
+                setattr(self, campo, valor)
+
+    def actualizar_totales(self):
+        """
+        Calcula los totales y guarda solo las columnas que cambiaron.
+        """
+        from store import totals
+        for fila, valores in totals.totales_compras(Compra.objects.filter(pk=self.pk)):
+            totals.escribir_cambios(Compra, fila, valores)
+            for campo, valor in valores.items():
+                setattr(self, campo, valor)
 
 
 class DetalleCompra (models.Model):
@@ -288,7 +366,6 @@ class DetalleCompra (models.Model):
         Compra, on_delete=models.CASCADE, related_name='detalles')
 
     def calcular_total(self):
-        print('pasa')
         self.total = self.cantidad * self.precio_unitario
 
 
@@ -321,27 +398,40 @@ class Factura (models.Model):
     cliente = models.ForeignKey(
         Cliente, on_delete=models.CASCADE, related_name='facturas')
 
+    class Meta:
+        indexes = [
+            # Listado de facturas y paginación por cursor
+            models.Index(fields=['fecha_venta', 'id'], name='factura_fecha_idx'),
+            # Facturas por pagar de un cliente
+            models.Index(fields=['cliente', 'fecha_venta'], name='factura_por_pagar_idx',
+                         condition=models.Q(estado='POR_PAGAR')),
+        ]
+
     def get_absolute_url(self):
         return reverse('invoice-update', kwargs={'pk': self.pk})
 
-    def calcular_subtotal(self):
-        self.subtotal = sum(
-            map(lambda detalle: detalle.total, self.detalles.all()))
-
-    def calcular_impuesto(self):
-        self.impuesto = sum(
-            map(lambda detalle: detalle.impuesto, self.detalles.all()))
-
     def calcular_total(self):
         self.total = self.subtotal+self.impuesto
 
-    def calcular_pagos(self):
-        self.monto_pagado = sum(
-            map(lambda pago: pago.monto, self.pagos.all()))
-        if self.monto_pagado == self.total:
-            self.estado = "PAGADO"
-        else:
-            self.estado = "POR_PAGAR"
+    def calcular_totales(self):
+        """
+        Calcula el subtotal, impuesto, total, monto pagado y estado con una sola
+        consulta sobre los detalles y pagos.
+        """
+        from store import totals
+        for fila, valores in totals.totales_facturas(Factura.objects.filter(pk=self.pk)):
+            for campo, valor in valores.items():
+                setattr(self, campo, valor)
+
+    def actualizar_totales(self):
+        """
+        Calcula los totales y guarda solo las columnas que cambiaron.
+        """
+        from store import totals
+        for fila, valores in totals.totales_facturas(Factura.objects.filter(pk=self.pk)):
+            totals.escribir_cambios(Factura, fila, valores)
+            for campo, valor in valores.items():
+                setattr(self, campo, valor)
 
 
 class DetalleFactura (models.Model):
@@ -375,3 +465,173 @@ class PagoFactura (models.Model):
     factura = models.ForeignKey(
         Factura, on_delete=models.CASCADE, related_name='pagos')
     descripcion = models.CharField(max_length=255, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['factura', 'fecha_pago', 'id'], name='pago_factura_fecha_idx'),
+        ]
+
+
+class DocumentoBusqueda(models.Model):
+    """
+    Texto desnormalizado de una orden, factura, cliente o técnico que se usa en los filtros de búsqueda.
+    """
+    TIPO = (
+        ('ORDEN', 'Orden de mantenimiento'),
+        ('FACTURA', 'Factura'),
+        ('CLIENTE', 'Cliente'),
+        ('TECNICO', 'Técnico'),
+    )
+    tipo = models.CharField(max_length=20, choices=TIPO, verbose_name='Tipo')
+    objeto_id = models.PositiveIntegerField(verbose_name='Objeto')
+    texto = models.TextField(verbose_name='Texto')
+
+    class Meta:
+        unique_together = ('tipo', 'objeto_id')
+
+
+class TrabajoPdf(models.Model):
+    """
+    Solicitud de generación de un documento PDF, o de otro trabajo pesado, que
+    se procesa fuera de la petición.
+    """
+    TIPO = (
+        ('ORDEN', 'Orden de mantenimiento'),
+        ('FACTURA', 'Factura'),
+        ('PAGO', 'Pago de factura'),
+        ('MINIATURAS', 'Miniaturas de producto'),
+        ('EXPORTACION_FACTURA', 'Exportación de facturas'),
+        ('EXPORTACION_ORDEN', 'Exportación de órdenes'),
+        ('IMPORTACION', 'Importación de archivo'),
+        ('CARTERA', 'Reporte de cartera'),
+    )
+    ESTADO = (
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En proceso'),
+        ('TERMINADO', 'Terminado'),
+        ('ERROR', 'Error'),
+    )
+    tipo = models.CharField(max_length=20, choices=TIPO, verbose_name='Tipo')
+    objeto_id = models.PositiveIntegerField(verbose_name='Objeto')
+    clave = models.CharField(max_length=64, db_index=True, verbose_name='Clave')
+    estado = models.CharField(
+        max_length=20, choices=ESTADO, default='PENDIENTE', db_index=True, verbose_name='Estado')
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='trabajos_pdf')
+    # Filtros u opciones del trabajo en JSON y nombre con el que se descarga su archivo
+    parametros = models.TextField(blank=True, default='')
+    nombre_archivo = models.CharField(max_length=100, blank=True, default='')
+    archivo = models.FileField(upload_to='pdf/trabajos', null=True, blank=True)
+    hechos = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    # Resumen en JSON de los trabajos que no generan un archivo, como las importaciones
+    resultado = models.TextField(blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Un solo trabajo en curso por clave, ver store.jobs.solicitar
+            models.UniqueConstraint(fields=['clave'], name='trabajo_en_curso_unico',
+                                    condition=models.Q(estado__in=('PENDIENTE', 'EN_PROCESO'))),
+        ]
+
+
+class ResumenOperacion(models.Model):
+    """
+    Cantidad y montos de órdenes, detalles de orden y facturas por empresa,
+    estado y día, lo mantiene store.dashboard. Las filas sin fecha acumulan
+    todo el historial.
+    """
+    TIPO = (
+        ('ORDEN', 'Orden de mantenimiento'),
+        ('DETALLE_ORDEN', 'Detalle de orden'),
+        ('FACTURA', 'Factura'),
+    )
+    empresa = models.ForeignKey(
+        Empresa, on_delete=models.CASCADE, related_name='resumenes')
+    tipo = models.CharField(max_length=20, choices=TIPO, verbose_name='Tipo')
+    estado = models.CharField(max_length=50, verbose_name='Estado')
+    fecha = models.DateField(null=True, blank=True, verbose_name='Fecha')
+    cantidad = models.IntegerField(default=0, verbose_name='Cantidad')
+    monto = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name='Monto')
+    saldo = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name='Saldo por pagar')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['empresa', 'tipo', 'estado', 'fecha'], name='resumen_dia_unico'),
+            models.UniqueConstraint(fields=['empresa', 'tipo', 'estado'], name='resumen_total_unico',
+                                    condition=models.Q(fecha__isnull=True)),
+        ]
+        indexes = [
+            models.Index(fields=['empresa', 'fecha'], name='resumen_empresa_fecha_idx'),
+        ]
+
+
+class VentaDiaria(models.Model):
+    """
+    Ventas de un producto en un día sumadas desde los detalles de factura, la
+    mantiene store.analytics. Las líneas sin producto se suman con producto vacío.
+    """
+    fecha = models.DateField(verbose_name='Fecha')
+    producto = models.ForeignKey(
+        Producto, null=True, blank=True, on_delete=models.CASCADE, related_name='ventas_diarias')
+    lineas = models.IntegerField(default=0, verbose_name='Líneas')
+    cantidad = models.IntegerField(default=0, verbose_name='Cantidad')
+    monto = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name='Monto')
+    impuesto = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name='Impuesto')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'producto'], name='venta_diaria_unica'),
+            models.UniqueConstraint(fields=['fecha'], name='venta_diaria_sin_producto_unica',
+                                    condition=models.Q(producto__isnull=True)),
+        ]
+
+
+class CambioVenta(models.Model):
+    """
+    Día o factura cuyas ventas cambiaron y deben volver a sumarse.
+    """
+    fecha = models.DateField(null=True, blank=True)
+    factura_id = models.PositiveIntegerField(null=True, blank=True)
+
+
+class MarcaAgregacion(models.Model):
+    """
+    Último cambio procesado por una agregación y cuándo se procesó.
+    """
+    nombre = models.CharField(max_length=50, unique=True)
+    ultimo_cambio = models.BigIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(null=True, blank=True)
+
+
+class PronosticoStock(models.Model):
+    """
+    Ritmo de venta y días hasta agotar el stock de un producto, lo calcula
+    cada noche store.forecast. Sin ventas en la ventana los días quedan vacíos.
+    """
+    producto = models.OneToOneField(
+        Producto, primary_key=True, on_delete=models.CASCADE, related_name='pronostico')
+    fecha = models.DateField(verbose_name='Fecha')
+    cantidad = models.IntegerField(default=0, verbose_name='Cantidad')
+    tasa_media = models.DecimalField(
+        max_digits=12, decimal_places=3, default=0, verbose_name='Venta diaria promedio')
+    tasa_exponencial = models.DecimalField(
+        max_digits=12, decimal_places=3, default=0, verbose_name='Venta diaria suavizada')
+    dias_hasta_agotar = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, blank=True, verbose_name='Días hasta agotar')
+    cantidad_sugerida = models.PositiveIntegerField(default=0, verbose_name='Cantidad sugerida')
+    reponer = models.BooleanField(default=False, verbose_name='Reponer')
+
+    class Meta:
+        indexes = [
+            # Candidatos a reponer ordenados por urgencia
+            models.Index(fields=['reponer', 'dias_hasta_agotar'], name='pronostico_reponer_idx'),
+        ]
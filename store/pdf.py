@@ -0,0 +1,82 @@
+from collections import namedtuple
+from datetime import datetime
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from store import pdf_assets
+from store.models import Factura, OrdenMantenimiento, PagoFactura
+
+BASE_URL = getattr(settings, 'PDF_BASE_URL', 'http://localhost:8000/')
+
+Documento = namedtuple('Documento', ('model', 'template', 'titulo', 'asunto', 'nombre_archivo', 'url'))
+
+DOCUMENTOS = {
+    'ORDEN': Documento(OrdenMantenimiento, 'ordenMantenimiento/print.html',
+                       'Detalle de Órden', 'Órden de Mantenimiento', 'detalle.pdf', 'order-download'),
+    'FACTURA': Documento(Factura, 'factura/print.html', 'Factura', 'Factura', 'factura.pdf', 'invoice-download'),
+    'PAGO': Documento(PagoFactura, 'pagoFactura/print.html', 'Pago', 'Pago', 'pago.pdf',
+                      'invoice-payment-download'),
+}
+
+
+def url_descarga(tipo, objeto):
+    kwargs = {'pk': objeto.pk}
+    if tipo == 'PAGO':
+        kwargs['invoice_id'] = objeto.factura_id
+    return reverse(DOCUMENTOS[tipo].url, kwargs=kwargs)
+
+
+def contexto(tipo, objeto, usuario, fecha=None, archivado=False):
+    """
+    Contexto con el que se imprime cualquier documento, igual al de las vistas
+    de impresión. Los documentos archivados no muestran usuario ni fecha de
+    impresión para que su contenido no cambie entre descargas.
+    """
+    documento = DOCUMENTOS[tipo]
+    return {
+        'object': objeto,
+        'title': documento.titulo,
+        'asunto': documento.asunto,
+        'fecha': '' if archivado else (fecha or datetime.now()).strftime("%Y-%m-%d %H:%M:%S"),
+        'usuario': usuario,
+        'archivado': archivado,
+        'pdf': True,
+    }
+
+
+def renderizar_html(tipo, objeto, usuario, fecha=None, archivado=False):
+    return render_to_string(DOCUMENTOS[tipo].template, contexto(tipo, objeto, usuario, fecha, archivado))
+
+
+def convertir_pdf(html):
+    """
+    Convierte el HTML a PDF sin acceder a la red, los estilos y las imágenes
+    se leen desde disco.
+    """
+    from weasyprint import HTML
+    documento = HTML(string=html, base_url=BASE_URL, url_fetcher=pdf_assets.url_fetcher)
+    return documento.write_pdf(stylesheets=[pdf_assets.hoja_impresion()])
+
+
+def renderizar_pdf(tipo, objeto, usuario, fecha=None, archivado=False):
+    """
+    Genera el PDF del documento y devuelve su contenido.
+    """
+    return convertir_pdf(renderizar_html(tipo, objeto, usuario, fecha, archivado))
+
+
+def combinar_pdf(htmls):
+    """
+    Convierte varios documentos HTML en un solo PDF con las páginas de todos
+    ellos en el mismo orden.
+    """
+    from weasyprint import HTML
+    hojas = [pdf_assets.hoja_impresion()]
+    documentos = [HTML(string=html, base_url=BASE_URL, url_fetcher=pdf_assets.url_fetcher).render(stylesheets=hojas)
+                  for html in htmls]
+    if not documentos:
+        return b''
+    paginas = [pagina for documento in documentos for pagina in documento.pages]
+    return documentos[0].copy(paginas).write_pdf()
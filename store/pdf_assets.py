@@ -0,0 +1,118 @@
+import mimetypes
+import os
+import threading
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+
+from utils.permissions import CacheLRU
+
+HOJA_IMPRESION = 'css/reporte.css'
+MAX_ARCHIVOS = 256
+MAX_TAMANIO_ARCHIVO = 1024 * 1024
+
+archivos_locales = CacheLRU(MAX_ARCHIVOS)
+_hoja = None
+_hoja_lock = threading.Lock()
+
+
+class RecursoExterno(ValueError):
+    """
+    Se lanza cuando un documento intenta cargar un recurso que no está en el servidor.
+    """
+
+
+def hosts_locales():
+    """
+    Hosts que se consideran el propio servidor, las URL relativas de los
+    templates se resuelven contra PDF_BASE_URL.
+    """
+    base = urlparse(getattr(settings, 'PDF_BASE_URL', 'http://localhost:8000/'))
+    return {'', base.netloc}
+
+
+def ruta_dentro(raiz, relativa):
+    """
+    Une la ruta relativa a la raíz y evita que se salga de ella.
+    """
+    raiz = os.path.abspath(raiz)
+    ruta = os.path.abspath(os.path.join(raiz, relativa))
+    if os.path.commonpath([raiz, ruta]) != raiz:
+        return None
+    return ruta
+
+
+def ruta_estatico(relativa):
+    if settings.STATIC_ROOT:
+        ruta = ruta_dentro(settings.STATIC_ROOT, relativa)
+        if ruta and os.path.isfile(ruta):
+            return ruta
+    try:
+        return finders.find(relativa)
+    except SuspiciousFileOperation:
+        return None
+
+
+def resolver(url):
+    """
+    Devuelve la ruta en disco del archivo estático o de media al que apunta la
+    URL, o None si no corresponde a un archivo del servidor.
+    """
+    partes = urlparse(url)
+    if partes.scheme not in ('http', 'https', '') or partes.netloc not in hosts_locales():
+        return None
+    camino = unquote(partes.path)
+    if camino.startswith(settings.STATIC_URL):
+        return ruta_estatico(camino[len(settings.STATIC_URL):])
+    if settings.MEDIA_URL and camino.startswith(settings.MEDIA_URL):
+        return ruta_dentro(settings.MEDIA_ROOT, camino[len(settings.MEDIA_URL):])
+    return None
+
+
+def leer(ruta):
+    """
+    Lee el archivo guardando en memoria del proceso los archivos pequeños.
+    """
+    estado = os.stat(ruta)
+    clave = (ruta, estado.st_mtime)
+    contenido = archivos_locales.get(clave)
+    if contenido is None:
+        with open(ruta, 'rb') as archivo:
+            contenido = archivo.read()
+        if estado.st_size <= MAX_TAMANIO_ARCHIVO:
+            archivos_locales.set(clave, contenido)
+    return contenido
+
+
+def url_fetcher(url):
+    """
+    Fetcher de WeasyPrint que sirve los archivos estáticos y de media desde
+    disco y falla de inmediato con cualquier otra URL, por lo que generar un
+    PDF nunca hace peticiones de red.
+    """
+    if url.startswith('data:'):
+        from weasyprint import default_url_fetcher
+        return default_url_fetcher(url)
+    ruta = resolver(url)
+    if ruta is None or not os.path.isfile(ruta):
+        raise RecursoExterno('Recurso no disponible para reportes: {}'.format(url))
+    return {
+        'string': leer(ruta),
+        'mime_type': mimetypes.guess_type(ruta)[0] or 'application/octet-stream',
+        'redirected_url': url,
+    }
+
+
+def hoja_impresion():
+    """
+    Hoja de estilos de los reportes ya interpretada, se carga una sola vez por proceso.
+    """
+    global _hoja
+    with _hoja_lock:
+        if _hoja is None:
+            from weasyprint import CSS
+            ruta = ruta_estatico(HOJA_IMPRESION)
+            _hoja = CSS(string=leer(ruta).decode('utf-8'), url_fetcher=url_fetcher)
+        return _hoja
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import File
+from django.db import connections
+
+from store import jobs, pdf, pdf_cache
+from store.models import Factura, OrdenMantenimiento, TrabajoPdf
+
+TRABAJADORES = getattr(settings, 'PDF_LOTE_TRABAJADORES', 4)
+MAXIMO = getattr(settings, 'PDF_LOTE_MAXIMO', 2000)
+TAMANIO_BLOQUE = 64 * 1024
+PREFIJO_TRABAJO = 'EXPORTACION_'
+
+CAMPOS_FECHA = {'FACTURA': 'fecha_venta', 'ORDEN': 'fecha_registro'}
+MODELOS = {'FACTURA': Factura, 'ORDEN': OrdenMantenimiento}
+
+
+class ExportacionExcedida(ValidationError):
+    """
+    Los filtros seleccionan más documentos de los que se exportan en un lote.
+    """
+
+
+class SalidaZip(object):
+    """
+    Destino no posicionable de un ZipFile que acumula lo escrito hasta que se vacía.
+    """
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def filtrar(tipo, desde=None, hasta=None, cliente=None, estado=None):
+    """
+    Ids de las facturas u órdenes que cumplen los filtros, ordenadas por
+    fecha. Si son más del máximo de un lote se rechazan en lugar de exportar
+    solo una parte.
+    """
+    campo_fecha = CAMPOS_FECHA[tipo]
+    documentos = MODELOS[tipo].objects.all()
+    if desde:
+        documentos = documentos.filter(**{campo_fecha + '__gte': desde})
+    if hasta:
+        documentos = documentos.filter(**{campo_fecha + '__lte': hasta})
+    if cliente:
+        documentos = documentos.filter(cliente_id=cliente)
+    if estado:
+        documentos = documentos.filter(estado=estado)
+    ids = list(documentos.order_by(campo_fecha, 'id').values_list('id', flat=True)[:MAXIMO + 1])
+    if len(ids) > MAXIMO:
+        raise ExportacionExcedida(
+            'Los filtros seleccionan más de %(maximo)s documentos, acote las fechas o el cliente.',
+            code='exportacion_excedida', params={'maximo': MAXIMO})
+    return ids
+
+
+def nombre_archivo(tipo, objeto_id):
+    return '{}-{:06d}.pdf'.format(tipo.lower(), objeto_id)
+
+
+def renderizar(tipo, objeto_id):
+    """
+    Genera el PDF archivado de un documento, reutilizando la caché de PDF si
+    el documento es final. Se ejecuta en los procesos del pool.
+    """
+    objeto = pdf.DOCUMENTOS[tipo].model.objects.get(pk=objeto_id)
+    html = pdf.renderizar_html(tipo, objeto, None, archivado=True)
+    final = pdf_cache.es_final(tipo, objeto)
+    if final:
+        clave = pdf_cache.calcular_clave(html)
+        archivo = pdf_cache.obtener(tipo, objeto_id, clave)
+        if archivo is not None:
+            try:
+                with open(archivo, 'rb') as guardado:
+                    return nombre_archivo(tipo, objeto_id), guardado.read()
+            except FileNotFoundError:
+                pass
+    contenido = pdf.convertir_pdf(html)
+    if final:
+        pdf_cache.guardar(tipo, objeto_id, clave, contenido)
+    return nombre_archivo(tipo, objeto_id), contenido
+
+
+def renderizar_combinado(tipo, ids):
+    htmls = []
+    for objeto in pdf.DOCUMENTOS[tipo].model.objects.filter(pk__in=ids).order_by(CAMPOS_FECHA[tipo], 'id'):
+        htmls.append(pdf.renderizar_html(tipo, objeto, None, archivado=True))
+    return pdf.combinar_pdf(htmls)
+
+
+def generar_en_paralelo(tipo, ids, trabajadores=TRABAJADORES, al_avanzar=None):
+    """
+    Genera los PDF en un pool de procesos y los entrega en el orden de ids. Solo
+    hay unos pocos documentos en vuelo a la vez, así la memoria usada no crece
+    con el tamaño del lote. Con un solo trabajador se generan en este proceso.
+    """
+    if trabajadores <= 1:
+        for hechos, objeto_id in enumerate(ids, 1):
+            resultado = renderizar(tipo, objeto_id)
+            if al_avanzar:
+                al_avanzar(hechos, len(ids))
+            yield resultado
+        return
+    connections.close_all()
+    pendientes = iter(ids)
+    with ProcessPoolExecutor(max_workers=trabajadores, initializer=jobs.inicializar_proceso) as pool:
+        en_vuelo = deque(pool.submit(renderizar, tipo, objeto_id)
+                         for objeto_id in islice(pendientes, trabajadores * 2))
+        hechos = 0
+        while en_vuelo:
+            nombre, contenido = en_vuelo.popleft().result()
+            siguiente = next(pendientes, None)
+            if siguiente is not None:
+                en_vuelo.append(pool.submit(renderizar, tipo, siguiente))
+            hechos += 1
+            if al_avanzar:
+                al_avanzar(hechos, len(ids))
+            yield nombre, contenido
+
+
+def exportar_zip(tipo, ids, trabajadores=TRABAJADORES, al_avanzar=None):
+    """
+    Genera el ZIP con los PDF por partes, cada documento se escribe y se
+    entrega en cuanto está listo.
+    """
+    salida = SalidaZip()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as archivo_zip:
+        for nombre, contenido in generar_en_paralelo(tipo, ids, trabajadores, al_avanzar):
+            archivo_zip.writestr(nombre, contenido)
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+
+def exportar_pdf(tipo, ids, al_avanzar=None):
+    """
+    Genera un solo PDF con todos los documentos. Las páginas se unen en un
+    proceso aparte y el resultado se entrega por bloques.
+    """
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=1, initializer=jobs.inicializar_proceso) as pool:
+        contenido = pool.submit(renderizar_combinado, tipo, ids).result()
+    if al_avanzar:
+        al_avanzar(len(ids), len(ids))
+    for inicio in range(0, len(contenido), TAMANIO_BLOQUE):
+        yield contenido[inicio:inicio + TAMANIO_BLOQUE]
+
+
+def solicitar(tipo, usuario, nombre, desde=None, hasta=None, cliente=None, estado=None, formato='zip'):
+    """
+    Encola la exportación de los documentos que cumplen los filtros. Se
+    rechaza antes de encolarla si excede el máximo de un lote, la misma
+    exportación pedida otra vez por el usuario devuelve el trabajo en curso.
+    """
+    filtrar(tipo, desde, hasta, cliente, estado)
+    parametros = json.dumps({'desde': desde.isoformat() if desde else None,
+                             'hasta': hasta.isoformat() if hasta else None,
+                             'cliente': cliente, 'estado': estado or None, 'formato': formato}, sort_keys=True)
+    clave = '{}{}:{}:{}'.format(PREFIJO_TRABAJO, tipo, usuario.pk,
+                                hashlib.sha1(parametros.encode('utf-8')).hexdigest()[:16])
+    return jobs.solicitar(PREFIJO_TRABAJO + tipo, 0, usuario, clave=clave, parametros=parametros,
+                          nombre_archivo='{}.{}'.format(nombre, formato))
+
+
+def generar_trabajo(trabajo):
+    """
+    Genera la exportación de un trabajo, el ZIP se escribe en un archivo
+    temporal a medida que se generan los documentos y el avance se guarda en
+    el trabajo para que el usuario lo consulte. Los documentos se generan uno
+    tras otro en el proceso del trabajo, así cada exportación ocupa un solo
+    trabajador del pool de store.jobs.
+    """
+    tipo = trabajo.tipo[len(PREFIJO_TRABAJO):]
+    filtros = json.loads(trabajo.parametros)
+    formato = filtros.pop('formato')
+    ids = filtrar(tipo, **filtros)
+
+    def al_avanzar(hechos, total):
+        TrabajoPdf.objects.filter(pk=trabajo.pk).update(hechos=hechos, total=total)
+
+    al_avanzar(0, len(ids))
+    if formato == 'pdf':
+        contenido = renderizar_combinado(tipo, ids)
+        al_avanzar(len(ids), len(ids))
+        return trabajo.nombre_archivo, contenido
+    archivo = tempfile.TemporaryFile()
+    for parte in exportar_zip(tipo, ids, 1, al_avanzar):
+        archivo.write(parte)
+    return trabajo.nombre_archivo, File(archivo, name=trabajo.nombre_archivo)
@@ -0,0 +1,172 @@
+import glob
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import quote_etag
+
+from store import pdf, pdf_assets
+
+PATRON_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def directorio():
+    return getattr(settings, 'PDF_CACHE_DIR', os.path.join(settings.BASE_DIR, 'cache', 'pdf'))
+
+
+def tamanio_maximo():
+    return getattr(settings, 'PDF_CACHE_TAMANIO', 512 * 1024 * 1024)
+
+
+def es_final(tipo, objeto):
+    """
+    Indica si el documento ya no puede cambiar y su PDF puede reutilizarse.
+    """
+    if tipo == 'FACTURA':
+        return objeto.estado == 'PAGADO'
+    if tipo == 'ORDEN':
+        return objeto.estado == 'FINALIZADO'
+    if tipo == 'PAGO':
+        return objeto.factura.estado == 'PAGADO'
+    return False
+
+
+def calcular_clave(html):
+    """
+    La clave depende del HTML del documento, que ya refleja sus datos y las
+    plantillas, de la hoja de estilos de impresión y de la versión configurada
+    para las imágenes.
+    """
+    version = getattr(settings, 'PDF_PLANTILLAS_VERSION', '1')
+    clave = hashlib.sha256('{}\n{}'.format(version, html).encode('utf-8'))
+    clave.update(pdf_assets.leer(pdf_assets.ruta_estatico(pdf_assets.HOJA_IMPRESION)))
+    return clave.hexdigest()
+
+
+def clave_documento(tipo, objeto):
+    return calcular_clave(pdf.renderizar_html(tipo, objeto, None, archivado=True))
+
+
+def ruta(tipo, objeto_id, clave):
+    return os.path.join(directorio(), '{}-{}-{}.pdf'.format(tipo, objeto_id, clave))
+
+
+def obtener(tipo, objeto_id, clave):
+    """
+    Devuelve la ruta del PDF guardado o None si no existe. Actualiza la fecha
+    de modificación del archivo para el desalojo LRU.
+    """
+    archivo = ruta(tipo, objeto_id, clave)
+    try:
+        os.utime(archivo)
+    except FileNotFoundError:
+        return None
+    return archivo
+
+
+def guardar(tipo, objeto_id, clave, contenido):
+    """
+    Guarda el PDF escribiendo un archivo temporal y renombrándolo, de modo que
+    nunca se sirve un archivo a medio escribir.
+    """
+    os.makedirs(directorio(), exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio(), suffix='.tmp')
+    with os.fdopen(descriptor, 'wb') as archivo:
+        archivo.write(contenido)
+    destino = ruta(tipo, objeto_id, clave)
+    os.replace(temporal, destino)
+    desalojar()
+    return destino
+
+
+def invalidar(tipo, objeto_id):
+    """
+    Elimina todas las versiones guardadas del documento.
+    """
+    eliminados = 0
+    for archivo in glob.glob(os.path.join(directorio(), '{}-{}-*.pdf'.format(tipo, objeto_id))):
+        try:
+            os.remove(archivo)
+            eliminados += 1
+        except FileNotFoundError:
+            pass
+    return eliminados
+
+
+def desalojar():
+    """
+    Elimina los PDF usados hace más tiempo hasta que el directorio ocupe menos
+    del tamaño máximo configurado.
+    """
+    archivos = []
+    for entrada in os.scandir(directorio()):
+        if entrada.name.endswith('.pdf'):
+            estado = entrada.stat()
+            archivos.append((estado.st_mtime, estado.st_size, entrada.path))
+    total = sum(tamanio for _, tamanio, _ in archivos)
+    eliminados = 0
+    for _, tamanio, archivo in sorted(archivos):
+        if total <= tamanio_maximo():
+            break
+        try:
+            os.remove(archivo)
+        except FileNotFoundError:
+            pass
+        total -= tamanio
+        eliminados += 1
+    return eliminados
+
+
+def leer_rango(cabecera, tamanio):
+    """
+    Interpreta una cabecera Range de un solo rango. Devuelve (inicio, fin),
+    None si la cabecera no aplica o False si el rango no es satisfacible.
+    """
+    coincidencia = PATRON_RANGO.match(cabecera or '')
+    if coincidencia is None or coincidencia.groups() == ('', ''):
+        return None
+    inicio, fin = coincidencia.groups()
+    if inicio == '':
+        inicio, fin = max(tamanio - int(fin), 0), tamanio - 1
+    else:
+        inicio, fin = int(inicio), min(int(fin), tamanio - 1) if fin else tamanio - 1
+    if inicio > fin or inicio >= tamanio:
+        return False
+    return inicio, fin
+
+
+def respuesta(request, archivo, clave, nombre):
+    """
+    Sirve el PDF guardado con ETag y soporte de rangos. Si está configurado
+    PDF_SENDFILE_HEADER delega el envío del archivo al servidor web.
+    """
+    etag = quote_etag(clave)
+    if etag in [valor.strip() for valor in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    cabecera_sendfile = getattr(settings, 'PDF_SENDFILE_HEADER', None)
+    tamanio = os.path.getsize(archivo)
+    rango = leer_rango(request.META.get('HTTP_RANGE'), tamanio)
+    if cabecera_sendfile:
+        response = HttpResponse(content_type='application/pdf')
+        response[cabecera_sendfile] = getattr(settings, 'PDF_SENDFILE_URL', '/protected/pdf/') + os.path.basename(archivo)
+    elif rango is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(tamanio)
+        return response
+    elif rango:
+        inicio, fin = rango
+        with open(archivo, 'rb') as contenido:
+            contenido.seek(inicio)
+            response = HttpResponse(contenido.read(fin - inicio + 1), status=206, content_type='application/pdf')
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(inicio, fin, tamanio)
+    else:
+        response = FileResponse(open(archivo, 'rb'), content_type='application/pdf')
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(nombre)
+    return response
@@ -0,0 +1,166 @@
+import json
+import time
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from store import jobs, pdf
+from store.models import Cliente, Factura, PagoFactura
+
+CACHE_VERSION_KEY = 'cartera:version'
+CACHE_REPORTE_KEY = 'cartera:{}:{}'
+CACHE_TIMEOUT = getattr(settings, 'CARTERA_CACHE_TIMEOUT', 60 * 60)
+TAMANIO_LOTE = 1000
+TEMPLATE_PDF = 'factura/cartera_print.html'
+
+# Último día de cada tramo de antigüedad, las facturas con más días quedan en el último
+LIMITES = np.array((30, 60, 90), dtype=np.int64)
+TRAMOS = ('0 a 30 días', '31 a 60 días', '61 a 90 días', 'Más de 90 días')
+
+FilaCartera = namedtuple('FilaCartera', ('cliente_id', 'identificacion', 'nombre', 'facturas', 'tramos', 'total'))
+Cartera = namedtuple('Cartera', ('fecha', 'filas', 'tramos', 'total'))
+
+
+def obtener_version():
+    version = cache.get(CACHE_VERSION_KEY)
+    if version is None:
+        cache.add(CACHE_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CACHE_VERSION_KEY)
+    return version
+
+
+def invalidar():
+    version = max(int(time.time() * 1000), (cache.get(CACHE_VERSION_KEY) or 0) + 1)
+    cache.set(CACHE_VERSION_KEY, version, None)
+
+
+def centavos(valores):
+    return np.array([int(valor * 100) for valor in valores], dtype=np.int64)
+
+
+def decimal(centavos_):
+    return Decimal(int(centavos_)).scaleb(-2)
+
+
+def facturas_abiertas(fecha):
+    """
+    Facturas emitidas hasta la fecha con saldo en esa fecha, anotadas con lo
+    pagado hasta la misma fecha. El saldo se compara en la base de datos, así
+    las facturas ya pagadas, la mayor parte del historial, no se leen.
+    """
+    pagado = PagoFactura.objects.filter(factura=OuterRef('pk'), fecha_pago__lte=fecha).order_by().values(
+        'factura').annotate(suma=Sum('monto')).values('suma')
+    return Factura.objects.filter(fecha_venta__lte=fecha).annotate(pagado=Coalesce(
+        Subquery(pagado), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2))).filter(
+        total__gt=F('pagado'))
+
+
+def leer_saldos(fecha):
+    """
+    Lee las facturas con saldo a la fecha con una sola consulta. Devuelve
+    arreglos con el cliente, la antigüedad en días y el saldo en centavos de
+    cada factura.
+    """
+    facturas = list(facturas_abiertas(fecha).order_by('id').values_list('cliente_id', 'fecha_venta', 'total',
+                                                                        'pagado'))
+    if not facturas:
+        vacio = np.zeros(0, dtype=np.int64)
+        return vacio, vacio, vacio
+    clientes, fechas, totales, pagados = zip(*facturas)
+    saldos = centavos(totales) - centavos(pagados)
+    dias = (np.datetime64(fecha, 'D') - np.array(fechas, dtype='datetime64[D]')).astype(np.int64)
+    return np.array(clientes, dtype=np.int64), dias, saldos
+
+
+def nombres_clientes(ids):
+    nombres = {}
+    for inicio in range(0, len(ids), TAMANIO_LOTE):
+        filas = Cliente.objects.filter(pk__in=ids[inicio:inicio + TAMANIO_LOTE]).values_list(
+            'pk', 'numero_identificacion', 'nombre', 'apellido')
+        nombres.update((pk, (identificacion, '{} {}'.format(nombre, apellido)))
+                       for pk, identificacion, nombre, apellido in filas)
+    return nombres
+
+
+def calcular(fecha):
+    """
+    Saldos por cobrar de cada cliente a la fecha, repartidos por antigüedad.
+    Cada factura con saldo recibe su tramo con np.searchsorted y la tabla de
+    clientes por tramo se suma con np.bincount, sin recorrer las facturas en
+    Python. Los clientes se ordenan de mayor a menor saldo.
+    """
+    clientes, dias, saldos = leer_saldos(fecha)
+    abiertas = saldos > 0
+    clientes, dias, saldos = clientes[abiertas], dias[abiertas], saldos[abiertas]
+    columnas = len(TRAMOS)
+    if not len(saldos):
+        return Cartera(fecha, [], [Decimal('0.00')] * columnas, Decimal('0.00'))
+
+    tramos = np.searchsorted(LIMITES, dias)
+    ids, filas = np.unique(clientes, return_inverse=True)
+    tabla = np.bincount(filas * columnas + tramos, weights=saldos, minlength=len(ids) * columnas)
+    tabla = np.rint(tabla).astype(np.int64).reshape(len(ids), columnas)
+    cantidades = np.bincount(filas, minlength=len(ids))
+    totales = tabla.sum(axis=1)
+    orden = np.lexsort((ids, -totales))
+
+    nombres = nombres_clientes(ids.tolist())
+    resultado = []
+    for posicion in orden:
+        cliente_id = int(ids[posicion])
+        identificacion, nombre = nombres.get(cliente_id, ('', ''))
+        resultado.append(FilaCartera(cliente_id, identificacion, nombre, int(cantidades[posicion]),
+                                     [decimal(valor) for valor in tabla[posicion]], decimal(totales[posicion])))
+    return Cartera(fecha, resultado, [decimal(valor) for valor in tabla.sum(axis=0)], decimal(totales.sum()))
+
+
+def reporte(fecha=None):
+    """
+    Cartera a la fecha indicada, por omisión la de hoy. Se guarda en caché
+    por fecha y se invalida al modificar facturas, pagos o clientes. La
+    versión vive en la caché compartida, que utils.permissions.verificar_cache
+    exige en producción, así la invalidación llega a todos los procesos; aun
+    así cada reporte vence a los CACHE_TIMEOUT segundos.
+    """
+    fecha = fecha or timezone.localdate()
+    clave = CACHE_REPORTE_KEY.format(obtener_version(), fecha.isoformat())
+    cartera = cache.get(clave)
+    if cartera is None:
+        cartera = calcular(fecha)
+        cache.set(clave, cartera, CACHE_TIMEOUT)
+    return cartera
+
+
+def contexto_pdf(cartera, usuario):
+    return {
+        'cartera': cartera, 'tramos': TRAMOS, 'title': 'Cartera', 'titulo': 'Cartera por antigüedad',
+        'asunto': 'Cuentas por cobrar', 'subtitulo': 'Corte al {}'.format(cartera.fecha.isoformat()),
+        'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'usuario': usuario, 'pdf': True,
+    }
+
+
+def solicitar_pdf(fecha, usuario):
+    """
+    Encola la generación del PDF de la cartera a la fecha, por omisión la de hoy.
+    """
+    fecha = fecha or timezone.localdate()
+    return jobs.solicitar('CARTERA', 0, usuario, clave='CARTERA:{}:{}'.format(fecha.isoformat(), usuario.pk),
+                          parametros=json.dumps({'fecha': fecha.isoformat()}),
+                          nombre_archivo='cartera-{}.pdf'.format(fecha.isoformat()))
+
+
+def generar_trabajo(trabajo):
+    """
+    Genera el PDF de la cartera de un trabajo a partir del reporte en caché.
+    """
+    cartera = reporte(date.fromisoformat(json.loads(trabajo.parametros)['fecha']))
+    html = render_to_string(TEMPLATE_PDF, contexto_pdf(cartera, trabajo.usuario))
+    return trabajo.nombre_archivo, pdf.convertir_pdf(html)
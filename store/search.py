@@ -0,0 +1,226 @@
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+
+from store.models import Cliente, DocumentoBusqueda, Factura, OrdenMantenimiento, Tecnico
+
+TABLA = DocumentoBusqueda._meta.db_table
+TABLA_FTS = TABLA + '_fts'
+MAX_RESULTADOS = 500
+TAMANIO_LOTE = 1000
+
+
+def componer_texto(*partes):
+    return ' '.join(str(parte) for parte in partes if parte)
+
+
+def guardar_documento(tipo, objeto_id, texto):
+    """
+    Actualiza el documento de búsqueda de un objeto, si no existe lo crea.
+    """
+    actualizados = DocumentoBusqueda.objects.filter(
+        tipo=tipo, objeto_id=objeto_id).update(texto=texto)
+    if actualizados == 0:
+        DocumentoBusqueda.objects.create(
+            tipo=tipo, objeto_id=objeto_id, texto=texto)
+
+
+def eliminar_documento(tipo, objeto_id):
+    DocumentoBusqueda.objects.filter(tipo=tipo, objeto_id=objeto_id).delete()
+
+
+def indexar_orden(orden):
+    cliente = orden.cliente
+    guardar_documento('ORDEN', orden.id, componer_texto(
+        orden.descripcion, cliente.nombre, cliente.apellido, cliente.numero_identificacion))
+
+
+def indexar_factura(factura):
+    cliente = factura.cliente
+    guardar_documento('FACTURA', factura.id, componer_texto(
+        cliente.nombre, cliente.apellido, cliente.numero_identificacion))
+
+
+def indexar_persona(tipo, persona):
+    guardar_documento(tipo, persona.id, componer_texto(
+        persona.nombre, persona.apellido, persona.numero_identificacion))
+
+
+def indexar_tecnico(tecnico):
+    indexar_persona('TECNICO', tecnico)
+
+
+def indexar_cliente(cliente):
+    """
+    Indexa el cliente y vuelve a indexar en lote sus órdenes y facturas, ya
+    que el documento de cada una contiene los datos del cliente.
+    """
+    indexar_persona('CLIENTE', cliente)
+    indexar_ordenes(OrdenMantenimiento.objects.filter(cliente_id=cliente.id).values('id'))
+    indexar_facturas(Factura.objects.filter(cliente_id=cliente.id).values('id'))
+
+
+def reemplazar_documentos(tipo, ids, filas):
+    """
+    Reemplaza los documentos del tipo indicado de los ids por los de las
+    filas (objeto_id, *partes del texto).
+    """
+    documentos = [DocumentoBusqueda(tipo=tipo, objeto_id=fila[0], texto=componer_texto(*fila[1:]))
+                  for fila in filas]
+    DocumentoBusqueda.objects.filter(tipo=tipo, objeto_id__in=ids).delete()
+    DocumentoBusqueda.objects.bulk_create(documentos, batch_size=TAMANIO_LOTE)
+
+
+def indexar_ordenes(ids):
+    """
+    Indexa en lote las órdenes indicadas.
+    """
+    reemplazar_documentos('ORDEN', ids, OrdenMantenimiento.objects.filter(pk__in=ids).values_list(
+        'id', 'descripcion', 'cliente__nombre', 'cliente__apellido', 'cliente__numero_identificacion'))
+
+
+def indexar_facturas(ids):
+    """
+    Indexa en lote las facturas indicadas, se usa cuando se crean con bulk_create.
+    """
+    reemplazar_documentos('FACTURA', ids, Factura.objects.filter(pk__in=ids).values_list(
+        'id', 'cliente__nombre', 'cliente__apellido', 'cliente__numero_identificacion'))
+
+
+def indexar_clientes(ids):
+    """
+    Indexa en lote los clientes indicados, se usa cuando se importan con bulk_create.
+    """
+    reemplazar_documentos('CLIENTE', ids, Cliente.objects.filter(pk__in=ids).values_list(
+        'id', 'nombre', 'apellido', 'numero_identificacion'))
+
+
+def filas_documentos():
+    """
+    Genera las tuplas (tipo, objeto_id, texto) de todos los documentos a indexar.
+    """
+    ordenes = OrdenMantenimiento.objects.values_list(
+        'id', 'descripcion', 'cliente__nombre', 'cliente__apellido', 'cliente__numero_identificacion')
+    for fila in ordenes.iterator(chunk_size=TAMANIO_LOTE):
+        yield 'ORDEN', fila[0], componer_texto(*fila[1:])
+    facturas = Factura.objects.values_list(
+        'id', 'cliente__nombre', 'cliente__apellido', 'cliente__numero_identificacion')
+    for fila in facturas.iterator(chunk_size=TAMANIO_LOTE):
+        yield 'FACTURA', fila[0], componer_texto(*fila[1:])
+    for tipo, model in (('CLIENTE', Cliente), ('TECNICO', Tecnico)):
+        personas = model.objects.values_list('id', 'nombre', 'apellido', 'numero_identificacion')
+        for fila in personas.iterator(chunk_size=TAMANIO_LOTE):
+            yield tipo, fila[0], componer_texto(*fila[1:])
+
+
+def reindexar():
+    """
+    Reconstruye todos los documentos de búsqueda.
+    """
+    DocumentoBusqueda.objects.all().delete()
+    total = 0
+    lote = []
+    for tipo, objeto_id, texto in filas_documentos():
+        lote.append(DocumentoBusqueda(tipo=tipo, objeto_id=objeto_id, texto=texto))
+        if len(lote) >= TAMANIO_LOTE:
+            DocumentoBusqueda.objects.bulk_create(lote)
+            total += len(lote)
+            lote = []
+    DocumentoBusqueda.objects.bulk_create(lote)
+    return total + len(lote)
+
+
+def buscar_postgresql(tipo, palabras, limite=None):
+    consulta = ' & '.join('{}:*'.format(palabra) for palabra in palabras)
+    sql = "SELECT objeto_id FROM {0} WHERE tipo = %s AND vector @@ to_tsquery('simple', %s)".format(TABLA)
+    if limite is None:
+        return sql, [tipo, consulta]
+    sql += " ORDER BY ts_rank(vector, to_tsquery('simple', %s)) DESC, objeto_id DESC LIMIT %s"
+    return sql, [tipo, consulta, consulta, limite]
+
+
+def buscar_sqlite(tipo, palabras, limite=None):
+    consulta = ' '.join('"{}"*'.format(palabra) for palabra in palabras)
+    sql = ("SELECT d.objeto_id FROM {1} JOIN {0} d ON d.id = {1}.rowid "
+           "WHERE {1} MATCH %s AND d.tipo = %s").format(TABLA, TABLA_FTS)
+    if limite is None:
+        return sql, [consulta, tipo]
+    sql += " ORDER BY {0}.rank, d.objeto_id DESC LIMIT %s".format(TABLA_FTS)
+    return sql, [consulta, tipo, limite]
+
+
+def buscar_mysql(tipo, palabras, limite=None):
+    consulta = ' '.join('+{}*'.format(palabra) for palabra in palabras)
+    sql = ("SELECT objeto_id FROM {0} WHERE tipo = %s "
+           "AND MATCH (texto) AGAINST (%s IN BOOLEAN MODE)").format(TABLA)
+    if limite is None:
+        return sql, [tipo, consulta]
+    sql += " ORDER BY MATCH (texto) AGAINST (%s IN BOOLEAN MODE) DESC, objeto_id DESC LIMIT %s"
+    return sql, [tipo, consulta, consulta, limite]
+
+
+BUSCADORES = {
+    'postgresql': buscar_postgresql,
+    'sqlite': buscar_sqlite,
+    'mysql': buscar_mysql,
+}
+
+
+def documentos_coincidentes(tipo, palabras, termino):
+    """
+    Documentos del tipo indicado que contienen todas las palabras, se usa
+    cuando el motor no tiene índice de texto.
+    """
+    documentos = DocumentoBusqueda.objects.filter(tipo=tipo)
+    for palabra in palabras or [termino]:
+        documentos = documentos.filter(texto__icontains=palabra)
+    return documentos
+
+
+def buscar(tipo, termino, limite=MAX_RESULTADOS):
+    """
+    Devuelve los ids de los objetos del tipo indicado que coinciden con el
+    término ordenados por relevancia, como mucho limite. Usa el índice de
+    texto del motor de base de datos y si no existe uno busca sobre el texto
+    desnormalizado.
+    """
+    palabras = re.findall(r'\w+', termino.lower())
+    buscador = BUSCADORES.get(connection.vendor)
+    if buscador is None or not palabras:
+        documentos = documentos_coincidentes(tipo, palabras, termino)
+        return list(documentos.order_by('-objeto_id').values_list('objeto_id', flat=True)[:limite])
+    sql, parametros = buscador(tipo, palabras, limite)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def coincidencias(tipo, termino):
+    """
+    Subconsulta con los ids de todos los objetos del tipo indicado que
+    coinciden con el término, sin límite ni orden.
+    """
+    palabras = re.findall(r'\w+', termino.lower())
+    buscador = BUSCADORES.get(connection.vendor)
+    if buscador is None or not palabras:
+        return documentos_coincidentes(tipo, palabras, termino).values('objeto_id')
+    return RawSQL(*buscador(tipo, palabras))
+
+
+def filtrar(queryset, tipo, termino, relevancia=True):
+    """
+    Filtra el queryset con todos los resultados de la búsqueda. El límite de
+    resultados solo se aplica al orden por relevancia: los MAX_RESULTADOS más
+    relevantes van primero y el resto después, del más reciente al más antiguo.
+    Sin relevancia se conserva el orden del queryset.
+    """
+    if not relevancia:
+        return queryset.filter(pk__in=coincidencias(tipo, termino))
+    ids = buscar(tipo, termino, MAX_RESULTADOS)
+    if not ids:
+        return queryset.none()
+    relevancia = Case(*[When(pk=pk, then=posicion) for posicion, pk in enumerate(ids)],
+                      default=Value(len(ids)), output_field=IntegerField())
+    return queryset.filter(pk__in=coincidencias(tipo, termino)).order_by(relevancia, '-pk')
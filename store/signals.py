@@ -0,0 +1,252 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from store import analytics, catalog, company, dashboard, images, pdf_cache, receivables, search, stock, workflow
+from store.models import (Categoria, Cliente, DetalleCompra, DetalleFactura, DetalleOrden, Empresa, Factura,
+                          OrdenMantenimiento, PagoFactura, Producto, Tecnico)
+
+
+def campos_modificados(update_fields, campos):
+    """
+    Indica si un guardado pudo modificar alguno de los campos indicados.
+    """
+    return update_fields is None or bool(set(update_fields) & set(campos))
+
+
+@receiver(post_save, sender=OrdenMantenimiento)
+def indexar_orden(sender, instance, update_fields=None, **kwargs):
+    if campos_modificados(update_fields, ('descripcion', 'cliente')):
+        search.indexar_orden(instance)
+
+
+@receiver(post_save, sender=Factura)
+def indexar_factura(sender, instance, update_fields=None, **kwargs):
+    if campos_modificados(update_fields, ('cliente',)):
+        search.indexar_factura(instance)
+
+
+@receiver(post_save, sender=Cliente)
+def indexar_cliente(sender, instance, update_fields=None, **kwargs):
+    if campos_modificados(update_fields, ('nombre', 'apellido', 'numero_identificacion')):
+        search.indexar_cliente(instance)
+
+
+@receiver(post_save, sender=Tecnico)
+def indexar_tecnico(sender, instance, update_fields=None, **kwargs):
+    if campos_modificados(update_fields, ('nombre', 'apellido', 'numero_identificacion')):
+        search.indexar_tecnico(instance)
+
+
+@receiver(post_delete, sender=OrdenMantenimiento)
+def eliminar_orden(sender, instance, **kwargs):
+    search.eliminar_documento('ORDEN', instance.id)
+
+
+@receiver(post_delete, sender=Factura)
+def eliminar_factura(sender, instance, **kwargs):
+    search.eliminar_documento('FACTURA', instance.id)
+
+
+@receiver(post_delete, sender=Cliente)
+def eliminar_cliente(sender, instance, **kwargs):
+    search.eliminar_documento('CLIENTE', instance.id)
+
+
+@receiver(post_delete, sender=Tecnico)
+def eliminar_tecnico(sender, instance, **kwargs):
+    search.eliminar_documento('TECNICO', instance.id)
+
+
+def linea_anterior(sender, instance):
+    """
+    Devuelve el producto y cantidad que tenía la línea antes de modificarse
+    para aplicar al stock solo la diferencia.
+    """
+    if instance.pk is None:
+        return None
+    return sender.objects.filter(pk=instance.pk).values_list('producto_id', 'cantidad').first()
+
+
+@receiver(pre_save, sender=DetalleCompra)
+def registrar_compra(sender, instance, **kwargs):
+    stock.registrar_movimiento(stock.COMPRA, instance.producto_id, instance.cantidad,
+                               linea_anterior(sender, instance))
+
+
+@receiver(pre_save, sender=DetalleFactura)
+def registrar_venta(sender, instance, **kwargs):
+    """
+    Reserva el stock antes de guardar la línea, si no alcanza la línea no se guarda.
+    """
+    stock.registrar_movimiento(stock.VENTA, instance.producto_id, instance.cantidad,
+                               linea_anterior(sender, instance))
+
+
+@receiver(post_delete, sender=DetalleCompra)
+def revertir_compra(sender, instance, **kwargs):
+    stock.ajustar(instance.producto_id, -instance.cantidad)
+
+
+@receiver(post_delete, sender=DetalleFactura)
+def revertir_venta(sender, instance, **kwargs):
+    stock.ajustar(instance.producto_id, instance.cantidad)
+
+
+@receiver(pre_save, sender=Producto)
+def recordar_producto(sender, instance, update_fields=None, **kwargs):
+    """
+    Guarda la categoría e imagen anteriores del producto para invalidar la
+    categoría y regenerar las miniaturas si cambian.
+    """
+    instance._anterior = None
+    if instance.pk is not None and campos_modificados(update_fields, ('categoria', 'image')):
+        instance._anterior = sender.objects.filter(
+            pk=instance.pk).values_list('categoria_id', 'image').first()
+
+
+@receiver(post_save, sender=Producto)
+def invalidar_producto(sender, instance, created=False, update_fields=None, **kwargs):
+    categoria_anterior, imagen_anterior = getattr(instance, '_anterior', None) or (None, None)
+    if campos_modificados(update_fields, ('nombre', 'precio', 'image', 'categoria')):
+        catalog.invalidar_catalogo(instance.categoria_id, categoria_anterior)
+    imagen_cambiada = created or (campos_modificados(update_fields, ('image',)) and
+                                  imagen_anterior != instance.image.name)
+    if imagen_cambiada and instance.image:
+        if instance.image_hash:
+            sender.objects.filter(pk=instance.pk).update(image_hash='')
+            instance.image_hash = ''
+        transaction.on_commit(partial(images.programar, instance.pk, instance.image.name))
+
+
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_categoria(sender, instance, **kwargs):
+    catalog.invalidar_catalogo(instance.categoria_id if sender is Producto else instance.id)
+
+
+@receiver(post_save, sender=Empresa)
+@receiver(post_delete, sender=Empresa)
+def invalidar_empresa(sender, instance, **kwargs):
+    company.invalidar_empresa()
+
+
+@receiver(post_save, sender=DetalleFactura)
+@receiver(post_delete, sender=DetalleFactura)
+def invalidar_pdf_factura(sender, instance, **kwargs):
+    pdf_cache.invalidar('FACTURA', instance.factura_id)
+
+
+@receiver(post_save, sender=PagoFactura)
+@receiver(post_delete, sender=PagoFactura)
+def invalidar_pdf_pago(sender, instance, **kwargs):
+    pdf_cache.invalidar('FACTURA', instance.factura_id)
+    pdf_cache.invalidar('PAGO', instance.id)
+
+
+@receiver(post_save, sender=DetalleOrden)
+@receiver(post_delete, sender=DetalleOrden)
+def invalidar_pdf_orden(sender, instance, **kwargs):
+    pdf_cache.invalidar('ORDEN', instance.orden_mantenimiento_id)
+
+
+CAMPOS_RESUMEN = {
+    OrdenMantenimiento: ('empresa', 'fecha_registro', 'estado', 'monto_servicio'),
+    DetalleOrden: ('orden_mantenimiento', 'estado', 'precio_servicio'),
+    Factura: ('empresa', 'fecha_venta', 'estado', 'total', 'monto_pagado'),
+}
+
+
+@receiver(pre_save, sender=OrdenMantenimiento)
+@receiver(pre_save, sender=DetalleOrden)
+@receiver(pre_save, sender=Factura)
+def recordar_resumen(sender, instance, update_fields=None, **kwargs):
+    instance._resumen_anterior = None
+    if campos_modificados(update_fields, CAMPOS_RESUMEN[sender]):
+        dashboard.recordar(sender, instance)
+
+
+@receiver(pre_save, sender=OrdenMantenimiento)
+def validar_estado_orden(sender, instance, **kwargs):
+    """
+    Todo cambio de estado de una orden que se guarda se valida aquí contra el
+    estado guardado que leyó recordar_resumen. Los UPDATE en bloque de
+    store.workflow solo hacen transiciones permitidas por construcción.
+    """
+    anterior = getattr(instance, '_resumen_anterior', None)
+    if anterior is not None:
+        workflow.validar_orden(anterior['estado'], instance.estado)
+
+
+@receiver(post_save, sender=OrdenMantenimiento)
+@receiver(post_save, sender=DetalleOrden)
+@receiver(post_save, sender=Factura)
+def actualizar_resumen(sender, instance, update_fields=None, **kwargs):
+    if campos_modificados(update_fields, CAMPOS_RESUMEN[sender]):
+        dashboard.registrar_guardado(sender, instance)
+
+
+@receiver(post_delete, sender=OrdenMantenimiento)
+@receiver(post_delete, sender=DetalleOrden)
+@receiver(post_delete, sender=Factura)
+def descontar_resumen(sender, instance, **kwargs):
+    dashboard.registrar_eliminado(sender, instance)
+
+
+@receiver(post_save, sender=DetalleOrden)
+def contar_detalle(sender, instance, update_fields=None, **kwargs):
+    """
+    Mueve los contadores de la orden con el estado anterior que registró
+    recordar_resumen y ajusta el estado de las órdenes afectadas.
+    """
+    if campos_modificados(update_fields, ('orden_mantenimiento', 'estado')):
+        anterior = getattr(instance, '_resumen_anterior', None)
+        ordenes = workflow.mover_detalle(
+            (anterior['orden_mantenimiento_id'], anterior['estado']) if anterior else None,
+            (instance.orden_mantenimiento_id, instance.estado))
+        for orden_id in ordenes:
+            workflow.sincronizar_orden(orden_id)
+
+
+@receiver(post_delete, sender=DetalleOrden)
+def descontar_detalle(sender, instance, **kwargs):
+    """
+    Solo descuenta los contadores, el estado de la orden no se ajusta aquí
+    porque el detalle puede eliminarse junto con su orden.
+    """
+    workflow.mover_detalle((instance.orden_mantenimiento_id, instance.estado), None)
+
+
+@receiver(post_save, sender=DetalleFactura)
+@receiver(post_delete, sender=DetalleFactura)
+def marcar_venta(sender, instance, **kwargs):
+    analytics.marcar(facturas=[instance.factura_id])
+
+
+@receiver(post_save, sender=Factura)
+def marcar_fecha_factura(sender, instance, **kwargs):
+    """
+    Si cambió la fecha de la factura se vuelven a sumar el día anterior,
+    con el estado que registró recordar_resumen, y el nuevo.
+    """
+    anterior = getattr(instance, '_resumen_anterior', None)
+    if anterior and anterior['fecha_venta'] != instance.fecha_venta:
+        analytics.marcar(fechas=[anterior['fecha_venta']], facturas=[instance.id])
+
+
+@receiver(post_delete, sender=Factura)
+def marcar_factura_eliminada(sender, instance, **kwargs):
+    analytics.marcar(fechas=[instance.fecha_venta])
+
+
+@receiver(post_save, sender=Factura)
+@receiver(post_delete, sender=Factura)
+@receiver(post_save, sender=PagoFactura)
+@receiver(post_delete, sender=PagoFactura)
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_cartera(sender, instance, **kwargs):
+    receivables.invalidar()
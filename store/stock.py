@@ -0,0 +1,135 @@
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, IntegerField, Value
+from django.db.models.functions import Greatest
+
+from store.models import DetalleCompra, DetalleFactura, Producto
+from store.totals import suma_relacionada
+
+COMPRA = 1
+VENTA = -1
+
+
+class StockInsuficiente(ValidationError):
+    """
+    Se lanza cuando un producto no tiene la cantidad solicitada en stock
+    """
+
+    def __init__(self, producto_id, cantidad):
+        super(StockInsuficiente, self).__init__(
+            'No hay stock suficiente del producto para vender %(cantidad)s unidades',
+            code='stock_insuficiente', params={'cantidad': cantidad})
+        self.producto_id = producto_id
+        self.cantidad = cantidad
+
+
+def ajustar(producto_id, cantidad):
+    """
+    Suma la cantidad al stock del producto con un UPDATE atómico. Un ajuste
+    negativo mayor que el stock, por ejemplo al eliminar una compra cuyas
+    unidades ya se vendieron, deja el stock en cero como reconstruir.
+    """
+    if not producto_id or not cantidad:
+        return
+    nueva = F('cantidad') + cantidad
+    if cantidad < 0:
+        nueva = Greatest(nueva, Value(0))
+    Producto.objects.filter(pk=producto_id).update(cantidad=nueva)
+
+
+def ajustar_lote(cantidades):
+    """
+    Aplica los ajustes {producto_id: cantidad} con un solo UPDATE por
+    producto. Los productos se actualizan en orden para evitar interbloqueos.
+    """
+    with transaction.atomic():
+        for producto_id in sorted(cantidades):
+            ajustar(producto_id, cantidades[producto_id])
+
+
+def reservar(producto_id, cantidad):
+    """
+    Descuenta la cantidad del stock solo si el producto la tiene disponible,
+    la verificación y el descuento se hacen en el mismo UPDATE condicional.
+    """
+    if not producto_id or cantidad <= 0:
+        return
+    actualizados = Producto.objects.filter(pk=producto_id, cantidad__gte=cantidad).update(
+        cantidad=F('cantidad') - cantidad)
+    if actualizados == 0:
+        raise StockInsuficiente(producto_id, cantidad)
+
+
+def reservar_lote(lineas):
+    """
+    Reserva varias líneas (producto_id, cantidad) en una sola transacción, si
+    algún producto no tiene stock no se reserva ninguna. Las cantidades se
+    suman por producto y un total negativo, por ejemplo al reducir una línea,
+    devuelve las unidades al stock. Los productos se bloquean siempre en el
+    mismo orden para evitar interbloqueos.
+    """
+    cantidades = defaultdict(int)
+    for producto_id, cantidad in lineas:
+        if producto_id:
+            cantidades[producto_id] += cantidad
+    with transaction.atomic():
+        for producto_id in sorted(cantidades):
+            cantidad = cantidades[producto_id]
+            if cantidad > 0:
+                reservar(producto_id, cantidad)
+            else:
+                ajustar(producto_id, -cantidad)
+
+
+def registrar_movimiento(signo, producto_id, cantidad, anterior=None):
+    """
+    Aplica al stock la diferencia entre el estado anterior de una línea de
+    compra o venta, (producto_id, cantidad), y el nuevo. Las ventas reservan
+    el stock con reservar_lote y fallan con StockInsuficiente si no alcanza.
+    """
+    lineas = [(producto_id, cantidad)]
+    if anterior is not None:
+        lineas.append((anterior[0], -anterior[1]))
+    if signo == VENTA:
+        reservar_lote(lineas)
+        return
+    cantidades = defaultdict(int)
+    for linea_producto_id, linea_cantidad in lineas:
+        if linea_producto_id:
+            cantidades[linea_producto_id] += linea_cantidad
+    ajustar_lote(cantidades)
+
+
+def saldos(queryset=None):
+    """
+    Calcula en una sola consulta el stock de cada producto a partir de todas
+    sus compras y ventas. Devuelve tuplas (producto_id, cantidad guardada, saldo).
+    """
+    if queryset is None:
+        queryset = Producto.objects.all()
+    filas = queryset.order_by().annotate(
+        comprado=suma_relacionada(DetalleCompra.objects, 'producto', 'cantidad',
+                                  output_field=IntegerField(), vacio=0),
+        vendido=suma_relacionada(DetalleFactura.objects, 'producto', 'cantidad',
+                                 output_field=IntegerField(), vacio=0),
+    ).values_list('id', 'cantidad', 'comprado', 'vendido')
+    for producto_id, cantidad, comprado, vendido in filas.iterator():
+        yield producto_id, cantidad, comprado - vendido
+
+
+def diferencias(queryset=None):
+    return [(producto_id, cantidad, saldo)
+            for producto_id, cantidad, saldo in saldos(queryset) if cantidad != saldo]
+
+
+def reconstruir(queryset=None):
+    """
+    Corrige el stock de los productos cuyo saldo guardado no coincide con el
+    historial de compras y ventas. Los saldos negativos se dejan en cero.
+    """
+    corregidos = diferencias(queryset)
+    for producto_id, cantidad, saldo in corregidos:
+        Producto.objects.filter(pk=producto_id).update(cantidad=max(saldo, 0))
+    return corregidos
@@ -1,3 +1,1478 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from importlib import import_module
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import Group
+from django.core import checks
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import numpy as np
+from PIL import Image
+
+from people import credentials
+from people.models import Usuario
+from store import (analytics, catalog, company, dashboard, forecast, images, importer, jobs, pdf, pdf_assets,
+                   pdf_batch, pdf_cache, receivables, search, stock, totals, workflow)
+from store.company import obtener_empresa
+from store.confirmation import confirmar_ordenes
+from store.models import (Categoria, Cliente, Compra, ConteoDetalles, DetalleCompra, DetalleFactura, DetalleOrden,
+                          Empresa, Factura, OrdenMantenimiento, PagoFactura, Producto, Proveedor, ResumenOperacion,
+                          RevisionTecnica, Tecnico, TrabajoPdf)
+from utils import permissions
+
+
+class DatosBaseMixin(object):
+    """
+    Prepara los datos que usan casi todas las pruebas: la caché vacía, la
+    empresa y, salvo que con_cliente sea falso, un cliente.
+    """
+    con_cliente = True
+
+    def setUp(self):
+        super(DatosBaseMixin, self).setUp()
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre='gmeBox', contacto='gmeBox', email='empresa@gmebox.com')
+        if self.con_cliente:
+            self.cliente = Cliente.objects.create(nombre='Cliente', apellido='1', numero_identificacion='1')
+
+    def iniciar_sesion_administrador(self):
+        usuario = Usuario.objects.create(
+            correo_electronico='admin@gmebox.com', nombre_de_usuario='admin', is_active=True, is_superuser=True)
+        self.client.force_login(usuario)
+        return usuario
+
+
+class MediaTemporalMixin(object):
+    """
+    Guarda los archivos subidos o generados en la prueba en un directorio temporal.
+    """
+
+    def setUp(self):
+        super(MediaTemporalMixin, self).setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        configuracion = override_settings(MEDIA_ROOT=self.media)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+
+class ListadoConsultasTest(DatosBaseMixin, TestCase):
+    """
+    Verifica que los listados se generan con el mismo número de consultas sin
+    importar cuántas filas se muestran en la página.
+    """
+    con_cliente = False
+
+    def setUp(self):
+        super(ListadoConsultasTest, self).setUp()
+        self.usuario = self.iniciar_sesion_administrador()
+        self.numero = 0
+
+    def crear_cliente(self):
+        self.numero += 1
+        cliente = Cliente.objects.create(
+            nombre='Cliente', apellido=str(self.numero), numero_identificacion=str(self.numero))
+        Usuario.objects.create(
+            correo_electronico='cliente{}@gmebox.com'.format(self.numero),
+            nombre_de_usuario='cliente{}'.format(self.numero), persona=cliente, is_active=True)
+        return cliente
+
+    def crear_orden(self, cliente=None):
+        return OrdenMantenimiento.objects.create(
+            cliente=cliente or self.crear_cliente(), empresa=self.empresa)
+
+    def crear_factura(self):
+        return Factura.objects.create(
+            fecha_venta=date.today(), cliente=self.crear_cliente(), empresa=self.empresa)
+
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(consultas)
+
+    def assertConsultasConstantes(self, url, crear_fila, filas=20):
+        crear_fila()
+        self.contar_consultas(url)
+        consultas_una_fila = self.contar_consultas(url)
+        for _ in range(filas - 1):
+            crear_fila()
+        self.assertEqual(self.contar_consultas(url), consultas_una_fila)
+
+    def test_listado_ordenes(self):
+        self.assertConsultasConstantes(reverse('orders'), self.crear_orden)
+
+    def test_listado_facturas(self):
+        self.assertConsultasConstantes(reverse('invoices'), self.crear_factura)
+
+    def test_listado_ordenes_cliente(self):
+        cliente = self.crear_cliente()
+        self.client.force_login(cliente.usuario)
+        self.assertConsultasConstantes(
+            reverse('orders-client'), lambda: self.crear_orden(cliente))
+
+    def test_explicar_listados(self):
+        self.crear_orden()
+        self.crear_factura()
+        self.crear_cliente()
+        salida = StringIO()
+        call_command('explicar_listados', stdout=salida)
+        self.assertIn('orders (página siguiente): usa índices', salida.getvalue())
+        self.assertIn('invoices (página siguiente): usa índices', salida.getvalue())
+        self.assertIn('clients (primera página): usa índices', salida.getvalue())
+        with self.assertRaises(CommandError), mock.patch(
+                'store.management.commands.explicar_listados.recorridos_secuenciales', return_value=['store_cliente']):
+            call_command('explicar_listados', stdout=StringIO())
+
+
+class BusquedaTest(DatosBaseMixin, TestCase):
+    """
+    Verifica los documentos de búsqueda de clientes, técnicos, órdenes y
+    facturas y que los filtros no se recortan al límite de relevancia.
+    """
+    con_cliente = False
+
+    def setUp(self):
+        super(BusquedaTest, self).setUp()
+        self.cliente = Cliente.objects.create(nombre='Ana', apellido='Pérez', numero_identificacion='1')
+        self.tecnico = Tecnico.objects.create(
+            nombre='Ana', apellido='López', numero_identificacion='2', fecha_ingreso=date.today())
+
+    def test_clientes_y_tecnicos_separados(self):
+        self.assertEqual(list(search.filtrar(Cliente.objects.all(), 'CLIENTE', 'ana')), [self.cliente])
+        self.assertEqual(list(search.filtrar(Tecnico.objects.all(), 'TECNICO', 'ana')), [self.tecnico])
+        self.assertFalse(search.filtrar(Tecnico.objects.all(), 'TECNICO', 'perez').exists())
+
+    def test_eliminar_tecnico_conserva_cliente(self):
+        self.tecnico.delete()
+        self.assertEqual(search.buscar('CLIENTE', 'ana'), [self.cliente.id])
+        self.assertEqual(search.buscar('TECNICO', 'ana'), [])
+
+    def test_filtro_sin_limite(self):
+        clientes = [self.cliente] + [
+            Cliente.objects.create(nombre='Ana', apellido=str(numero), numero_identificacion=str(numero))
+            for numero in range(3, 8)]
+        with mock.patch.object(search, 'MAX_RESULTADOS', 2):
+            filtrados = list(search.filtrar(Cliente.objects.all(), 'CLIENTE', 'ana'))
+        self.assertCountEqual(filtrados, clientes)
+        self.assertEqual(filtrados[:2], [Cliente.objects.get(pk=pk) for pk in search.buscar('CLIENTE', 'ana', 2)])
+
+    def test_indexar_cliente_en_lote(self):
+        def guardar_cliente(nombre):
+            self.cliente.nombre = nombre
+            with CaptureQueriesContext(connection) as consultas:
+                self.cliente.save()
+            return len(consultas)
+
+        OrdenMantenimiento.objects.create(cliente=self.cliente, empresa=self.empresa, descripcion='Laptop')
+        Factura.objects.create(fecha_venta=date.today(), cliente=self.cliente, empresa=self.empresa)
+        consultas = guardar_cliente('Beatriz')
+        for _ in range(4):
+            OrdenMantenimiento.objects.create(cliente=self.cliente, empresa=self.empresa, descripcion='Laptop')
+            Factura.objects.create(fecha_venta=date.today(), cliente=self.cliente, empresa=self.empresa)
+        self.assertEqual(guardar_cliente('Carla'), consultas)
+        self.assertEqual(search.filtrar(OrdenMantenimiento.objects.all(), 'ORDEN', 'carla laptop').count(), 5)
+        self.assertEqual(search.filtrar(Factura.objects.all(), 'FACTURA', 'carla').count(), 5)
+        self.assertFalse(search.filtrar(Factura.objects.all(), 'FACTURA', 'beatriz').exists())
+
+    def test_reindexar(self):
+        OrdenMantenimiento.objects.create(cliente=self.cliente, empresa=self.empresa, descripcion='Laptop')
+        self.assertEqual(search.reindexar(), 3)
+        self.assertEqual(search.buscar('CLIENTE', 'ana'), [self.cliente.id])
+        self.assertEqual(search.buscar('TECNICO', 'lopez'), [self.tecnico.id])
+
+
+class PaginacionCursorTest(TestCase):
+    """
+    Verifica que los enlaces de la paginación por cursor conservan los demás
+    parámetros de la petición.
+    """
+
+    def setUp(self):
+        usuario = Usuario.objects.create(
+            correo_electronico='admin@gmebox.com', nombre_de_usuario='admin', is_active=True, is_superuser=True)
+        self.client.force_login(usuario)
+        for numero in range(45):
+            Cliente.objects.create(nombre='Cliente', apellido=str(numero), numero_identificacion=str(numero))
+
+    def test_enlaces_conservan_parametros(self):
+        response = self.client.get(reverse('clients'), {'vista': 'tabla', 'orden': 'a&b'})
+        self.assertTrue(response.context['cursor_pagination'])
+        siguiente = response.context['page_obj'].next_cursor
+        self.assertEqual(response.context['cursor_query'], 'vista=tabla&orden=a%26b')
+        self.assertContains(response, 'vista=tabla&amp;orden=a%26b&amp;cursor=')
+
+        response = self.client.get(reverse('clients'), {'vista': 'tabla', 'orden': 'a&b', 'cursor': siguiente})
+        self.assertEqual(response.context['cursor_query'], 'vista=tabla&orden=a%26b')
+        self.assertContains(response, 'href="?vista=tabla&amp;orden=a%26b">&laquo; first</a>', html=False)
+        self.assertEqual(len(response.context['clientes']), 20)
+
+    def test_sin_parametros(self):
+        response = self.client.get(reverse('clients'))
+        self.assertEqual(response.context['cursor_query'], '')
+        self.assertContains(response, 'href="?cursor=')
+
+
+class TotalesTest(DatosBaseMixin, TestCase):
+    """
+    Verifica los totales de facturas, compras y órdenes calculados con una
+    sola consulta agregada.
+    """
+
+    def setUp(self):
+        super(TotalesTest, self).setUp()
+        self.factura = Factura.objects.create(fecha_venta=date.today(), cliente=self.cliente, empresa=self.empresa)
+
+    def agregar_detalle(self, factura, total, impuesto):
+        DetalleFactura.objects.create(factura=factura, cantidad=1, precio_unitario=Decimal(total),
+                                      total=Decimal(total), impuesto=Decimal(impuesto))
+
+    def test_totales_factura(self):
+        self.agregar_detalle(self.factura, '10.00', '1.20')
+        self.agregar_detalle(self.factura, '5.50', '0.66')
+        PagoFactura.objects.create(factura=self.factura, fecha_pago=date.today(), monto=Decimal('7.36'))
+        with self.assertNumQueries(1):
+            self.factura.calcular_totales()
+        self.assertEqual((self.factura.subtotal, self.factura.impuesto, self.factura.total),
+                         (Decimal('15.50'), Decimal('1.86'), Decimal('17.36')))
+        self.assertEqual(self.factura.monto_pagado, Decimal('7.36'))
+        self.assertEqual(self.factura.estado, 'POR_PAGAR')
+
+        PagoFactura.objects.create(factura=self.factura, fecha_pago=date.today(), monto=Decimal('10.00'))
+        self.factura.actualizar_totales()
+        self.factura.refresh_from_db()
+        self.assertEqual(self.factura.monto_pagado, Decimal('17.36'))
+        self.assertEqual(self.factura.estado, 'PAGADO')
+
+    def test_factura_sin_valor_no_se_paga(self):
+        self.factura.actualizar_totales()
+        self.factura.refresh_from_db()
+        self.assertEqual(self.factura.total, Decimal('0.00'))
+        self.assertEqual(self.factura.estado, 'POR_PAGAR')
+
+    def test_recalcular_solo_cambios(self):
+        otra = Factura.objects.create(fecha_venta=date.today(), cliente=self.cliente, empresa=self.empresa)
+        self.agregar_detalle(self.factura, '3.00', '0.36')
+        self.assertEqual(totals.recalcular_facturas(Factura.objects.all()), 1)
+        self.assertEqual(Factura.objects.get(pk=self.factura.pk).total, Decimal('3.36'))
+        self.assertEqual(Factura.objects.get(pk=otra.pk).total, Decimal('0.00'))
+        self.assertEqual(totals.recalcular_facturas(Factura.objects.all()), 0)
+
+    def test_totales_compra_y_orden(self):
+        proveedor = Proveedor.objects.create(nombre='Electro', contacto='Luis', email='electro@gmebox.com')
+        categoria = Categoria.objects.create(nombre='Leds', empresa=self.empresa)
+        producto = Producto.objects.create(nombre='Foco led', precio=2, cantidad=0, categoria=categoria)
+        compra = Compra.objects.create(fecha_compra=date.today(), proveedor=proveedor)
+        for cantidad in (2, 3):
+            DetalleCompra.objects.create(compra=compra, producto=producto, cantidad=cantidad,
+                                         precio_unitario=Decimal('2.00'), total=Decimal(cantidad * 2),
+                                         impuesto=Decimal('0.50'))
+        compra.actualizar_totales()
+        compra.refresh_from_db()
+        self.assertEqual((compra.subtotal, compra.impuesto, compra.total),
+                         (Decimal('10.00'), Decimal('1.00'), Decimal('11.00')))
+
+        orden = OrdenMantenimiento.objects.create(cliente=self.cliente, empresa=self.empresa)
+        for precio in ('4.25', '5.75'):
+            DetalleOrden.objects.create(nombre_equipo='Laptop', observacion='Pantalla', precio_servicio=precio,
+                                        orden_mantenimiento=orden)
+        with CaptureQueriesContext(connection) as consultas:
+            orden.actualizar_monto()
+        lecturas = [consulta for consulta in consultas if consulta['sql'].startswith('SELECT')]
+        self.assertEqual(len(lecturas), 1)
+        self.assertEqual(OrdenMantenimiento.objects.get(pk=orden.pk).monto_servicio, Decimal('10.00'))
+
+
+class ConfirmacionOrdenesTest(DatosBaseMixin, TestCase):
+    """
+    Verifica la confirmación en lote de órdenes de mantenimiento.
+    """
+
+    def setUp(self):
+        super(ConfirmacionOrdenesTest, self).setUp()
+
+    def crear_orden(self, precios):
+        orden = OrdenMantenimiento.objects.create(
+            cliente=self.cliente, empresa=self.empresa, estado='REVISADO')
+        for precio in precios:
+            DetalleOrden.objects.create(
+                nombre_equipo='Laptop', observacion='Pantalla', precio_servicio=precio,
+                orden_mantenimiento=orden, estado='REVISADO')
+        return orden
+
+    def test_confirmar_lote(self):
+        ordenes = [self.crear_orden(['10.50', '4.50']), self.crear_orden(['7.00']), self.crear_orden([])]
+        facturas = confirmar_ordenes(OrdenMantenimiento.objects.all())
+        self.assertEqual(len(facturas), 3)
+        self.assertEqual(
+            list(Factura.objects.order_by('id').values_list('total', flat=True)),
+            [Decimal('15.00'), Decimal('7.00'), Decimal('0.00')])
+        self.assertEqual(DetalleFactura.objects.count(), 3)
+        self.assertFalse(DetalleOrden.objects.exclude(estado='CONFIRMADO').exists())
+        self.assertFalse(OrdenMantenimiento.objects.exclude(estado='CONFIRMADO').exists())
+        self.assertEqual(confirmar_ordenes(OrdenMantenimiento.objects.filter(pk=ordenes[0].pk)), [])
+
+    def test_consultas_constantes(self):
+        self.crear_orden(['1.00'])
+        with CaptureQueriesContext(connection) as una_orden:
+            confirmar_ordenes(OrdenMantenimiento.objects.all())
+        for _ in range(10):
+            self.crear_orden(['1.00', '2.00'])
+        with CaptureQueriesContext(connection) as varias_ordenes:
+            confirmar_ordenes(OrdenMantenimiento.objects.all())
+        if connection.features.can_return_rows_from_bulk_insert:
+            self.assertEqual(len(varias_ordenes), len(una_orden))
+
+
+class TableroTest(DatosBaseMixin, TestCase):
+    """
+    Verifica que el resumen del tablero se mantiene al guardar, actualizar en
+    lote y eliminar órdenes, detalles y facturas.
+    """
+
+    def setUp(self):
+        super(TableroTest, self).setUp()
+
+    def crear_orden(self, precios):
+        orden = OrdenMantenimiento.objects.create(cliente=self.cliente, empresa=self.empresa)
+        for precio in precios:
+            DetalleOrden.objects.create(
+                nombre_equipo='Laptop', observacion='Pantalla', precio_servicio=precio,
+                orden_mantenimiento=orden)
+        orden.actualizar_monto()
+        return orden
+
+    def totales(self, tipo):
+        return {fila['estado']: (fila['cantidad'], fila['monto'], fila['saldo'])
+                for fila in ResumenOperacion.objects.filter(tipo=tipo, fecha__isnull=True).values(
+                    'estado', 'cantidad', 'monto', 'saldo') if fila['cantidad']}
+
+    def test_mantiene_resumen(self):
+        orden = self.crear_orden(['10.00', '5.00'])
+        self.crear_orden(['2.50'])
+        detalle = orden.detalles.order_by('id').first()
+        detalle.estado = 'EN_REVISION'
+        detalle.save()
+        factura = Factura.objects.create(fecha_venta=date.today(), cliente=self.cliente, empresa=self.empresa,
+                                         total=Decimal('100.00'), monto_pagado=Decimal('40.00'))
+        self.assertEqual(self.totales('ORDEN'), {
+            'NUEVO': (1, Decimal('2.50'), Decimal('0.00')),
+            'EN_REVISION': (1, Decimal('15.00'), Decimal('0.00'))})
+        self.assertEqual(self.totales('DETALLE_ORDEN'), {
+            'NUEVO': (2, Decimal('7.50'), Decimal('0.00')),
+            'EN_REVISION': (1, Decimal('10.00'), Decimal('0.00'))})
+        self.assertEqual(self.totales('FACTURA'), {'POR_PAGAR': (1, Decimal('100.00'), Decimal('60.00'))})
+
+        orden.confirmar()
+        factura.delete()
+        self.assertEqual(self.totales('ORDEN'), {
+            'NUEVO': (1, Decimal('2.50'), Decimal('0.00')),
+            'CONFIRMADO': (1, Decimal('15.00'), Decimal('0.00'))})
+        self.assertEqual(self.totales('FACTURA'), {'POR_PAGAR': (1, Decimal('15.00'), Decimal('15.00'))})
+        OrdenMantenimiento.objects.get(pk=orden.pk).delete()
+        self.assertEqual(self.totales('DETALLE_ORDEN'), {'NUEVO': (1, Decimal('2.50'), Decimal('0.00'))})
+        self.assertEqual(dashboard.diferencias(), [])
+
+    def test_reconstruir(self):
+        self.crear_orden(['3.00'])
+        ResumenOperacion.objects.update(cantidad=0)
+        salida = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('reconstruir_tablero', '--verificar', stdout=salida)
+        call_command('reconstruir_tablero', stdout=salida)
+        self.assertEqual(dashboard.diferencias(), [])
+        self.assertEqual(self.totales('ORDEN'), {'NUEVO': (1, Decimal('3.00'), Decimal('0.00'))})
+
+    def test_migracion_rellena_resumen(self):
+        self.crear_orden(['3.00', '4.00'])
+        Factura.objects.create(fecha_venta=date.today(), cliente=self.cliente, empresa=self.empresa,
+                               total=Decimal('10.00'), monto_pagado=Decimal('4.00'))
+        ResumenOperacion.objects.all().delete()
+        migracion = import_module('store.migrations.0038_rellenar_resumen_operaciones')
+        migracion.rellenar_resumen(apps, None)
+        self.assertEqual(dashboard.diferencias(), [])
+        self.assertEqual(self.totales('FACTURA'), {'POR_PAGAR': (1, Decimal('10.00'), Decimal('6.00'))})
+
+    def test_inicio_consultas_constantes(self):
+        self.iniciar_sesion_administrador()
+        self.crear_orden(['1.00'])
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as una_orden:
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Operaciones')
+        for dias in range(1, 11):
+            orden = self.crear_orden(['1.00', '2.00'])
+            OrdenMantenimiento.objects.filter(pk=orden.pk).update(fecha_registro=date.today() - timedelta(days=dias))
+        dashboard.reconstruir()
+        with CaptureQueriesContext(connection) as varias_ordenes:
+            response = self.client.get(reverse('home'))
+        self.assertEqual(len(varias_ordenes), len(una_orden))
+        self.assertEqual(response.context['tablero']['tipos'][0]['cantidad'], 11)
+
+
+class EstadosOrdenTest(DatosBaseMixin, TestCase):
+    """
+    Verifica las transiciones de estado de los detalles y que el estado de la
+    orden sigue a sus contadores.
+    """
+
+    def setUp(self):
+        super(EstadosOrdenTest, self).setUp()
+        self.tecnico = Tecnico.objects.create(
+            nombre='Tecnico', apellido='1', numero_identificacion='2', fecha_ingreso=date.today())
+
+    def crear_orden(self, detalles):
+        orden = OrdenMantenimiento.objects.create(cliente=self.cliente, empresa=self.empresa)
+        for _ in range(detalles):
+            DetalleOrden.objects.create(
+                nombre_equipo='Laptop', observacion='Pantalla', precio_servicio='1.00', orden_mantenimiento=orden)
+        return orden
+
+    def estado(self, orden):
+        return OrdenMantenimiento.objects.values_list('estado', flat=True).get(pk=orden.pk)
+
+    def test_estado_orden_sigue_detalles(self):
+        orden = self.crear_orden(2)
+        primero, segundo = orden.detalles.order_by('id')
+        self.assertEqual(ConteoDetalles.objects.get(orden=orden).nuevo, 2)
+        workflow.cambiar_estado_detalle(primero.id, 'EN_REVISION')
+        self.assertEqual(self.estado(orden), 'EN_REVISION')
+        self.assertFalse(orden.verificar_estado_detalles('EN_REVISION'))
+        workflow.cambiar_estado_detalle(segundo.id, 'EN_REVISION')
+        self.assertTrue(orden.verificar_estado_detalles('EN_REVISION'))
+        workflow.cambiar_estado_detalle(primero.id, 'REVISADO')
+        workflow.cambiar_estado_detalle(segundo.id, 'ARREGLADO')
+        self.assertEqual(self.estado(orden), 'REVISADO')
+        with self.assertRaises(workflow.TransicionInvalida):
+            workflow.cambiar_estado_detalle(primero.id, 'NUEVO')
+
+        DetalleOrden.objects.create(
+            nombre_equipo='Impresora', observacion='Papel', orden_mantenimiento=orden)
+        self.assertEqual(self.estado(orden), 'EN_REVISION')
+        orden.confirmar()
+        conteo = ConteoDetalles.objects.get(orden=orden)
+        self.assertEqual((conteo.total, conteo.confirmado, conteo.revisado), (3, 3, 0))
+        self.assertEqual(self.estado(orden), 'CONFIRMADO')
+        self.assertEqual(dashboard.diferencias(), [])
+
+    def test_confirmar_conserva_finalizados(self):
+        orden = self.crear_orden(2)
+        arreglado, finalizado = orden.detalles.order_by('id')
+        for detalle, estados in ((arreglado, ('EN_REVISION', 'ARREGLADO')),
+                                 (finalizado, ('EN_REVISION', 'ARREGLADO', 'FINALIZADO'))):
+            for estado in estados:
+                workflow.cambiar_estado_detalle(detalle.id, estado)
+        self.assertEqual(self.estado(orden), 'REVISADO')
+        workflow.confirmar([orden.id])
+        self.assertEqual(list(orden.detalles.order_by('id').values_list('estado', flat=True)),
+                         ['CONFIRMADO', 'FINALIZADO'])
+        conteo = ConteoDetalles.objects.get(orden=orden)
+        self.assertEqual((conteo.total, conteo.arreglado, conteo.confirmado, conteo.finalizado), (2, 0, 1, 1))
+        self.assertEqual(self.estado(orden), 'CONFIRMADO')
+        self.assertEqual(dashboard.diferencias(), [])
+
+    def test_confirmar_no_retrocede(self):
+        orden = self.crear_orden(1)
+        self.assertIsNotNone(orden.confirmar())
+        self.assertIsNone(orden.confirmar())
+        self.assertEqual(orden.estado, 'CONFIRMADO')
+        self.assertEqual(Factura.objects.count(), 1)
+        OrdenMantenimiento.objects.filter(pk=orden.pk).update(estado='FINALIZADO')
+        with self.assertRaises(workflow.TransicionInvalida):
+            orden.confirmar()
+
+        usuario = Usuario.objects.create(
+            correo_electronico='cliente@gmebox.com', nombre_de_usuario='cliente', persona=self.cliente,
+            is_active=True)
+        usuario.groups.add(Group.objects.create(name='CLIENTE'))
+        self.client.force_login(usuario)
+        response = self.client.post(reverse('order-confirm', kwargs={'pk': orden.pk}), {'confirm': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'No se puede pasar del estado')
+        self.assertEqual(self.estado(orden), 'FINALIZADO')
+        self.assertEqual(Factura.objects.count(), 1)
+
+    def test_guardar_valida_estado(self):
+        orden = self.crear_orden(1)
+        OrdenMantenimiento.objects.filter(pk=orden.pk).update(estado='FINALIZADO')
+        with self.assertRaises(workflow.TransicionInvalida):
+            orden.save()
+        self.assertEqual(self.estado(orden), 'FINALIZADO')
+        orden.descripcion = 'Cambio'
+        orden.save(update_fields=['descripcion'])
+        orden.refresh_from_db()
+        orden.estado = 'NUEVO'
+        with self.assertRaises(workflow.TransicionInvalida):
+            orden.save(update_fields=['estado'])
+
+    def test_revision_consultas_constantes(self):
+        self.iniciar_sesion_administrador()
+
+        def revisar(detalles):
+            orden = self.crear_orden(detalles)
+            for detalle in orden.detalles.all():
+                workflow.cambiar_estado_detalle(detalle.id, 'EN_REVISION')
+            revision = RevisionTecnica.objects.create(
+                descripcion='Revisión', tecnico=self.tecnico, detalle_orden=orden.detalles.first())
+            url = reverse('revision-by-technician-update', kwargs={'pk': revision.pk})
+            with CaptureQueriesContext(connection) as consultas:
+                response = self.client.post(url, {'descripcion': 'Listo', 'estado': 'REVISADO'})
+            self.assertEqual(response.status_code, 302)
+            return orden, len(consultas)
+
+        orden, una = revisar(1)
+        self.assertEqual(self.estado(orden), 'REVISADO')
+        orden, dos = revisar(2)
+        self.assertEqual(self.estado(orden), 'EN_REVISION')
+        orden, varias = revisar(20)
+        self.assertEqual(self.estado(orden), 'EN_REVISION')
+        self.assertEqual(varias, dos)
+
+
+class VentasTest(DatosBaseMixin, TestCase):
+    """
+    Verifica la suma incremental de las ventas diarias y los reportes
+    agrupados en memoria.
+    """
+
+    def setUp(self):
+        super(VentasTest, self).setUp()
+        self.leds = Categoria.objects.create(nombre='Leds', empresa=self.empresa)
+        self.sensores = Categoria.objects.create(nombre='Sensores', empresa=self.empresa)
+        self.tira = Producto.objects.create(nombre='Tira led', precio=5, cantidad=100, categoria=self.leds)
+        self.foco = Producto.objects.create(nombre='Foco led', precio=2, cantidad=100, categoria=self.leds)
+        self.sensor = Producto.objects.create(nombre='Sensor PIR', precio=3, cantidad=100, categoria=self.sensores)
+
+    def vender(self, fecha, lineas):
+        factura = Factura.objects.create(fecha_venta=fecha, cliente=self.cliente, empresa=self.empresa)
+        for producto, cantidad in lineas:
+            DetalleFactura.objects.create(factura=factura, producto=producto, cantidad=cantidad,
+                                          precio_unitario=producto.precio, impuesto=Decimal('0.12') * cantidad,
+                                          total=producto.precio * cantidad)
+        return factura
+
+    def montos(self, **kwargs):
+        return {(fila.periodo, fila.nombre): (fila.cantidad, fila.monto) for fila in analytics.reporte(**kwargs)}
+
+    def test_actualizacion_incremental(self):
+        self.vender(date(2026, 1, 5), [(self.tira, 2), (self.sensor, 1)])
+        call_command('agregar_ventas', stdout=StringIO())
+        factura = self.vender(date(2026, 1, 20), [(self.foco, 3)])
+        self.vender(date(2026, 2, 1), [(self.tira, 1)])
+        dias, marca = analytics.actualizar()
+        self.assertEqual(dias, 2)
+        self.assertEqual(self.montos(periodo='mes'), {
+            ('2026-01', ''): (6, Decimal('19.00')), ('2026-02', ''): (1, Decimal('5.00'))})
+
+        factura.fecha_venta = date(2026, 2, 3)
+        factura.save()
+        factura.detalles.first().delete()
+        analytics.actualizar()
+        self.assertEqual(self.montos(periodo='mes'), {
+            ('2026-01', ''): (3, Decimal('13.00')), ('2026-02', ''): (1, Decimal('5.00'))})
+        incremental = list(analytics.reporte(periodo='dia', dimension='producto'))
+        analytics.actualizar(completo=True)
+        self.assertEqual(analytics.reporte(periodo='dia', dimension='producto'), incremental)
+
+    def test_agrupaciones(self):
+        self.vender(date(2025, 12, 31), [(self.sensor, 2)])
+        self.vender(date(2026, 1, 5), [(self.tira, 2), (self.foco, 1), (self.sensor, 1)])
+        analytics.actualizar()
+        self.assertEqual(self.montos(periodo='anio', dimension='categoria'), {
+            ('2025', 'Sensores'): (2, Decimal('6.00')),
+            ('2026', 'Leds'): (3, Decimal('12.00')),
+            ('2026', 'Sensores'): (1, Decimal('3.00'))})
+        self.assertEqual(self.montos(periodo='mes', dimension='producto', desde=date(2026, 1, 1)), {
+            ('2026-01', 'Tira led'): (2, Decimal('10.00')),
+            ('2026-01', 'Foco led'): (1, Decimal('2.00')),
+            ('2026-01', 'Sensor PIR'): (1, Decimal('3.00'))})
+
+        self.sensor.categoria = self.leds
+        self.sensor.save()
+        self.assertEqual(self.montos(periodo='anio', dimension='categoria', desde=date(2026, 1, 1)), {
+            ('2026', 'Leds'): (4, Decimal('15.00'))})
+        with self.assertNumQueries(1):
+            analytics.reporte(periodo='dia', dimension='categoria')
+
+    def test_actualizacion_de_otro_proceso(self):
+        self.vender(date(2026, 1, 5), [(self.tira, 2)])
+        analytics.actualizar()
+        self.assertEqual(self.montos(periodo='mes'), {('2026-01', ''): (2, Decimal('10.00'))})
+        # actualizar no limpia la memoria de ningún proceso, la nueva fecha de la marca cambia la clave
+        self.vender(date(2026, 1, 6), [(self.tira, 1)])
+        analytics.actualizar()
+        self.assertEqual(self.montos(periodo='mes'), {('2026-01', ''): (3, Decimal('15.00'))})
+
+    def test_reporte_csv(self):
+        self.vender(date(2026, 1, 5), [(self.tira, 2)])
+        analytics.actualizar()
+        self.iniciar_sesion_administrador()
+        response = self.client.get(reverse('sales-report'), {'periodo': 'mes', 'dimension': 'producto'})
+        self.assertContains(response, 'Tira led')
+        response = self.client.get(reverse('sales-report'), {'periodo': 'mes', 'formato': 'csv'})
+        filas = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(filas[1], ['2026-01', '', '1', '2', '10.00', '0.24'])
+
+
+class CarteraTest(MediaTemporalMixin, DatosBaseMixin, TestCase):
+    """
+    Verifica los saldos por cobrar por antigüedad, su caché por fecha de corte
+    y las descargas del reporte.
+    """
+    con_cliente = False
+
+    def setUp(self):
+        super(CarteraTest, self).setUp()
+        self.ana = Cliente.objects.create(nombre='Ana', apellido='Paz', numero_identificacion='1')
+        self.luis = Cliente.objects.create(nombre='Luis', apellido='Mora', numero_identificacion='2')
+        self.corte = date(2026, 6, 30)
+
+    def facturar(self, cliente, dias, total, pagos=()):
+        factura = Factura.objects.create(fecha_venta=self.corte - timedelta(days=dias), cliente=cliente,
+                                         empresa=self.empresa, total=Decimal(total))
+        for fecha, monto in pagos:
+            PagoFactura.objects.create(factura=factura, fecha_pago=fecha, monto=Decimal(monto))
+        return factura
+
+    def test_tramos_por_cliente(self):
+        self.facturar(self.ana, 30, '100.00', [(self.corte, '40.00')])
+        self.facturar(self.ana, 31, '50.00')
+        self.facturar(self.ana, 95, '20.00', [(self.corte + timedelta(days=1), '20.00')])
+        self.facturar(self.luis, 90, '300.00')
+        self.facturar(self.luis, 10, '10.00', [(self.corte, '10.00')])
+        self.facturar(self.luis, -1, '99.00')
+        cartera = receivables.reporte(self.corte)
+        self.assertEqual([(fila.nombre, fila.facturas, fila.tramos, fila.total) for fila in cartera.filas], [
+            ('Luis Mora', 1, [Decimal('0.00'), Decimal('0.00'), Decimal('300.00'), Decimal('0.00')],
+             Decimal('300.00')),
+            ('Ana Paz', 3, [Decimal('60.00'), Decimal('50.00'), Decimal('0.00'), Decimal('20.00')],
+             Decimal('130.00')),
+        ])
+        self.assertEqual(cartera.tramos, [Decimal('60.00'), Decimal('50.00'), Decimal('300.00'), Decimal('20.00')])
+        self.assertEqual(cartera.total, Decimal('430.00'))
+
+    def test_cache_por_fecha(self):
+        factura = self.facturar(self.ana, 5, '80.00')
+        receivables.reporte(self.corte)
+        with self.assertNumQueries(0):
+            self.assertEqual(receivables.reporte(self.corte).total, Decimal('80.00'))
+        self.assertEqual(receivables.reporte(self.corte - timedelta(days=10)).filas, [])
+        PagoFactura.objects.create(factura=factura, fecha_pago=self.corte, monto=Decimal('30.00'))
+        self.assertEqual(receivables.reporte(self.corte).total, Decimal('50.00'))
+
+    def test_descargas(self):
+        self.facturar(self.ana, 45, '25.50')
+        self.iniciar_sesion_administrador()
+        parametros = {'fecha': self.corte.isoformat()}
+        self.assertContains(self.client.get(reverse('receivables-report'), parametros), 'Ana Paz')
+        response = self.client.get(reverse('receivables-report'), dict(parametros, formato='csv'))
+        filas = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(filas[1], ['1', 'Ana Paz', '1', '0.00', '25.50', '0.00', '0.00', '25.50'])
+        with mock.patch.object(pdf, 'convertir_pdf', return_value=b'%PDF-1.7') as convertir:
+            response = self.client.get(reverse('receivables-report'), dict(parametros, formato='pdf'))
+            self.assertEqual(response.status_code, 202)
+            self.assertFalse(convertir.called)
+            trabajo = TrabajoPdf.objects.get(tipo='CARTERA')
+            self.assertEqual(jobs.generar(trabajo.pk), 'TERMINADO')
+        self.assertIn('Ana Paz', convertir.call_args[0][0])
+        response = self.client.get(reverse('pdf-job', kwargs={'pk': trabajo.pk}))
+        self.assertRedirects(response, reverse('pdf-job-download', kwargs={'pk': trabajo.pk}),
+                             fetch_redirect_response=False)
+        response = self.client.get(reverse('pdf-job-download', kwargs={'pk': trabajo.pk}))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.7')
+        self.assertIn('cartera-2026-06-30.pdf', response['Content-Disposition'])
+
+    def test_solo_lee_facturas_abiertas(self):
+        self.facturar(self.ana, 40, '15.00', [(self.corte - timedelta(days=1), '15.00')])
+        abierta = self.facturar(self.ana, 20, '10.00')
+        pagada_despues = self.facturar(self.luis, 20, '30.00', [(self.corte + timedelta(days=2), '30.00')])
+        self.assertEqual(sorted(receivables.facturas_abiertas(self.corte).values_list('id', flat=True)),
+                         [abierta.id, pagada_despues.id])
+
+
+class PronosticoTest(DatosBaseMixin, TestCase):
+    """
+    Verifica el ritmo de venta, los días hasta agotar el stock y el reporte
+    de productos por reponer.
+    """
+
+    def setUp(self):
+        super(PronosticoTest, self).setUp()
+        categoria = Categoria.objects.create(nombre='Leds', empresa=self.empresa)
+        self.tira = Producto.objects.create(nombre='Tira led', precio=5, cantidad=200, categoria=categoria)
+        self.chip = Producto.objects.create(nombre='ATtiny85', precio=2, cantidad=528, categoria=categoria)
+        self.sensor = Producto.objects.create(nombre='Sensor PIR', precio=3, cantidad=5, categoria=categoria)
+        self.hasta = date(2026, 6, 30)
+        for dias in range(forecast.VENTANA):
+            factura = Factura.objects.create(fecha_venta=self.hasta - timedelta(days=dias), cliente=self.cliente,
+                                             empresa=self.empresa)
+            lineas = [(self.tira, 2)] + ([(self.chip, 1)] if dias < forecast.VENTANA_MEDIA else [])
+            for producto, cantidad in lineas:
+                DetalleFactura.objects.create(factura=factura, producto=producto, cantidad=cantidad,
+                                              precio_unitario=producto.precio, impuesto=0,
+                                              total=producto.precio * cantidad)
+
+    def test_suavizado_vectorizado(self):
+        matriz = np.random.RandomState(1).poisson(3, size=(4, 30)).astype(float)
+        esperado = matriz[:, 0].copy()
+        for columna in range(1, matriz.shape[1]):
+            esperado = forecast.ALFA * matriz[:, columna] + (1 - forecast.ALFA) * esperado
+        np.testing.assert_allclose(forecast.tasa_exponencial(matriz), esperado)
+
+    def test_dias_hasta_agotar(self):
+        with self.assertNumQueries(2):
+            pronostico = forecast.calcular(self.hasta)
+        tira, chip, sensor = range(3)
+        self.assertEqual(list(pronostico.cantidades), [20, 500, 5])
+        self.assertAlmostEqual(pronostico.tasa_media[tira], 2)
+        self.assertAlmostEqual(pronostico.tasa_exponencial[tira], 2)
+        self.assertAlmostEqual(pronostico.tasa_media[chip], 1)
+        self.assertAlmostEqual(pronostico.tasa_exponencial[chip], 1 - (1 - forecast.ALFA) ** forecast.VENTANA_MEDIA)
+        self.assertAlmostEqual(pronostico.dias[tira], 10)
+        self.assertEqual(pronostico.dias[sensor], np.inf)
+        self.assertEqual(list(pronostico.reponer), [True, False, False])
+        self.assertEqual(pronostico.sugeridos[tira], 2 * (forecast.DIAS_REPOSICION + forecast.DIAS_COBERTURA) - 20)
+        self.assertEqual(pronostico.sugeridos[sensor], 0)
+
+    def test_reporte(self):
+        call_command('pronosticar_stock', '--hasta', self.hasta.isoformat(), stdout=StringIO())
+        marca = forecast.obtener_marca()
+        self.assertEqual([fila.nombre for fila in forecast.reporte(marca)], ['Tira led', 'ATtiny85', 'Sensor PIR'])
+        with self.assertNumQueries(0):
+            forecast.reporte(marca)
+        self.iniciar_sesion_administrador()
+        response = self.client.get(reverse('stock-forecast'))
+        self.assertContains(response, 'Tira led')
+        self.assertNotContains(response, 'Sensor PIR')
+        self.assertContains(self.client.get(reverse('stock-forecast'), {'todos': 1}), 'Sensor PIR')
+
+
+class CatalogoTest(DatosBaseMixin, TestCase):
+    """
+    Verifica que el catálogo público se sirve desde caché y se invalida al
+    modificar productos o categorías.
+    """
+    con_cliente = False
+
+    def setUp(self):
+        super(CatalogoTest, self).setUp()
+        catalog.catalogos_locales.clear()
+        self.categoria = Categoria.objects.create(nombre='Leds', empresa=self.empresa)
+        Producto.objects.create(nombre='Tira led', precio=5, categoria=self.categoria)
+
+    def test_cache_caliente_sin_consultas(self):
+        self.client.get(reverse('servicion'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('servicion'))
+        self.assertContains(response, 'Tira led')
+
+    def test_invalidacion_otro_proceso(self):
+        catalogo = catalog.obtener_catalogo()
+        # Otro proceso solo puede avisar el cambio con la versión en la caché compartida
+        Producto.objects.filter(categoria=self.categoria).update(nombre='Foco led')
+        cache.set(catalog.CACHE_VERSION_KEY, catalog.obtener_version() + 1, None)
+        cache.delete(catalog.CACHE_CATEGORIA_KEY.format(self.categoria.id))
+        self.assertEqual(catalog.obtener_catalogo()[0].list[0].nombre, 'Foco led')
+        self.assertNotEqual(catalog.obtener_catalogo(), catalogo)
+
+    def test_copia_local_vence(self):
+        with mock.patch.object(permissions.time, 'monotonic', return_value=100):
+            catalog.obtener_catalogo()
+        with mock.patch.object(permissions.time, 'monotonic', return_value=100 + catalog.DURACION_LOCAL - 1):
+            with self.assertNumQueries(0):
+                catalog.obtener_catalogo()
+        cache.delete(catalog.CACHE_INDICE_KEY)
+        with mock.patch.object(permissions.time, 'monotonic', return_value=100 + catalog.DURACION_LOCAL):
+            with self.assertNumQueries(1):
+                catalog.obtener_catalogo()
+
+    def test_invalidacion(self):
+        self.client.get(reverse('servicion'))
+        otra = Categoria.objects.create(nombre='Sensores', empresa=self.empresa)
+        producto = Producto.objects.create(nombre='Sensor PIR', precio=3, categoria=otra)
+        self.assertContains(self.client.get(reverse('servicion')), 'Sensor PIR')
+        producto.categoria = self.categoria
+        producto.save()
+        response = self.client.get(reverse('servicion'))
+        self.assertNotContains(response, 'Sensores')
+        producto.delete()
+        self.assertNotContains(self.client.get(reverse('servicion')), 'Sensor PIR')
+
+    def test_revalidacion(self):
+        response = self.client.get(reverse('servicion'))
+        response = self.client.get(reverse('servicion'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        Producto.objects.create(nombre='Sensor PIR', precio=3, categoria=self.categoria)
+        response = self.client.get(reverse('servicion'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class EmpresaTest(TestCase):
+    """
+    Verifica el acceso en caché a los datos de la empresa.
+    """
+
+    def setUp(self):
+        cache.clear()
+        company.empresas_locales.clear()
+
+    def test_empresa_en_cache(self):
+        self.assertIsNone(obtener_empresa())
+        empresa = Empresa.objects.create(nombre='gmeBox', contacto='gmeBox', email='empresa@gmebox.com')
+        self.assertEqual(obtener_empresa(), empresa)
+        with self.assertNumQueries(0):
+            self.assertEqual(obtener_empresa().nombre, 'gmeBox')
+        empresa.nombre = 'gmeBox S.A.'
+        empresa.save()
+        self.assertEqual(obtener_empresa().nombre, 'gmeBox S.A.')
+        empresa.delete()
+        self.assertIsNone(obtener_empresa())
+
+    def test_invalidacion_otro_proceso(self):
+        empresa = Empresa.objects.create(nombre='gmeBox', contacto='gmeBox', email='empresa@gmebox.com')
+        obtener_empresa()
+        # Otro proceso solo puede avisar el cambio con la versión en la caché compartida
+        Empresa.objects.filter(pk=empresa.pk).update(nombre='gmeBox S.A.')
+        cache.incr(company.CACHE_VERSION_KEY)
+        self.assertEqual(obtener_empresa().nombre, 'gmeBox S.A.')
+
+    def test_copia_local_vence(self):
+        Empresa.objects.create(nombre='gmeBox', contacto='gmeBox', email='empresa@gmebox.com')
+        with mock.patch.object(permissions.time, 'monotonic', return_value=100):
+            obtener_empresa()
+        with mock.patch.object(permissions.time, 'monotonic', return_value=100 + company.DURACION_LOCAL - 1):
+            with self.assertNumQueries(0):
+                obtener_empresa()
+        cache.delete(company.CACHE_KEY.format(company.obtener_version()))
+        with mock.patch.object(permissions.time, 'monotonic', return_value=100 + company.DURACION_LOCAL):
+            with self.assertNumQueries(1):
+                obtener_empresa()
+
+    def test_verificacion_al_iniciar(self):
+        self.assertEqual([error.id for error in checks.run_checks()], ['store.W001'])
+        Empresa.objects.create(nombre='gmeBox', contacto='gmeBox', email='empresa@gmebox.com')
+        self.assertEqual(checks.run_checks(), [])
+        Empresa.objects.all().delete()
+        with mock.patch.object(connection.introspection, 'table_names', return_value=[]):
+            self.assertEqual(checks.run_checks(), [])
+
+    def test_orden_sin_empresa(self):
+        usuario = Usuario.objects.create(
+            correo_electronico='admin@gmebox.com', nombre_de_usuario='admin', is_active=True, is_superuser=True)
+        cliente = Cliente.objects.create(nombre='Cliente', apellido='1', numero_identificacion='1')
+        self.client.force_login(usuario)
+        response = self.client.post(reverse('order-add'), {'cliente': cliente.id, 'descripcion': 'Laptop'})
+        self.assertContains(response, 'Debe agregar datos de empresa')
+        self.assertFalse(OrdenMantenimiento.objects.exists())
+
+
+class MiniaturasTest(MediaTemporalMixin, DatosBaseMixin, TestCase):
+    """
+    Verifica la generación de miniaturas de las imágenes de productos.
+    """
+    con_cliente = False
+
+    def setUp(self):
+        super(MiniaturasTest, self).setUp()
+        self.categoria = Categoria.objects.create(nombre='Leds', empresa=self.empresa)
+
+    def crear_producto(self):
+        contenido = BytesIO()
+        Image.new('RGBA', (600, 400), (255, 0, 0, 128)).save(contenido, 'PNG')
+        imagen = SimpleUploadedFile('led.png', contenido.getvalue(), content_type='image/png')
+        return Producto.objects.create(nombre='Tira led', image=imagen, categoria=self.categoria)
+
+    def test_generar_derivados(self):
+        producto = self.crear_producto()
+        self.assertEqual(producto.miniatura, producto.image)
+        image_hash = images.generar_derivados(producto.id)
+        producto.refresh_from_db()
+        self.assertEqual(producto.image_hash, image_hash)
+        storage = images.campo_imagen.storage
+        for ancho in images.ANCHOS:
+            for formato in images.FORMATOS:
+                self.assertTrue(storage.exists(images.ruta_derivado(image_hash, ancho, formato)))
+        with Image.open(storage.path(producto.miniatura.name)) as miniatura:
+            self.assertEqual(miniatura.size, (100, 67))
+        html = Template('{% load image_extras %}{% imagen_responsiva p.image p.image_hash 100 75 %}').render(
+            Context({'p': producto}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(images.srcset(image_hash, 'jpeg'), html)
+
+    def test_cambio_de_imagen_reinicia_hash(self):
+        producto = self.crear_producto()
+        images.generar_derivados(producto.id)
+        producto.refresh_from_db()
+        producto.image = SimpleUploadedFile('otro.png', b'', content_type='image/png')
+        producto.save()
+        producto.refresh_from_db()
+        self.assertEqual(producto.image_hash, '')
+
+    def test_miniaturas_en_trabajo(self):
+        producto = self.crear_producto()
+        trabajo = images.programar(producto.id, producto.image.name)
+        self.assertEqual((trabajo.tipo, trabajo.objeto_id, trabajo.usuario), ('MINIATURAS', producto.id, None))
+        self.assertEqual(images.programar(producto.id, producto.image.name), trabajo)
+        self.assertNotEqual(images.programar(producto.id, 'gallery/products/otra.png'), trabajo)
+        self.assertTrue(jobs.tomar(trabajo.pk))
+        self.assertEqual(jobs.generar(trabajo.pk), 'TERMINADO')
+        producto.refresh_from_db()
+        self.assertTrue(producto.image_hash)
+
+    def test_formato_respaldo(self):
+        self.assertEqual(images.FORMATO_RESPALDO, 'jpeg')
+        self.assertEqual(images.formato_respaldo(('webp', 'png')), 'png')
+        self.assertEqual(images.formato_respaldo(('png', 'webp', 'jpeg')), 'jpeg')
+        self.assertEqual(images.formato_respaldo(('webp',)), 'webp')
+
+
+class TrabajosPdfTest(MediaTemporalMixin, DatosBaseMixin, TestCase):
+    """
+    Verifica la cola de generación de PDF.
+    """
+
+    def setUp(self):
+        super(TrabajosPdfTest, self).setUp()
+        self.factura = Factura.objects.create(fecha_venta=date.today(), cliente=self.cliente, empresa=self.empresa)
+        self.usuario = self.iniciar_sesion_administrador()
+
+    def test_solicitud_responde_202_sin_duplicar(self):
+        url = reverse('invoice-download', kwargs={'pk': self.factura.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 202)
+        trabajo = TrabajoPdf.objects.get()
+        self.assertEqual(response['Location'], reverse('pdf-job', kwargs={'pk': trabajo.pk}))
+        self.assertEqual(self.client.get(url).status_code, 202)
+        self.assertEqual(TrabajoPdf.objects.count(), 1)
+
+    def test_un_trabajo_en_curso_por_clave(self):
+        trabajo = jobs.solicitar('FACTURA', self.factura.pk, self.usuario)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TrabajoPdf.objects.create(tipo='FACTURA', objeto_id=self.factura.pk, clave=trabajo.clave)
+        # Otra solicitud creó el trabajo después de la consulta previa
+        with mock.patch('django.db.models.query.QuerySet.first', return_value=None):
+            self.assertEqual(jobs.solicitar('FACTURA', self.factura.pk, self.usuario), trabajo)
+        TrabajoPdf.objects.filter(pk=trabajo.pk).update(estado='TERMINADO')
+        self.assertNotEqual(jobs.solicitar('FACTURA', self.factura.pk, self.usuario), trabajo)
+
+    def test_trabajo_se_toma_una_vez(self):
+        trabajo = jobs.solicitar('FACTURA', self.factura.pk, self.usuario)
+        self.assertTrue(jobs.tomar(trabajo.pk))
+        self.assertFalse(jobs.tomar(trabajo.pk))
+
+    def test_descarga_trabajo_terminado(self):
+        trabajo = jobs.solicitar('FACTURA', self.factura.pk, self.usuario)
+        trabajo.archivo.save('factura.pdf', ContentFile(b'%PDF-1.4'), save=False)
+        trabajo.estado = 'TERMINADO'
+        trabajo.save()
+        response = self.client.get(reverse('pdf-job', kwargs={'pk': trabajo.pk}))
+        self.assertRedirects(response, reverse('pdf-job-download', kwargs={'pk': trabajo.pk}),
+                             fetch_redirect_response=False)
+        response = self.client.get(reverse('pdf-job-download', kwargs={'pk': trabajo.pk}))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+        self.assertIn('factura.pdf', response['Content-Disposition'])
+
+
+class CachePdfTest(DatosBaseMixin, TestCase):
+    """
+    Verifica la caché de PDF de documentos finales.
+    """
+
+    def setUp(self):
+        super(CachePdfTest, self).setUp()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+        configuracion = override_settings(PDF_CACHE_DIR=self.directorio, PDF_CACHE_TAMANIO=25)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        self.factura = Factura.objects.create(
+            fecha_venta=date.today(), cliente=self.cliente, empresa=self.empresa, estado='PAGADO')
+        self.iniciar_sesion_administrador()
+        self.url = reverse('invoice-download', kwargs={'pk': self.factura.pk})
+
+    def guardar_factura(self, contenido=b'0123456789'):
+        clave = pdf_cache.clave_documento('FACTURA', Factura.objects.get(pk=self.factura.pk))
+        pdf_cache.guardar('FACTURA', self.factura.pk, clave, contenido)
+        return clave
+
+    def test_descarga_desde_cache(self):
+        clave = self.guardar_factura()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertFalse(TrabajoPdf.objects.exists())
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=20-').status_code, 416)
+        self.assertIsNotNone(pdf_cache.obtener('FACTURA', self.factura.pk, clave))
+
+    def test_invalidacion_al_cambiar_detalles(self):
+        clave = self.guardar_factura()
+        DetalleFactura.objects.create(factura=self.factura, cantidad=1, precio_unitario=5)
+        self.assertIsNone(pdf_cache.obtener('FACTURA', self.factura.pk, clave))
+        self.assertEqual(self.client.get(self.url).status_code, 202)
+
+    def test_desalojo_lru(self):
+        pdf_cache.guardar('PAGO', 1, 'a', b'0123456789')
+        pdf_cache.guardar('PAGO', 2, 'b', b'0123456789')
+        os.utime(pdf_cache.ruta('PAGO', 1, 'a'), (0, 0))
+        pdf_cache.obtener('PAGO', 2, 'b')
+        pdf_cache.guardar('PAGO', 3, 'c', b'0123456789')
+        self.assertIsNone(pdf_cache.obtener('PAGO', 1, 'a'))
+        self.assertIsNotNone(pdf_cache.obtener('PAGO', 2, 'b'))
+        self.assertIsNotNone(pdf_cache.obtener('PAGO', 3, 'c'))
+
+
+class RecursosReporteTest(TestCase):
+    """
+    Verifica que los recursos de los reportes se leen desde disco.
+    """
+
+    def test_archivos_estaticos_desde_disco(self):
+        recurso = pdf_assets.url_fetcher('http://localhost:8000/static/images/logo.png')
+        self.assertEqual(recurso['mime_type'], 'image/png')
+        self.assertTrue(recurso['string'].startswith(b'\x89PNG'))
+        self.assertEqual(pdf_assets.url_fetcher('/static/css/reporte.css')['mime_type'], 'text/css')
+
+    def test_urls_externas_fallan(self):
+        for url in ('https://maxcdn.bootstrapcdn.com/bootstrap/3.3.6/css/bootstrap.min.css',
+                    'http://localhost:8000/static/../gmeBox/settings.py',
+                    'http://localhost:8000/media/../gmeBox/settings.py',
+                    'file:///etc/passwd'):
+            with self.assertRaises(pdf_assets.RecursoExterno):
+                pdf_assets.url_fetcher(url)
+
+
+class ExportacionPdfTest(MediaTemporalMixin, DatosBaseMixin, TestCase):
+    """
+    Verifica los filtros, el armado por partes y los trabajos de la exportación de PDF.
+    """
+
+    def setUp(self):
+        super(ExportacionPdfTest, self).setUp()
+        otro = Cliente.objects.create(nombre='Cliente', apellido='2', numero_identificacion='2')
+        self.facturas = [
+            Factura.objects.create(fecha_venta=date(2020, 1, dia), cliente=cliente, empresa=self.empresa,
+                                  estado=estado)
+            for dia, cliente, estado in ((3, self.cliente, 'PAGADO'), (1, self.cliente, 'POR_PAGAR'),
+                                         (2, otro, 'PAGADO'), (20, self.cliente, 'PAGADO'))]
+
+    def test_filtros(self):
+        ids = [factura.id for factura in self.facturas]
+        self.assertEqual(pdf_batch.filtrar('FACTURA'), [ids[1], ids[2], ids[0], ids[3]])
+        self.assertEqual(pdf_batch.filtrar('FACTURA', desde=date(2020, 1, 2), hasta=date(2020, 1, 10)),
+                         [ids[2], ids[0]])
+        self.assertEqual(pdf_batch.filtrar('FACTURA', cliente=self.cliente.id, estado='PAGADO'), [ids[0], ids[3]])
+        with mock.patch.object(pdf_batch, 'MAXIMO', 3), self.assertRaises(pdf_batch.ExportacionExcedida):
+            pdf_batch.filtrar('FACTURA')
+
+    def test_zip_por_partes(self):
+        salida = pdf_batch.SalidaZip()
+        partes = []
+        with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as archivo_zip:
+            for numero in range(3):
+                archivo_zip.writestr(pdf_batch.nombre_archivo('FACTURA', numero), b'%PDF' * 100)
+                partes.append(salida.vaciar())
+        partes.append(salida.vaciar())
+        self.assertTrue(all(partes[:3]))
+        with zipfile.ZipFile(BytesIO(b''.join(partes))) as archivo_zip:
+            self.assertEqual(archivo_zip.namelist(), ['factura-000000.pdf', 'factura-000001.pdf', 'factura-000002.pdf'])
+            self.assertEqual(archivo_zip.read('factura-000001.pdf'), b'%PDF' * 100)
+
+    def test_exportacion_en_trabajo(self):
+        usuario = self.iniciar_sesion_administrador()
+        response = self.client.get(reverse('invoices-export'), {'cliente': self.cliente.id, 'estado': 'PAGADO'})
+        self.assertEqual(response.status_code, 202)
+        trabajo = TrabajoPdf.objects.get()
+        self.assertEqual((trabajo.tipo, trabajo.usuario, trabajo.nombre_archivo),
+                         ('EXPORTACION_FACTURA', usuario, 'facturas.zip'))
+        self.client.get(reverse('invoices-export'), {'cliente': self.cliente.id, 'estado': 'PAGADO'})
+        self.assertEqual(TrabajoPdf.objects.count(), 1)
+        progreso = reverse('pdf-export-progress', kwargs={'pk': trabajo.pk})
+        self.assertEqual(self.client.get(progreso).json(), {'estado': 'PENDIENTE', 'hechos': 0, 'total': 0})
+        with mock.patch.object(pdf_batch, 'renderizar', side_effect=lambda tipo, objeto_id: (
+                pdf_batch.nombre_archivo(tipo, objeto_id), b'%PDF')):
+            self.assertEqual(jobs.generar(trabajo.pk), 'TERMINADO')
+        self.assertEqual(self.client.get(progreso).json(), {'estado': 'TERMINADO', 'hechos': 2, 'total': 2})
+        response = self.client.get(reverse('pdf-job-download', kwargs={'pk': trabajo.pk}))
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('facturas.zip', response['Content-Disposition'])
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archivo_zip:
+            self.assertEqual(archivo_zip.namelist(), [pdf_batch.nombre_archivo('FACTURA', self.facturas[0].id),
+                                                      pdf_batch.nombre_archivo('FACTURA', self.facturas[3].id)])
+
+    def test_exportacion_rechazada_o_ajena(self):
+        self.iniciar_sesion_administrador()
+        self.assertEqual(self.client.get(reverse('invoices-export'), {'desde': 'ayer'}).status_code, 400)
+        with mock.patch.object(pdf_batch, 'MAXIMO', 3):
+            response = self.client.get(reverse('invoices-export'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'3 documentos', response.content)
+        self.assertFalse(TrabajoPdf.objects.exists())
+        otro = Usuario.objects.create(correo_electronico='otro@gmebox.com', nombre_de_usuario='otro')
+        trabajo = pdf_batch.solicitar('FACTURA', otro, 'facturas')
+        self.assertEqual(self.client.get(reverse('pdf-export-progress', kwargs={'pk': trabajo.pk})).status_code, 404)
+
+
+class ExportacionDatosTest(DatosBaseMixin, TestCase):
+    """
+    Verifica la exportación en CSV y Excel de los listados.
+    """
+    con_cliente = False
+
+    def setUp(self):
+        super(ExportacionDatosTest, self).setUp()
+        cliente = Cliente.objects.create(nombre='Ana', apellido='Ruiz', numero_identificacion='1')
+        self.facturas = [Factura.objects.create(fecha_venta=date(2020, 1, dia), cliente=cliente, empresa=self.empresa,
+                                                total=Decimal(dia)) for dia in range(1, 4)]
+        DetalleFactura.objects.create(factura=self.facturas[0], detalle='Teclado', cantidad=1)
+        DetalleFactura.objects.create(factura=self.facturas[1], detalle='Mouse', cantidad=2)
+        self.iniciar_sesion_administrador()
+
+    def leer(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_csv_columnas(self):
+        response = self.client.get(reverse('invoices-data'), {'columnas': 'id,fecha_venta,total'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        with self.assertNumQueries(1):
+            contenido = self.leer(response).decode('utf-8-sig')
+        filas = list(csv.reader(StringIO(contenido)))
+        self.assertEqual(filas[0], ['Id', 'Fecha de venta', 'Total'])
+        self.assertEqual(filas[1:], [[str(factura.id), factura.fecha_venta.isoformat(), str(factura.total) + '.00']
+                                     for factura in reversed(self.facturas)])
+
+    def test_columna_invalida(self):
+        response = self.client.get(reverse('invoices-data'), {'columnas': 'id,clave'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_detalles_filtrados(self):
+        response = self.client.get(reverse('invoice-details-data'), {'filter': 'mou', 'columnas': 'factura,detalle'})
+        filas = list(csv.reader(StringIO(self.leer(response).decode('utf-8-sig'))))
+        self.assertEqual(filas[1:], [[str(self.facturas[1].id), 'Mouse']])
+        response = self.client.get(reverse('invoice-details-data', kwargs={'invoice_id': self.facturas[0].id}))
+        self.assertEqual(len(list(csv.reader(StringIO(self.leer(response).decode('utf-8-sig'))))), 2)
+
+    def test_busqueda_sin_limite_en_orden_del_cursor(self):
+        Factura.objects.filter(pk=self.facturas[0].pk).update(fecha_venta=date(2020, 1, 10))
+        with mock.patch.object(search, 'MAX_RESULTADOS', 1), mock.patch.object(search, 'buscar') as buscar:
+            response = self.client.get(reverse('invoices-data'), {'filter': 'Ruiz', 'columnas': 'id'})
+            filas = list(csv.reader(StringIO(self.leer(response).decode('utf-8-sig'))))
+        buscar.assert_not_called()
+        self.assertEqual(filas[1:], [[str(self.facturas[indice].id)] for indice in (0, 2, 1)])
+
+    def test_xlsx(self):
+        response = self.client.get(reverse('invoices-data'), {'formato': 'xlsx', 'columnas': 'id,total'})
+        with zipfile.ZipFile(BytesIO(self.leer(response))) as libro:
+            hoja = libro.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertEqual(hoja.count('<row>'), 4)
+        self.assertIn('<c><v>{}</v></c><c><v>3.00</v></c>'.format(self.facturas[2].id), hoja)
+
+
+class ImportacionTest(MediaTemporalMixin, DatosBaseMixin, TestCase):
+    """
+    Verifica la importación en bloque de productos, clientes y compras.
+    """
+    con_cliente = False
+
+    def setUp(self):
+        super(ImportacionTest, self).setUp()
+        self.categoria = Categoria.objects.create(nombre='Leds', empresa=self.empresa)
+        Proveedor.objects.create(nombre='Electro', contacto='Luis', email='electro@gmebox.com')
+
+    def archivo(self, contenido, nombre):
+        archivo = BytesIO(contenido.encode('utf-8'))
+        archivo.name = nombre
+        return archivo
+
+    def test_productos_csv(self):
+        contenido = 'nombre,categoria,precio\nLed rojo,leds,1.50\nLed azul,Leds,\n'
+        resultado = importer.importar_archivo('PRODUCTO', self.archivo(contenido, 'productos.csv'))
+        self.assertTrue(resultado.valido)
+        self.assertEqual(resultado.creados['productos'], 2)
+        self.assertEqual(Producto.objects.get(nombre='Led rojo').precio, Decimal('1.50'))
+        self.assertEqual(Producto.objects.get(nombre='Led azul').precio, Decimal('0'))
+
+    def test_errores_por_fila(self):
+        contenido = 'nombre,categoria,precio\nLed rojo,Leds,abc\nLed azul,Otra,1\nLed verde,Leds,1\nLed verde,Leds,2\n'
+        resultado = importer.importar_archivo('PRODUCTO', self.archivo(contenido, 'productos.csv'))
+        self.assertEqual([numero for numero, mensaje in resultado.errores], [2, 3, 5])
+        self.assertTrue(resultado.errores[0][1].startswith('precio:'))
+        self.assertFalse(Producto.objects.exists())
+
+    def test_clientes_json(self):
+        Cliente.objects.create(nombre='Ana', apellido='Ruiz', numero_identificacion='1')
+        filas = [
+            {'nombre': 'Luis', 'apellido': 'Paz', 'numero_identificacion': '1710034065',
+             'tipo_documento_identificacion': 'DNI', 'correo_electronico': 'luis@gmebox.com'},
+            {'nombre': 'Eva', 'apellido': 'Sol', 'numero_identificacion': '3'},
+        ]
+        resultado = importer.importar_archivo('CLIENTE', self.archivo(json.dumps(filas), 'clientes.json'))
+        self.assertTrue(resultado.valido)
+        self.assertEqual(dict(resultado.creados), {'clientes': 2, 'usuarios': 1})
+        usuario = Usuario.objects.get(correo_electronico='luis@gmebox.com')
+        self.assertEqual(usuario.persona.numero_identificacion, '1710034065')
+        self.assertTrue(usuario.check_password('1710034065'))
+        self.assertEqual(list(usuario.groups.values_list('name', flat=True)), ['CLIENTE'])
+        self.assertEqual(Cliente.objects.count(), 3)
+
+        filas = [{'nombre': 'Ana', 'apellido': 'Ruiz', 'numero_identificacion': '1'},
+                 {'nombre': 'Leo', 'apellido': 'Mar', 'numero_identificacion': '0102030405',
+                  'tipo_documento_identificacion': 'DNI'},
+                 {'nombre': 'Leo', 'apellido': 'Mar', 'numero_identificacion': '4', 'correo_electronico': 'LUIS@gmebox.com'}]
+        resultado = importer.importar_archivo('CLIENTE', self.archivo(json.dumps(filas), 'clientes.json'))
+        self.assertEqual([numero for numero, mensaje in resultado.errores], [1, 2, 3])
+
+    def test_compras_en_varios_lotes(self):
+        Producto.objects.bulk_create([Producto(nombre='Led', categoria=self.categoria),
+                                      Producto(nombre='Sensor', categoria=self.categoria)])
+        contenido = ('compra,fecha_compra,proveedor,producto,cantidad,precio_unitario,impuesto\n'
+                     'A,2020-01-01,Electro,Led,2,1.50,0.30\n'
+                     'A,,,Sensor,1,10,\n'
+                     'B,2020-01-02,electro,Led,5,1.50,\n')
+        with mock.patch.object(importer, 'TAMANIO_LOTE', 2):
+            resultado = importer.importar_archivo('COMPRA', self.archivo(contenido, 'compras.csv'))
+        self.assertTrue(resultado.valido)
+        self.assertEqual(dict(resultado.creados), {'compras': 2, 'detalles': 3})
+        compra = Compra.objects.get(fecha_compra=date(2020, 1, 1))
+        self.assertEqual((compra.subtotal, compra.impuesto, compra.total),
+                         (Decimal('13.00'), Decimal('0.30'), Decimal('13.30')))
+        self.assertEqual(dict(Producto.objects.values_list('nombre', 'cantidad')), {'Led': 7, 'Sensor': 1})
+        self.assertEqual(stock.diferencias(), [])
+
+    def test_simulacion(self):
+        contenido = 'nombre,categoria\nLed rojo,Leds\n'
+        resultado = importer.importar_archivo('PRODUCTO', self.archivo(contenido, 'productos.csv'), simulacion=True)
+        self.assertEqual(resultado.creados['productos'], 1)
+        self.assertFalse(Producto.objects.exists())
+
+    def test_simulacion_de_clientes_sin_contrasenias(self):
+        filas = [{'nombre': 'Luis', 'apellido': 'Paz', 'numero_identificacion': '5',
+                  'correo_electronico': 'luis@gmebox.com'}]
+        with mock.patch.object(credentials, 'hashear_lote') as hashear_lote:
+            resultado = importer.importar_archivo('CLIENTE', self.archivo(json.dumps(filas), 'clientes.json'),
+                                                  simulacion=True)
+        self.assertEqual(dict(resultado.creados), {'clientes': 1, 'usuarios': 1})
+        self.assertFalse(hashear_lote.called)
+        self.assertFalse(Usuario.objects.filter(correo_electronico='luis@gmebox.com').exists())
+
+    def test_administrador_en_trabajo(self):
+        usuario = Usuario.objects.create(correo_electronico='admin@gmebox.com', nombre_de_usuario='admin',
+                                         is_active=True, is_staff=True, is_superuser=True)
+        self.client.force_login(usuario)
+        url = reverse('admin:store_producto_importar')
+        self.assertContains(self.client.get(reverse('admin:store_producto_changelist')), url)
+        response = self.client.post(url, {'archivo': SimpleUploadedFile('productos.csv', b'nombre,categoria\nLed,Leds\n')})
+        trabajo = TrabajoPdf.objects.get(tipo='IMPORTACION', usuario=usuario)
+        self.assertRedirects(response, '{}?trabajo={}'.format(url, trabajo.pk), fetch_redirect_response=False)
+        self.assertContains(self.client.get(url, {'trabajo': trabajo.pk}), 'Importando el archivo')
+        self.assertFalse(Producto.objects.exists())
+        self.assertEqual(jobs.generar(trabajo.pk), 'TERMINADO')
+        trabajo.refresh_from_db()
+        self.assertFalse(trabajo.archivo)
+        self.assertRedirects(self.client.get(url, {'trabajo': trabajo.pk}), reverse('admin:store_producto_changelist'))
+        self.assertTrue(Producto.objects.filter(nombre='Led').exists())
+
+        contenido = b'nombre,categoria\nLed,Otra\nSensor,Otra\n'
+        self.client.post(url, {'archivo': SimpleUploadedFile('productos.csv', contenido), 'simulacion': 'on'})
+        trabajo = TrabajoPdf.objects.filter(tipo='IMPORTACION').latest('id')
+        avances = []
+        validar = importer.ImportadorProductos.validar
+
+        def validar_viendo_avance(importador, lote, resultado):
+            avances.append(self.client.get(url, {'trabajo': trabajo.pk}).context['filas'])
+            return validar(importador, lote, resultado)
+        with mock.patch.object(importer, 'MAX_ERRORES', 1), mock.patch.object(importer, 'TAMANIO_LOTE', 1), \
+                mock.patch.object(importer.ImportadorProductos, 'validar', validar_viendo_avance):
+            self.assertTrue(jobs.tomar(trabajo.pk))
+            jobs.generar(trabajo.pk)
+        self.assertEqual(avances, [0, 1])
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.hechos, 2)
+        response = self.client.get(url, {'trabajo': trabajo.pk})
+        self.assertContains(response, '2 filas con errores')
+        self.assertEqual(len(response.context['errores']), 1)
+        otro = Usuario.objects.create(correo_electronico='otro@gmebox.com', nombre_de_usuario='otro',
+                                      is_active=True, is_staff=True, is_superuser=True)
+        self.client.force_login(otro)
+        self.assertEqual(self.client.get(url, {'trabajo': trabajo.pk}).status_code, 404)
+
+
+class ReservaStockTest(DatosBaseMixin, TransactionTestCase):
+    """
+    Verifica que las reservas de stock concurrentes nunca venden más unidades
+    de las disponibles.
+    """
+    con_cliente = False
+    hilos = 8
+    intentos = 40
+    # SQLite en memoria no espera a que se libere la tabla, se reintenta con
+    # espera creciente hasta el plazo
+    plazo = 10
+    espera = 0.001
+
+    def setUp(self):
+        super(ReservaStockTest, self).setUp()
+        self.categoria = Categoria.objects.create(nombre='Leds', empresa=self.empresa)
+
+    def crear_producto(self, cantidad):
+        return Producto.objects.create(nombre='Tira led', cantidad=cantidad, categoria=self.categoria)
+
+    def concurrentemente(self, funcion, argumentos):
+        def ejecutar(argumento):
+            limite = time.monotonic() + self.plazo
+            espera = self.espera
+            try:
+                while True:
+                    try:
+                        funcion(argumento)
+                        return True
+                    except OperationalError as e:
+                        bloqueada = connection.vendor == 'sqlite' and 'locked' in str(e)
+                        if not bloqueada or time.monotonic() + espera > limite:
+                            raise
+                        time.sleep(espera)
+                        espera = min(espera * 2, 0.1)
+            except stock.StockInsuficiente:
+                return False
+            finally:
+                connections.close_all()
+        with ThreadPoolExecutor(max_workers=self.hilos) as pool:
+            return list(pool.map(ejecutar, argumentos))
+
+    def test_reserva_verifica_cantidad_solicitada(self):
+        producto = self.crear_producto(3)
+        with self.assertRaises(stock.StockInsuficiente):
+            producto.reservar(4)
+        producto.reservar(3)
+        self.assertEqual(producto.cantidad, 0)
+
+    def test_reservas_concurrentes(self):
+        producto = self.crear_producto(10)
+        resultados = self.concurrentemente(
+            lambda _: Producto(pk=producto.pk).reservar(1), range(self.intentos))
+        self.assertEqual(resultados.count(True), 10)
+        producto.refresh_from_db()
+        self.assertEqual(producto.cantidad, 0)
+
+    def test_reservas_por_lote_concurrentes(self):
+        productos = [self.crear_producto(6), self.crear_producto(6)]
+        lineas = [(productos[0].id, 2), (productos[1].id, 1), (productos[0].id, 1)]
+        resultados = self.concurrentemente(
+            lambda _: stock.reservar_lote(lineas), range(self.intentos))
+        self.assertEqual(resultados.count(True), 2)
+        self.assertEqual(
+            [p.cantidad for p in Producto.objects.filter(pk__in=[p.id for p in productos]).order_by('id')],
+            [0, 4])
+
+    def test_lineas_de_venta_concurrentes(self):
+        producto = self.crear_producto(5)
+        cliente = Cliente.objects.create(nombre='Cliente', apellido='1', numero_identificacion='1')
+        factura = Factura.objects.create(fecha_venta=date.today(), cliente=cliente, empresa=self.empresa)
+
+        def vender(_):
+            with transaction.atomic():
+                DetalleFactura.objects.create(factura=factura, producto=producto, cantidad=2)
+        resultados = self.concurrentemente(vender, range(self.intentos))
+        self.assertEqual(resultados.count(True), 2)
+        self.assertEqual(DetalleFactura.objects.filter(factura=factura).count(), 2)
+        producto.refresh_from_db()
+        self.assertEqual(producto.cantidad, 1)
+
+    def test_venta_sin_stock_no_se_guarda(self):
+        producto = self.crear_producto(1)
+        cliente = Cliente.objects.create(nombre='Cliente', apellido='1', numero_identificacion='1')
+        factura = Factura.objects.create(fecha_venta=date.today(), cliente=cliente, empresa=self.empresa)
+        with self.assertRaises(stock.StockInsuficiente):
+            DetalleFactura.objects.create(factura=factura, producto=producto, cantidad=2)
+        producto.refresh_from_db()
+        self.assertEqual(producto.cantidad, 1)
+
+
+class StockTest(DatosBaseMixin, TestCase):
+    """
+    Verifica el stock que mantienen las señales de las líneas de compra y
+    venta y su reconstrucción desde el historial.
+    """
+
+    def setUp(self):
+        super(StockTest, self).setUp()
+        categoria = Categoria.objects.create(nombre='Leds', empresa=self.empresa)
+        self.producto = Producto.objects.create(nombre='Tira led', cantidad=0, categoria=categoria)
+        proveedor = Proveedor.objects.create(nombre='Electro', contacto='Luis', email='electro@gmebox.com')
+        self.compra = Compra.objects.create(fecha_compra=date.today(), proveedor=proveedor)
+        self.factura = Factura.objects.create(fecha_venta=date.today(), cliente=self.cliente, empresa=self.empresa)
+
+    def cantidad(self):
+        return Producto.objects.values_list('cantidad', flat=True).get(pk=self.producto.pk)
+
+    def comprar(self, cantidad):
+        return DetalleCompra.objects.create(compra=self.compra, producto=self.producto, cantidad=cantidad,
+                                            precio_unitario=Decimal('1.00'))
+
+    def vender(self, cantidad):
+        return DetalleFactura.objects.create(factura=self.factura, producto=self.producto, cantidad=cantidad)
+
+    def test_movimientos_por_senales(self):
+        compra = self.comprar(10)
+        venta = self.vender(4)
+        self.assertEqual(self.cantidad(), 6)
+        venta.cantidad = 6
+        venta.save()
+        self.assertEqual(self.cantidad(), 4)
+        compra.cantidad = 8
+        compra.save()
+        self.assertEqual(self.cantidad(), 2)
+        venta.delete()
+        self.assertEqual(self.cantidad(), 8)
+
+    def test_eliminar_compra_vendida_deja_cero(self):
+        compra = self.comprar(5)
+        self.vender(3)
+        compra.delete()
+        self.assertEqual(self.cantidad(), 0)
+        compra = self.comprar(5)
+        compra.cantidad = 1
+        compra.save()
+        self.assertEqual(self.cantidad(), 1)
+
+    def test_ajustar_lote_no_deja_negativos(self):
+        self.comprar(2)
+        stock.ajustar_lote({self.producto.id: -5})
+        self.assertEqual(self.cantidad(), 0)
+
+    def test_recalcular_stock(self):
+        self.comprar(10)
+        self.vender(3)
+        Producto.objects.filter(pk=self.producto.pk).update(cantidad=50)
+        salida = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('recalcular_stock', '--verificar', stdout=salida)
+        self.assertIn('Producto {}: guardado 50, historial 7'.format(self.producto.id), salida.getvalue())
+        self.assertEqual(self.cantidad(), 50)
+        call_command('recalcular_stock', stdout=StringIO())
+        self.assertEqual(self.cantidad(), 7)
+        call_command('recalcular_stock', '--verificar', stdout=salida)
+        self.assertIn('0 productos con diferencias', salida.getvalue())
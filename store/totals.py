@@ -0,0 +1,109 @@
+from decimal import Decimal
+
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from store import dashboard, receivables
+from store.models import (Compra, DetalleCompra, DetalleFactura, DetalleOrden, Factura,
+                          OrdenMantenimiento, PagoFactura)
+
+DECIMAL = DecimalField(max_digits=12, decimal_places=2)
+CERO = Decimal('0.00')
+
+
+def suma_relacionada(queryset, relacion, campo, output_field=DECIMAL, vacio=CERO):
+    """
+    Subconsulta con la suma de un campo de las filas relacionadas con cada padre.
+    """
+    filas = queryset.filter(**{relacion: OuterRef('pk')}).order_by().values(
+        relacion).annotate(suma=Sum(campo)).values('suma')
+    return Coalesce(Subquery(filas, output_field=output_field), Value(vacio), output_field=output_field)
+
+
+def redondear(valor):
+    return Decimal(valor).quantize(CERO)
+
+
+def escribir_cambios(model, fila, valores):
+    """
+    Actualiza solo las columnas cuyo valor calculado es distinto al guardado y
+    registra el cambio en el resumen del tablero y, si es una factura, en la
+    cartera.
+    """
+    cambios = {campo: valor for campo, valor in valores.items() if fila[campo] != valor}
+    if cambios:
+        model.objects.filter(pk=fila['id']).update(**cambios)
+        dashboard.registrar_actualizacion(model, fila, cambios)
+        if model is Factura:
+            receivables.invalidar()
+    return cambios
+
+
+def totales_facturas(queryset):
+    """
+    Calcula en una sola consulta el subtotal, impuesto, total, monto pagado y
+    estado de cada factura del queryset. Una factura sin valor no se marca
+    como pagada.
+    """
+    filas = queryset.order_by().annotate(
+        suma_subtotal=suma_relacionada(DetalleFactura.objects, 'factura', 'total'),
+        suma_impuesto=suma_relacionada(DetalleFactura.objects, 'factura', 'impuesto'),
+        suma_pagos=suma_relacionada(PagoFactura.objects, 'factura', 'monto'),
+    ).values('id', 'empresa_id', 'fecha_venta', 'subtotal', 'impuesto', 'total', 'monto_pagado', 'estado',
+             'suma_subtotal', 'suma_impuesto', 'suma_pagos')
+    for fila in filas:
+        subtotal = redondear(fila['suma_subtotal'])
+        impuesto = redondear(fila['suma_impuesto'])
+        pagado = redondear(fila['suma_pagos'])
+        total = subtotal + impuesto
+        yield fila, {
+            'subtotal': subtotal,
+            'impuesto': impuesto,
+            'total': total,
+            'monto_pagado': pagado,
+            'estado': 'PAGADO' if total > CERO and pagado == total else 'POR_PAGAR',
+        }
+
+
+def recalcular_facturas(queryset):
+    return sum(1 for fila, valores in totales_facturas(queryset)
+               if escribir_cambios(Factura, fila, valores))
+
+
+def totales_compras(queryset):
+    """
+    Calcula en una sola consulta el subtotal, impuesto y total de cada compra del queryset.
+    """
+    filas = queryset.order_by().annotate(
+        suma_subtotal=suma_relacionada(DetalleCompra.objects, 'compra', 'total'),
+        suma_impuesto=suma_relacionada(DetalleCompra.objects, 'compra', 'impuesto'),
+    ).values('id', 'subtotal', 'impuesto', 'total', 'suma_subtotal', 'suma_impuesto')
+    for fila in filas:
+        subtotal = redondear(fila['suma_subtotal'])
+        impuesto = redondear(fila['suma_impuesto'])
+        yield fila, {
+            'subtotal': subtotal,
+            'impuesto': impuesto,
+            'total': subtotal + impuesto,
+        }
+
+
+def recalcular_compras(queryset):
+    return sum(1 for fila, valores in totales_compras(queryset)
+               if escribir_cambios(Compra, fila, valores))
+
+
+def montos_ordenes(queryset):
+    """
+    Calcula en una sola consulta el monto de servicio de cada orden del queryset.
+    """
+    filas = queryset.order_by().annotate(
+        suma_monto=suma_relacionada(DetalleOrden.objects, 'orden_mantenimiento', 'precio_servicio'),
+    ).values('id', 'empresa_id', 'fecha_registro', 'estado', 'monto_servicio', 'suma_monto')
+    for fila in filas:
+        yield fila, {'monto_servicio': redondear(fila['suma_monto'])}
+
+
+def recalcular_ordenes(queryset):
+    return sum(1 for fila, valores in montos_ordenes(queryset)
+               if escribir_cambios(OrdenMantenimiento, fila, valores))
@@ -83,5 +83,24 @@ urlpatterns = [
     path('invoices/<int:invoice_id>/payments/<int:pk>/delete',
          views.PagoFacturaDeleteView.as_view(), name='invoice-payment-delete'),
     path('invoices/<int:invoice_id>/payments/<int:pk>/download',
-         views.PagoFacturaDetailViewDownloadView.as_view(), name='invoice-payment-download')
+         views.PagoFacturaDetailViewDownloadView.as_view(), name='invoice-payment-download'),
+
+    path('pdf/<int:pk>/', views.TrabajoPdfView.as_view(), name='pdf-job'),
+    path('pdf/<int:pk>/download', views.TrabajoPdfDownloadView.as_view(), name='pdf-job-download'),
+    path('invoices/export/', views.FacturaExportacionView.as_view(), name='invoices-export'),
+    path('orders/export/', views.OrdenExportacionView.as_view(), name='orders-export'),
+    path('pdf/export/<int:pk>/', views.ExportacionProgresoView.as_view(), name='pdf-export-progress'),
+
+    path('invoices/data/', views.FacturaDatosExportacionView.as_view(), name='invoices-data'),
+    path('orders/data/', views.OrdenDatosExportacionView.as_view(), name='orders-data'),
+    path('invoices/details/data/', views.DetalleFacturaExportacionView.as_view(), name='invoice-details-data'),
+    path('invoices/<int:invoice_id>/details/data/',
+         views.DetalleFacturaExportacionView.as_view(), name='invoice-details-data'),
+    path('invoices/payments/data/', views.PagoFacturaExportacionView.as_view(), name='invoice-payments-data'),
+    path('invoices/<int:invoice_id>/payments/data/',
+         views.PagoFacturaExportacionView.as_view(), name='invoice-payments-data'),
+
+    path('sales-report', views.VentasReporteView.as_view(), name='sales-report'),
+    path('receivables-report', views.CarteraReporteView.as_view(), name='receivables-report'),
+    path('stock-forecast', views.PronosticoStockView.as_view(), name='stock-forecast'),
 ]
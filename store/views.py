@@ -1,37 +1,71 @@
+import mimetypes
 from datetime import datetime
 from django_weasyprint.views import CONTENT_TYPE_PNG
-from django_weasyprint import WeasyTemplateResponseMixin
-from utils.views import CustomUserOnlyMixin, CustomGroupOnlyMixin
-from django.contrib.auth.models import Group
-from django.contrib.auth.hashers import check_password, make_password
-from django.core.exceptions import ValidationError
+from utils.permissions import obtener_permisos
+from utils.queries import QueryProfile
+from utils.views import CustomUserOnlyMixin, CustomGroupOnlyMixin, CursorPaginationMixin, QueryProfileMixin
+from django.db import transaction
 from django.db.models import Q
 from django.urls import reverse
-from django.views.generic import ListView, DetailView, TemplateView
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+from django.views.generic import ListView, DetailView, TemplateView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.urls import reverse_lazy
 from django.contrib.messages.views import SuccessMessageMixin
-from django.http import HttpResponseRedirect
+from django.http import FileResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.core.exceptions import PermissionDenied
-from people.models import Usuario
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from people import views
-from django.contrib import messages
-from store.models import (Tecnico, OrdenMantenimiento, Cliente, DetalleOrden, Producto,
-                          Empresa, RevisionTecnica, Factura, DetalleFactura, PagoFactura)
+from people import credentials
+from store import (analytics, catalog, dashboard, export, forecast, jobs, pdf, pdf_batch, pdf_cache, receivables,
+                   search, workflow)
+from store.company import obtener_empresa
+from store.stock import StockInsuficiente
+from store.workflow import TransicionInvalida
+from store.models import (Tecnico, OrdenMantenimiento, Cliente, DetalleOrden,
+                          RevisionTecnica, Factura, DetalleFactura, PagoFactura, TrabajoPdf)
 from store.forms import (OrdenMantenimientoForm, ClienteForm, DetalleOrdenForm, TecnicoForm, RevisionTecnicaForm, PagoFacturaForm,
-                         GestionarRevisionTecnicaForm, OrdenMantenimientoConfirmarForm, FacturaForm, DetalleFacturaForm)
+                         GestionarRevisionTecnicaForm, OrdenMantenimientoConfirmarForm, FacturaForm, DetalleFacturaForm,
+                         ExportacionDatosForm, ExportacionPdfForm, ReporteCarteraForm, ReporteVentasForm)
+
+
+class EmpresaRequeridaMixin(object):
+    """
+    Asigna la empresa del sistema al objeto del formulario, si no está
+    registrada muestra el error en el formulario
+    """
+
+    def form_valid(self, form):
+        empresa = obtener_empresa()
+        if empresa is None:
+            form.add_error(None, 'Debe agregar datos de empresa')
+            return self.form_invalid(form)
+        form.instance.empresa_id = empresa.id
+        return super().form_valid(form)
 
 
 class HomeView(TemplateView):
+    """
+    Página de inicio, a quienes pueden ver órdenes o facturas les muestra
+    además el tablero de operaciones leído del resumen.
+    """
     template_name = "home.html"
+    permisos_tablero = ('view_ordenmantenimiento', 'view_factura')
+
+    def puede_ver_tablero(self):
+        usuario = self.request.user
+        if not usuario.is_authenticated or not usuario.is_active:
+            return False
+        return usuario.is_superuser or bool(obtener_permisos(usuario) & set(self.permisos_tablero))
 
     def get_context_data(self, **kwargs):
         context = super(HomeView, self).get_context_data(**kwargs)
-        empresa = Empresa.objects.first()
-        context['empresa'] = empresa
+        empresa = obtener_empresa()
+        if empresa is not None and self.puede_ver_tablero():
+            context['tablero'] = dashboard.tablero(empresa.id)
         return context
 
 
@@ -39,27 +73,37 @@ class GalleryView(TemplateView):
     template_name = "gallery.html"
 
 
+def ultima_modificacion_catalogo(request, *args, **kwargs):
+    if request.user.is_authenticated:
+        return None
+    return catalog.ultima_modificacion()
+
+
+def etag_catalogo(request, *args, **kwargs):
+    return catalog.etag_catalogo(request)
+
+
+@method_decorator(condition(etag_func=etag_catalogo, last_modified_func=ultima_modificacion_catalogo),
+                  name='dispatch')
+@method_decorator(vary_on_cookie, name='dispatch')
 class ServicioView(TemplateView):
+    """
+    Catálogo público de productos agrupados por categoría, se sirve desde caché
+    y responde 304 si el navegador ya tiene la versión vigente.
+    """
     template_name = "servicio.html"
-    
+
     def get_context_data(self, **kwargs):
         context = super(ServicioView, self).get_context_data(**kwargs)
-        productos = Producto.objects.all()
-        context['productos'] = productos
+        context['catalogo'] = catalog.obtener_catalogo()
         return context
 
 
 class ContactoView(TemplateView):
     template_name = "contacto.html"
 
-    def get_context_data(self, **kwargs):
-        context = super(ContactoView, self).get_context_data(**kwargs)
-        empresa = Empresa.objects.first()
-        context['empresa'] = empresa
-        return context
 
-
-class OrdenListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
+class OrdenListView(LoginRequiredMixin, CustomUserOnlyMixin, QueryProfileMixin, CursorPaginationMixin, ListView):
     """
     Permite listar las órdenes de mantenimiento
     **Context**
@@ -75,17 +119,20 @@ class OrdenListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
     template_name = 'ordenMantenimiento/index.html'
     context_object_name = 'ordenes'
     paginate_by = 20
+    cursor_ordering = ('-fecha_registro', '-id')
+    cursor_approximate_count = True
     queryset = OrdenMantenimiento.objects.all()
+    query_profile = QueryProfile(
+        select_related=('cliente',),
+        only=('fecha_registro', 'estado', 'monto_servicio', 'descripcion', 'cliente',
+              'cliente__nombre', 'cliente__apellido'))
     permissions_required = ('view_ordenmantenimiento',)
 
     def get_queryset(self):
-        new_context = self.queryset
+        new_context = self.get_profiled_queryset()
         if self.request.GET.get('filter'):
-            new_context = new_context.filter(
-                Q(descripcion__icontains=self.request.GET.get('filter')) | Q(
-                    cliente__apellido__icontains=self.request.GET.get('filter')) | Q(
-                        cliente__nombre__icontains=self.request.GET.get('filter')) | Q(
-                        cliente__numero_identificacion__icontains=self.request.GET.get('filter')))
+            new_context = search.filtrar(
+                new_context, 'ORDEN', self.request.GET.get('filter'))
 
         return new_context
 
@@ -96,6 +143,40 @@ class OrdenListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
         return context
 
 
+def respuesta_trabajo(request, trabajo):
+    """
+    Redirige a la descarga si el trabajo terminó, si no responde 202 con la
+    URL donde consultar su estado
+    """
+    if trabajo.estado == 'TERMINADO' and trabajo.archivo:
+        return redirect('pdf-job-download', pk=trabajo.pk)
+    if trabajo.estado == 'TERMINADO':
+        objeto = pdf.DOCUMENTOS[trabajo.tipo].model.objects.get(pk=trabajo.objeto_id)
+        return redirect(pdf.url_descarga(trabajo.tipo, objeto))
+    estado = 500 if trabajo.estado == 'ERROR' else 202
+    response = render(request, 'pdf/trabajo.html', {'trabajo': trabajo}, status=estado)
+    response['Location'] = reverse('pdf-job', kwargs={'pk': trabajo.pk})
+    return response
+
+
+class PdfTrabajoMixin(object):
+    """
+    Encola la generación del PDF del objeto en lugar de generarlo en la
+    petición, los documentos finales se sirven desde la caché de PDF
+    """
+    tipo_pdf = None
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        if pdf_cache.es_final(self.tipo_pdf, self.object):
+            clave = pdf_cache.clave_documento(self.tipo_pdf, self.object)
+            archivo = pdf_cache.obtener(self.tipo_pdf, self.object.pk, clave)
+            if archivo is not None:
+                return pdf_cache.respuesta(request, archivo, clave, pdf.DOCUMENTOS[self.tipo_pdf].nombre_archivo)
+        trabajo = jobs.solicitar(self.tipo_pdf, self.object.pk, request.user)
+        return respuesta_trabajo(request, trabajo)
+
+
 class OrdenPrintView(LoginRequiredMixin, DetailView):
     model = OrdenMantenimiento
     template_name = 'ordenMantenimiento/print.html'
@@ -108,11 +189,11 @@ class OrdenPrintView(LoginRequiredMixin, DetailView):
         return context
 
 
-class OrdenDownloadView(WeasyTemplateResponseMixin, OrdenPrintView):
-    pdf_filename = 'detalle.pdf'
+class OrdenDownloadView(PdfTrabajoMixin, OrdenPrintView):
+    tipo_pdf = 'ORDEN'
 
 
-class OrdenCreateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyMixin, CreateView):
+class OrdenCreateView(EmpresaRequeridaMixin, SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyMixin, CreateView):
     """
     Permite crear órdenes de mantenimiento
     **Context**
@@ -130,16 +211,8 @@ class OrdenCreateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyMix
     success_message = 'Órden creada con exito'
     permissions_required = ('add_ordenmantenimiento',)
 
-    def form_valid(self, form):
-        empresa = Empresa.objects.first()
-        if empresa is None:
-            raise ValidationError("Debe agregar datos de empresa")
-        form.instance.empresa_id = empresa.id
-        form.instance.estado = "NUEVO"
-        return super().form_valid(form)
-
 
-class OrdenUpdateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyMixin, UpdateView):
+class OrdenUpdateView(EmpresaRequeridaMixin, SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyMixin, UpdateView):
     """
     Permite editar órdenes de mantenimiento
     **Context**
@@ -158,12 +231,12 @@ class OrdenUpdateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyMix
     permissions_required = ('change_ordenmantenimiento',)
 
     def form_valid(self, form):
-        empresa = Empresa.objects.first()
-        if empresa is None:
-            raise ValidationError("Debe agregar datos de empresa")
-        form.instance.empresa_id = empresa.id
         form.instance.calcular_monto()
-        return super().form_valid(form)
+        try:
+            return super().form_valid(form)
+        except TransicionInvalida as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
 
 
 class OrdenDeleteView(DeleteView, LoginRequiredMixin, CustomUserOnlyMixin):
@@ -217,15 +290,18 @@ class OrdenConfirm(UpdateView, LoginRequiredMixin, CustomGroupOnlyMixin):
         return super(OrdenConfirm, self).post(request, *args, **kwargs)
 
     def form_valid(self, form):
-        if self.request.user.persona_id == form.instance.cliente_id:
-            form.instance.confirmar()
-            form.instance.estado = "CONFIRMADO"
-        else:
+        if self.request.user.persona_id != form.instance.cliente_id:
             raise PermissionDenied
-        return super().form_valid(form)
+        try:
+            form.instance.confirmar()
+        except TransicionInvalida as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        # La confirmación ya guardó la orden, guardar el formulario no agrega nada
+        return HttpResponseRedirect(self.get_success_url())
 
 
-class ClienteListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
+class ClienteListView(LoginRequiredMixin, CustomUserOnlyMixin, CursorPaginationMixin, ListView):
     """
     Permite listar clientes
     **Context**
@@ -241,16 +317,15 @@ class ClienteListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
     template_name = 'cliente/index.html'
     context_object_name = 'clientes'
     paginate_by = 20
+    cursor_ordering = ('-id',)
     queryset = Cliente.objects.all()
     permissions_required = ('view_cliente',)
 
     def get_queryset(self):
         new_context = self.queryset
         if self.request.GET.get('filter'):
-            new_context = new_context.filter(
-                Q(nombre__icontains=self.request.GET.get('filter')) | Q(
-                    apellido__icontains=self.request.GET.get('filter'))
-            )
+            new_context = search.filtrar(
+                new_context, 'CLIENTE', self.request.GET.get('filter'))
         return new_context
 
     def get_context_data(self, **kwargs):
@@ -274,18 +349,8 @@ class ClienteCreateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyM
 
     def form_valid(self, form):
         cleaned_data = form.clean()
-        group = Group.objects.get(name='CLIENTE')
-        if ((form.instance.tipo_documento_identificacion == 'DNI' or form.instance.tipo_documento_identificacion == 'RUC' )
-         and views.verificar(form.instance.numero_identificacion) is False):
-            messages.error(self.request, "Número de Identificación incorrecto")
-            return super().form_invalid(form)
-        usuario = Usuario(nombre_de_usuario=cleaned_data.get("correo_electronico"),
-                          is_staff=1, is_active=True, correo_electronico=cleaned_data.get("correo_electronico"))
         client = form.save()
-        usuario.persona_id = client.id
-        usuario.password = make_password(form.instance.numero_identificacion)
-        usuario.save()
-        group.user_set.add(usuario)
+        credentials.crear_usuario(client, cleaned_data.get("correo_electronico"), 'CLIENTE')
         return super().form_valid(form)
 
 
@@ -307,16 +372,8 @@ class ClienteUpdateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyM
 
     def form_valid(self, form):
         cleaned_data = form.clean()
-        usuario = Usuario.objects.get(persona_id=form.instance.id)
-        if ((form.instance.tipo_documento_identificacion == 'DNI' or form.instance.tipo_documento_identificacion == 'RUC' )
-         and views.verificar(form.instance.numero_identificacion) is False):
-            messages.error(self.request, "Número de Identificación incorrecto")
-            return super().form_invalid(form)
-
-        usuario.correo_electronico = cleaned_data.get("correo_electronico")
-        usuario.nombre_de_usuario = cleaned_data.get("correo_electronico")
-        usuario.password = make_password(form.instance.numero_identificacion)
-        usuario.save()
+        credentials.actualizar_usuario(form.instance, cleaned_data.get("correo_electronico"),
+                                       'numero_identificacion' in form.changed_data)
         return super().form_valid(form)
 
 
@@ -334,7 +391,7 @@ class ClienteDeleteView(DeleteView, LoginRequiredMixin, CustomUserOnlyMixin):
             return super(ClienteDeleteView, self).post(request, *args, **kwargs)
 
 
-class TecnicoListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
+class TecnicoListView(LoginRequiredMixin, CustomUserOnlyMixin, CursorPaginationMixin, ListView):
     """
     Permite listar técnicos
     **Context**
@@ -350,16 +407,15 @@ class TecnicoListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
     template_name = 'tecnico/index.html'
     context_object_name = 'tecnicos'
     paginate_by = 20
+    cursor_ordering = ('-fecha_ingreso', '-id')
     queryset = Tecnico.objects.all()
     permissions_required = ('view_tecnico',)
 
     def get_queryset(self):
         new_context = self.queryset
         if self.request.GET.get('filter'):
-            new_context = new_context.filter(
-                Q(nombre__icontains=self.request.GET.get('filter')) | Q(
-                    apellido__icontains=self.request.GET.get('filter'))
-            )
+            new_context = search.filtrar(
+                new_context, 'TECNICO', self.request.GET.get('filter'))
         return new_context
 
     def get_context_data(self, **kwargs):
@@ -383,18 +439,8 @@ class TecnicoCreateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyM
 
     def form_valid(self, form):
         cleaned_data = form.clean()
-        group = Group.objects.get(name='TECNICO')
-        if ((form.instance.tipo_documento_identificacion == 'DNI' or form.instance.tipo_documento_identificacion == 'RUC' )
-         and views.verificar(form.instance.numero_identificacion) is False):
-            messages.error(self.request, "Número de Identificación incorrecto")
-            return super().form_invalid(form)
-        usuario = Usuario(nombre_de_usuario=cleaned_data.get("correo_electronico"),
-                          is_staff=1, is_active=True, correo_electronico=cleaned_data.get("correo_electronico"))
         tecnico = form.save()
-        usuario.persona_id = tecnico.id
-        usuario.password = make_password(form.instance.numero_identificacion)
-        usuario.save()
-        group.user_set.add(usuario)
+        credentials.crear_usuario(tecnico, cleaned_data.get("correo_electronico"), 'TECNICO')
         return super().form_valid(form)
 
 
@@ -416,15 +462,8 @@ class TecnicoUpdateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyM
 
     def form_valid(self, form):
         cleaned_data = form.clean()
-        if ((form.instance.tipo_documento_identificacion == 'DNI' or form.instance.tipo_documento_identificacion == 'RUC' )
-         and views.verificar(form.instance.numero_identificacion) is False):
-            messages.error(self.request, "Número de Identificación incorrecto")
-            return super().form_invalid(form)
-        usuario = Usuario.objects.get(persona_id=form.instance.id)
-        usuario.correo_electronico = cleaned_data.get("correo_electronico")
-        usuario.nombre_de_usuario = cleaned_data.get("correo_electronico")
-        usuario.password = make_password(form.instance.numero_identificacion)
-        usuario.save()
+        credentials.actualizar_usuario(form.instance, cleaned_data.get("correo_electronico"),
+                                       'numero_identificacion' in form.changed_data)
         return super().form_valid(form)
 
 
@@ -442,7 +481,7 @@ class TecnicoDeleteView(DeleteView, LoginRequiredMixin, CustomUserOnlyMixin):
             return super(TecnicoDeleteView, self).post(request, *args, **kwargs)
 
 
-class DetalleOrdenListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
+class DetalleOrdenListView(LoginRequiredMixin, CustomUserOnlyMixin, CursorPaginationMixin, ListView):
     """
     Permite listar detalles de órdenes de mantenimiento
     **Context**
@@ -458,6 +497,7 @@ class DetalleOrdenListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
     template_name = 'detalleOrden/index.html'
     context_object_name = 'detalles'
     paginate_by = 10
+    cursor_ordering = ('id',)
     queryset = DetalleOrden.objects.all()
     permissions_required = ('view_detalleOrden',)
 
@@ -498,8 +538,7 @@ class DetalleOrdenCreateView(SuccessMessageMixin, CustomUserOnlyMixin, LoginRequ
         orden = OrdenMantenimiento.objects.get(id=self.kwargs['order_id'])
         form.instance.orden_mantenimiento_id = orden.id
         form.save()
-        orden.calcular_monto()
-        orden.save()
+        orden.actualizar_monto()
         return super().form_valid(form)
 
 
@@ -522,9 +561,8 @@ class DetalleOrdenUpdateView(SuccessMessageMixin, CustomUserOnlyMixin, LoginRequ
 
     def form_valid(self, form):
         form.save()
-        orden = OrdenMantenimiento.objects.get(id=self.kwargs['order_id'])
-        orden.calcular_monto()
-        orden.save()
+        orden = OrdenMantenimiento(id=self.kwargs['order_id'])
+        orden.actualizar_monto()
         return super().form_valid(form)
 
 
@@ -548,15 +586,14 @@ class DetalleOrdenDeleteView(DeleteView, CustomUserOnlyMixin, LoginRequiredMixin
                 'order-details',  kwargs={'order_id': self.kwargs['order_id']})
             return HttpResponseRedirect(url)
         else:
-            detalle = DetalleOrden.objects.get(id=self.kwargs['pk'])
-            orden = OrdenMantenimiento.objects.get(id=self.kwargs['order_id'])
-            orden.calcular_monto()
-            orden.monto_servicio = orden.monto_servicio - detalle.precio_servicio
-            orden.save()
-            return super(DetalleOrdenDeleteView, self).post(request, *args, **kwargs)
+            response = super(DetalleOrdenDeleteView, self).post(request, *args, **kwargs)
+            orden = OrdenMantenimiento(id=self.kwargs['order_id'])
+            orden.actualizar_monto()
+            workflow.sincronizar_orden(orden.id)
+            return response
 
 
-class RevisionTecnicaListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
+class RevisionTecnicaListView(LoginRequiredMixin, CustomUserOnlyMixin, CursorPaginationMixin, ListView):
     """
     Permite listar revisiones técnicas
     **Context**
@@ -572,6 +609,7 @@ class RevisionTecnicaListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView)
     template_name = 'revisionTecnica/index.html'
     context_object_name = 'revisiones'
     paginate_by = 20
+    cursor_ordering = ('-id',)
     queryset = RevisionTecnica.objects.all()
     permissions_required = ('view_revisionTecnica',)
 
@@ -614,17 +652,14 @@ class RevisionTecnicaCreateView(SuccessMessageMixin, LoginRequiredMixin, CustomU
 
     def form_valid(self, form):
         form.instance.detalle_orden_id = self.kwargs['order_detail_id']
-        detalle = DetalleOrden.objects.get(id=self.kwargs['order_detail_id'])
-        detalle.estado = 'EN_REVISION'
-        detalle.save()
-        orden = OrdenMantenimiento.objects.get(
-            id=detalle.orden_mantenimiento_id)
-        if orden.verificar_estado_detalles('EN_REVISION'):
-            orden.estado = 'EN_REVISION'
-        else:
-            orden.estado = 'NUEVO'
-        orden.save()
-        return super().form_valid(form)
+        try:
+            with transaction.atomic():
+                workflow.cambiar_estado_detalle(self.kwargs['order_detail_id'], 'EN_REVISION')
+                response = super().form_valid(form)
+        except TransicionInvalida as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        return response
 
 
 class RevisionTecnicaUpdateView(SuccessMessageMixin, CustomUserOnlyMixin, LoginRequiredMixin, UpdateView):
@@ -673,7 +708,7 @@ class RevisionTecnicaDeleteView(DeleteView, LoginRequiredMixin, CustomUserOnlyMi
             return super(RevisionTecnicaDeleteView, self).post(request, *args, **kwargs)
 
 
-class RevisionTecnicaPorTecnicoListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
+class RevisionTecnicaPorTecnicoListView(LoginRequiredMixin, CustomUserOnlyMixin, CursorPaginationMixin, ListView):
     """
     Permite listar revisiones técnicas
     **Context**
@@ -689,6 +724,7 @@ class RevisionTecnicaPorTecnicoListView(LoginRequiredMixin, CustomUserOnlyMixin,
     template_name = 'tecnico/revisionTecnica/index.html'
     context_object_name = 'revisiones'
     paginate_by = 20
+    cursor_ordering = ('-id',)
     queryset = RevisionTecnica.objects.all()
     permissions_required = ('view_revisiontecnica',)
 
@@ -725,21 +761,17 @@ class RevisionTecnicaPorTecnicoUpdateView(SuccessMessageMixin, CustomUserOnlyMix
         return initial
 
     def form_valid(self, form):
-        cleaned_data = form.clean()
-        detalle = DetalleOrden.objects.get(id=form.instance.detalle_orden_id)
-        detalle.estado = cleaned_data.get("estado")
-        detalle.save()
-        orden = OrdenMantenimiento.objects.get(
-            id=detalle.orden_mantenimiento_id)
-        if orden.verificar_estado_detalles(cleaned_data.get("estado")):
-            orden.estado = cleaned_data.get("estado")
-        else:
-            orden.estado = "EN_REVISION"
-        orden.save()
-        return super().form_valid(form)
+        try:
+            with transaction.atomic():
+                workflow.cambiar_estado_detalle(form.instance.detalle_orden_id, form.cleaned_data['estado'])
+                response = super().form_valid(form)
+        except TransicionInvalida as e:
+            form.add_error('estado', e)
+            return self.form_invalid(form)
+        return response
 
 
-class FacturaListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
+class FacturaListView(LoginRequiredMixin, CustomUserOnlyMixin, QueryProfileMixin, CursorPaginationMixin, ListView):
     """
     Permite listar facturas
     **Context**
@@ -755,16 +787,21 @@ class FacturaListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
     template_name = 'factura/index.html'
     context_object_name = 'facturas'
     paginate_by = 20
+    cursor_ordering = ('-fecha_venta', '-id')
+    cursor_approximate_count = True
     queryset = Factura.objects.all()
+    query_profile = QueryProfile(
+        select_related=('cliente__usuario',),
+        only=('fecha_venta', 'estado', 'subtotal', 'impuesto', 'total', 'monto_pagado', 'cliente',
+              'cliente__nombre', 'cliente__apellido', 'cliente__numero_identificacion',
+              'cliente__usuario__correo_electronico'))
     permissions_required = ('view_factura',)
 
     def get_queryset(self):
-        new_context = self.queryset
+        new_context = self.get_profiled_queryset()
         if self.request.GET.get('filter'):
-            new_context = new_context.filter(Q(
-                cliente__apellido__icontains=self.request.GET.get('filter')) | Q(
-                cliente__nombre__icontains=self.request.GET.get('filter')) | Q(
-                cliente__numero_identificacion__icontains=self.request.GET.get('filter')))
+            new_context = search.filtrar(
+                new_context, 'FACTURA', self.request.GET.get('filter'))
 
         return new_context
 
@@ -788,11 +825,11 @@ class FacturaDetailView(LoginRequiredMixin, CustomUserOnlyMixin, DetailView):
         return context
 
 
-class FacturaDownloadView(WeasyTemplateResponseMixin, FacturaDetailView):
-    pdf_filename = 'factura.pdf'
+class FacturaDownloadView(PdfTrabajoMixin, FacturaDetailView):
+    tipo_pdf = 'FACTURA'
 
 
-class FacturaCreateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyMixin, CreateView):
+class FacturaCreateView(EmpresaRequeridaMixin, SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyMixin, CreateView):
     """
     Permite crear facturas
     **Context**
@@ -811,15 +848,11 @@ class FacturaCreateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyM
     permissions_required = ('add_factura',)
 
     def form_valid(self, form):
-        empresa = Empresa.objects.first()
-        if empresa is None:
-            raise ValidationError("Debe agregar datos de empresa")
-        form.instance.empresa_id = empresa.id
         form.instance.estado = "POR_PAGAR"
         return super().form_valid(form)
 
 
-class FacturaUpdateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyMixin, UpdateView):
+class FacturaUpdateView(EmpresaRequeridaMixin, SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyMixin, UpdateView):
     """
     Permite editar facturas
     **Context**
@@ -838,13 +871,7 @@ class FacturaUpdateView(SuccessMessageMixin, LoginRequiredMixin, CustomUserOnlyM
     permissions_required = ('change_factura',)
 
     def form_valid(self, form):
-        empresa = Empresa.objects.first()
-        if empresa is None:
-            raise ValidationError("Debe agregar datos de empresa")
-        form.instance.empresa_id = empresa.id
-        form.instance.calcular_subtotal()
-        form.instance.calcular_impuesto()
-        form.instance.calcular_total()
+        form.instance.calcular_totales()
         return super().form_valid(form)
 
 
@@ -873,7 +900,7 @@ class FacturaDeleteView(DeleteView, LoginRequiredMixin, CustomUserOnlyMixin):
             return super(FacturaDeleteView, self).post(request, *args, **kwargs)
 
 
-class OrdenClienteListView(LoginRequiredMixin, ListView):
+class OrdenClienteListView(LoginRequiredMixin, QueryProfileMixin, CursorPaginationMixin, ListView):
     """
     Permite listar las órdenes de mantenimiento por cliente
     **Context**
@@ -889,10 +916,12 @@ class OrdenClienteListView(LoginRequiredMixin, ListView):
     template_name = 'cliente/ordenMantenimiento/index.html'
     context_object_name = 'ordenes'
     paginate_by = 20
+    cursor_ordering = ('-fecha_registro', '-id')
     queryset = OrdenMantenimiento.objects.all()
+    query_profile = OrdenListView.query_profile
 
     def get_queryset(self):
-        new_context = self.queryset.filter(
+        new_context = self.get_profiled_queryset().filter(
             cliente__id=self.request.user.persona_id)
         if self.request.GET.get('filter'):
             new_context = new_context.filter(
@@ -916,7 +945,7 @@ class OrdenClienteDetailView(LoginRequiredMixin, CustomUserOnlyMixin, DetailView
     template_name = 'cliente/ordenMantenimiento/detail.html'
 
 
-class DetalleFacturaListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
+class DetalleFacturaListView(LoginRequiredMixin, CustomUserOnlyMixin, CursorPaginationMixin, ListView):
     """
     Permite listar detalles de facturas
     **Context**
@@ -932,6 +961,7 @@ class DetalleFacturaListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
     template_name = 'detalleFactura/index.html'
     context_object_name = 'detalles'
     paginate_by = 10
+    cursor_ordering = ('id',)
     queryset = DetalleFactura.objects.all()
     permissions_required = ('view_detalleFactura',)
 
@@ -940,7 +970,7 @@ class DetalleFacturaListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
             factura__id=self.kwargs['invoice_id'])
         if self.request.GET.get('filter'):
             new_context = new_context.filter(
-                Q(detale=self.request.GET.get('filter')))
+                Q(detalle__icontains=self.request.GET.get('filter')))
 
         return new_context
 
@@ -973,18 +1003,15 @@ class DetalleFacturaCreateView(SuccessMessageMixin, CustomUserOnlyMixin, LoginRe
         factura = Factura.objects.get(id=self.kwargs['invoice_id'])
         form.instance.factura_id = factura.id
         form.instance.detalle = form.instance.producto.nombre
-        producto = Producto.objects.get(id=form.instance.producto.id)
-        producto.calcular_cantidad()
-        if producto.cantidad <= 0:
-            raise ValidationError("No ha stock del producto")
-        producto.save()
         form.instance.calcular_total()
-        form.instance.impuesto= (producto.impuesto_iva * form.instance.precio_unitario) /100
-        form.save()
-        factura.calcular_subtotal()
-        factura.calcular_impuesto()
-        factura.calcular_total()
-        factura.save()
+        form.instance.impuesto= (form.instance.producto.impuesto_iva * form.instance.precio_unitario) /100
+        try:
+            with transaction.atomic():
+                form.save()
+                factura.actualizar_totales()
+        except StockInsuficiente as e:
+            form.add_error('cantidad', e)
+            return self.form_invalid(form)
         return super().form_valid(form)
 
 
@@ -1006,18 +1033,16 @@ class DetalleFacturaUpdateView(SuccessMessageMixin, CustomUserOnlyMixin, LoginRe
         return context
 
     def form_valid(self, form):
-        producto = Producto.objects.get(id=form.instance.producto.id)
-        producto.calcular_cantidad()
-        if producto.cantidad <= 0:
-            raise ValidationError("No ha stock del producto")
-        producto.save()
         form.instance.calcular_total()
-        form.instance.impuesto= (producto.impuesto_iva * form.instance.precio_unitario) /100
-        form.save()
-        factura = Factura.objects.get(id=self.kwargs['invoice_id'])
-        factura.calcular_subtotal()
-        factura.calcular_impuesto()
-        factura.calcular_total()
+        form.instance.impuesto= (form.instance.producto.impuesto_iva * form.instance.precio_unitario) /100
+        try:
+            with transaction.atomic():
+                form.save()
+                factura = Factura(id=self.kwargs['invoice_id'])
+                factura.actualizar_totales()
+        except StockInsuficiente as e:
+            form.add_error('cantidad', e)
+            return self.form_invalid(form)
         return super().form_valid(form)
 
 
@@ -1041,20 +1066,13 @@ class DetalleFacturaDeleteView(DeleteView, CustomUserOnlyMixin, LoginRequiredMix
                 'invoice-details',  kwargs={'invoice_id': self.kwargs['invoice_id']})
             return HttpResponseRedirect(url)
         else:
-            detalle = DetalleFactura.objects.get(id=self.kwargs['pk'])
-            producto = Producto.objects.get(id=detalle.producto.id)
-            producto.calcular_cantidad()
-            producto.cantidad = producto.cantidad + detalle.cantidad
-            producto.save()
-            factura = Factura.objects.get(id=self.kwargs['invoice_id'])
-            factura.subtotal = factura.subtotal - detalle.total
-            factura.calcular_impuesto()
-            factura.calcular_total()
-            factura.save()
-            return super(DetalleFacturaDeleteView, self).post(request, *args, **kwargs)
+            response = super(DetalleFacturaDeleteView, self).post(request, *args, **kwargs)
+            factura = Factura(id=self.kwargs['invoice_id'])
+            factura.actualizar_totales()
+            return response
 
 
-class PagoFacturaListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
+class PagoFacturaListView(LoginRequiredMixin, CustomUserOnlyMixin, CursorPaginationMixin, ListView):
     """
     Permite listar pagos de facturas
     **Context**
@@ -1070,6 +1088,7 @@ class PagoFacturaListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
     template_name = 'pagoFactura/index.html'
     context_object_name = 'pagos'
     paginate_by = 10
+    cursor_ordering = ('-fecha_pago', '-id')
     queryset = PagoFactura.objects.all()
     permissions_required = ('view_pagoFactura',)
 
@@ -1078,7 +1097,7 @@ class PagoFacturaListView(LoginRequiredMixin, CustomUserOnlyMixin, ListView):
             factura__id=self.kwargs['invoice_id'])
         if self.request.GET.get('filter'):
             new_context = new_context.filter(
-                Q(detale=self.request.GET.get('filter')))
+                Q(descripcion__icontains=self.request.GET.get('filter')))
 
         return new_context
 
@@ -1111,8 +1130,7 @@ class PagoFacturaCreateView(SuccessMessageMixin, CustomUserOnlyMixin, LoginRequi
         factura = Factura.objects.get(id=self.kwargs['invoice_id'])
         form.instance.factura_id = factura.id
         form.save()
-        factura.calcular_pagos()
-        factura.save()
+        factura.actualizar_totales()
         return super().form_valid(form)
 
 
@@ -1135,9 +1153,8 @@ class PagoFacturaUpdateView(SuccessMessageMixin, CustomUserOnlyMixin, LoginRequi
 
     def form_valid(self, form):
         form.save()
-        factura = Factura.objects.get(id=self.kwargs['invoice_id'])
-        factura.calcular_pagos()
-        factura.save()
+        factura = Factura(id=self.kwargs['invoice_id'])
+        factura.actualizar_totales()
         return super().form_valid(form)
 
 
@@ -1161,12 +1178,10 @@ class PagoFacturaDeleteView(DeleteView, CustomUserOnlyMixin, LoginRequiredMixin)
                 'invoice-payments',  kwargs={'invoice_id': self.kwargs['invoice_id']})
             return HttpResponseRedirect(url)
         else:
-            pago = PagoFactura.objects.get(id=self.kwargs['pk'])
-
-            factura = Factura.objects.get(id=self.kwargs['invoice_id'])
-            factura.calcular_pagos() - pago.monto
-            factura.save()
-            return super(PagoFacturaDeleteView, self).post(request, *args, **kwargs)
+            response = super(PagoFacturaDeleteView, self).post(request, *args, **kwargs)
+            factura = Factura(id=self.kwargs['invoice_id'])
+            factura.actualizar_totales()
+            return response
 
 
 class PagoFacturaDetailView(LoginRequiredMixin, CustomUserOnlyMixin, DetailView):
@@ -1182,5 +1197,270 @@ class PagoFacturaDetailView(LoginRequiredMixin, CustomUserOnlyMixin, DetailView)
         return context
 
 
-class PagoFacturaDetailViewDownloadView(WeasyTemplateResponseMixin, PagoFacturaDetailView):
-    pdf_filename = 'pago.pdf'
+class PagoFacturaDetailViewDownloadView(PdfTrabajoMixin, PagoFacturaDetailView):
+    tipo_pdf = 'PAGO'
+
+
+class TrabajoPdfView(LoginRequiredMixin, DetailView):
+    """
+    Muestra el estado de un trabajo de generación de PDF, cuando termina
+    redirige a la descarga del documento
+    """
+    model = TrabajoPdf
+    context_object_name = 'trabajo'
+    template_name = 'pdf/trabajo.html'
+
+    def get_queryset(self):
+        return TrabajoPdf.objects.filter(usuario=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return respuesta_trabajo(request, self.object)
+
+
+class TrabajoPdfDownloadView(LoginRequiredMixin, DetailView):
+    """
+    Descarga el PDF generado por un trabajo
+    """
+    model = TrabajoPdf
+
+    def get_queryset(self):
+        return TrabajoPdf.objects.filter(usuario=self.request.user, estado='TERMINADO')
+
+    def get(self, request, *args, **kwargs):
+        trabajo = self.get_object()
+        nombre = trabajo.nombre_archivo or pdf.DOCUMENTOS[trabajo.tipo].nombre_archivo
+        return FileResponse(trabajo.archivo.open('rb'), as_attachment=True, filename=nombre,
+                            content_type=mimetypes.guess_type(nombre)[0] or 'application/octet-stream')
+
+
+class ExportacionPdfView(LoginRequiredMixin, CustomUserOnlyMixin, View):
+    """
+    Encola la exportación en un ZIP o en un solo PDF de los documentos que
+    cumplen los filtros, el archivo se descarga cuando el trabajo termina
+    """
+    tipo_pdf = None
+    nombre_archivo = None
+
+    def get(self, request, *args, **kwargs):
+        form = ExportacionPdfForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        try:
+            trabajo = pdf_batch.solicitar(self.tipo_pdf, request.user, self.nombre_archivo, **form.cleaned_data)
+        except pdf_batch.ExportacionExcedida as e:
+            return HttpResponseBadRequest(' '.join(e.messages))
+        return respuesta_trabajo(request, trabajo)
+
+
+class FacturaExportacionView(ExportacionPdfView):
+    tipo_pdf = 'FACTURA'
+    nombre_archivo = 'facturas'
+    permissions_required = ('view_factura',)
+
+
+class OrdenExportacionView(ExportacionPdfView):
+    tipo_pdf = 'ORDEN'
+    nombre_archivo = 'ordenes'
+    permissions_required = ('view_ordenmantenimiento',)
+
+
+class ExportacionProgresoView(LoginRequiredMixin, View):
+    """
+    Devuelve el avance de una exportación del usuario
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        trabajo = TrabajoPdf.objects.filter(
+            pk=pk, usuario=request.user, tipo__startswith=pdf_batch.PREFIJO_TRABAJO).first()
+        if trabajo is None:
+            return JsonResponse({'error': 'Exportación no encontrada'}, status=404)
+        return JsonResponse({'estado': trabajo.estado, 'hechos': trabajo.hechos, 'total': trabajo.total})
+
+
+class ExportacionDatosMixin(object):
+    """
+    Exporta en CSV o Excel las filas del listado con los mismos filtros, el
+    archivo se envía por partes mientras se recorre la consulta en el orden
+    del cursor del listado
+    """
+    tipo_exportacion = None
+    nombre_exportacion = None
+    # Tipo de documento de búsqueda si el listado filtra con store.search
+    tipo_busqueda = None
+
+    def get_export_queryset(self):
+        """
+        Con búsqueda se exportan todas las coincidencias sin calcular el
+        orden por relevancia del listado
+        """
+        if self.tipo_busqueda is None:
+            queryset = self.get_queryset()
+        else:
+            queryset = self.get_profiled_queryset()
+            if self.request.GET.get('filter'):
+                queryset = search.filtrar(queryset, self.tipo_busqueda, self.request.GET.get('filter'),
+                                          relevancia=False)
+        return queryset.order_by(*(self.cursor_ordering or ('id',)))
+
+    def get(self, request, *args, **kwargs):
+        form = ExportacionDatosForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        formato = form.cleaned_data['formato']
+        try:
+            contenido = export.exportar(self.get_export_queryset(), self.tipo_exportacion, formato,
+                                        form.cleaned_data['columnas'])
+        except export.ColumnaInvalida as e:
+            return HttpResponseBadRequest(str(e))
+        response = StreamingHttpResponse(contenido, content_type=export.CONTENT_TYPES[formato])
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(self.nombre_exportacion, formato)
+        return response
+
+
+class FacturaDatosExportacionView(ExportacionDatosMixin, FacturaListView):
+    tipo_exportacion = 'FACTURA'
+    tipo_busqueda = 'FACTURA'
+    nombre_exportacion = 'facturas'
+
+
+class OrdenDatosExportacionView(ExportacionDatosMixin, OrdenListView):
+    tipo_exportacion = 'ORDEN'
+    tipo_busqueda = 'ORDEN'
+    nombre_exportacion = 'ordenes'
+
+
+class DetalleFacturaExportacionView(ExportacionDatosMixin, DetalleFacturaListView):
+    """
+    Sin factura en la URL exporta los detalles de todas las facturas
+    """
+    tipo_exportacion = 'DETALLE_FACTURA'
+    nombre_exportacion = 'detalles-factura'
+
+    def get_queryset(self):
+        if 'invoice_id' in self.kwargs:
+            return super(DetalleFacturaExportacionView, self).get_queryset()
+        new_context = self.queryset.all()
+        if self.request.GET.get('filter'):
+            new_context = new_context.filter(
+                Q(detalle__icontains=self.request.GET.get('filter')))
+        return new_context
+
+
+class PagoFacturaExportacionView(ExportacionDatosMixin, PagoFacturaListView):
+    """
+    Sin factura en la URL exporta los pagos de todas las facturas
+    """
+    tipo_exportacion = 'PAGO'
+    nombre_exportacion = 'pagos-factura'
+
+    def get_queryset(self):
+        if 'invoice_id' in self.kwargs:
+            return super(PagoFacturaExportacionView, self).get_queryset()
+        new_context = self.queryset.all()
+        if self.request.GET.get('filter'):
+            new_context = new_context.filter(
+                Q(descripcion__icontains=self.request.GET.get('filter')))
+        return new_context
+
+
+class VentasReporteView(LoginRequiredMixin, CustomUserOnlyMixin, TemplateView):
+    """
+    Reporte de ventas por periodo y producto o categoría, calculado en memoria
+    sobre las ventas diarias. Con formato=csv descarga las mismas filas.
+
+    **Template:**
+
+    :template:`factura/ventas.html`
+    """
+    template_name = 'factura/ventas.html'
+    permissions_required = ('view_factura',)
+    columnas_csv = (
+        export.Columna('periodo', 'Periodo'),
+        export.Columna('nombre', 'Nombre'),
+        export.Columna('lineas', 'Líneas'),
+        export.Columna('cantidad', 'Cantidad'),
+        export.Columna('monto', 'Monto'),
+        export.Columna('impuesto', 'Impuesto'),
+    )
+
+    def get(self, request, *args, **kwargs):
+        form = ReporteVentasForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        datos = form.cleaned_data
+        marca = analytics.obtener_marca()
+        filas = analytics.reporte(datos['periodo'], datos['dimension'], datos['desde'], datos['hasta'], marca)
+        if datos['formato'] == 'csv':
+            registros = ([getattr(fila, columna.campo) for columna in self.columnas_csv] for fila in filas)
+            response = StreamingHttpResponse(export.escribir_csv(self.columnas_csv, registros),
+                                             content_type=export.CONTENT_TYPES['csv'])
+            response['Content-Disposition'] = 'attachment; filename="ventas.csv"'
+            return response
+        context = self.get_context_data(form=form, filas=filas, dimension=datos['dimension'], **kwargs)
+        context['total'] = {campo: sum(getattr(fila, campo) for fila in filas)
+                            for campo in ('lineas', 'cantidad', 'monto', 'impuesto')}
+        context['marca'] = marca
+        return self.render_to_response(context)
+
+
+class CarteraReporteView(LoginRequiredMixin, CustomUserOnlyMixin, TemplateView):
+    """
+    Saldos por cobrar de cada cliente a una fecha de corte, repartidos por
+    antigüedad. Con formato=csv descarga el mismo reporte y con formato=pdf
+    encola su generación.
+
+    **Template:**
+
+    :template:`factura/cartera.html`
+    """
+    template_name = 'factura/cartera.html'
+    permissions_required = ('view_factura',)
+
+    def columnas_csv(self):
+        return ([export.Columna('identificacion', 'Número de Identificación'), export.Columna('nombre', 'Cliente'),
+                 export.Columna('facturas', 'Facturas')] +
+                [export.Columna(None, titulo) for titulo in receivables.TRAMOS] +
+                [export.Columna('total', 'Total')])
+
+    def get(self, request, *args, **kwargs):
+        form = ReporteCarteraForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        formato = form.cleaned_data['formato']
+        if formato == 'pdf':
+            return respuesta_trabajo(request, receivables.solicitar_pdf(form.cleaned_data['fecha'], request.user))
+        cartera = receivables.reporte(form.cleaned_data['fecha'])
+        if formato == 'csv':
+            registros = ([fila.identificacion, fila.nombre, fila.facturas] + fila.tramos + [fila.total]
+                         for fila in cartera.filas)
+            response = StreamingHttpResponse(export.escribir_csv(self.columnas_csv(), registros),
+                                             content_type=export.CONTENT_TYPES['csv'])
+            response['Content-Disposition'] = 'attachment; filename="cartera-{}.csv"'.format(
+                cartera.fecha.isoformat())
+            return response
+        context = self.get_context_data(form=form, cartera=cartera, tramos=receivables.TRAMOS, **kwargs)
+        return self.render_to_response(context)
+
+
+class PronosticoStockView(LoginRequiredMixin, CustomUserOnlyMixin, TemplateView):
+    """
+    Productos ordenados por días hasta agotar su stock según el pronóstico
+    calculado cada noche, primero los que hay que reponer.
+
+    **Template:**
+
+    :template:`producto/pronostico.html`
+    """
+    template_name = 'producto/pronostico.html'
+    permissions_required = ('view_producto',)
+
+    def get_context_data(self, **kwargs):
+        context = super(PronosticoStockView, self).get_context_data(**kwargs)
+        marca = forecast.obtener_marca()
+        filas = forecast.reporte(marca)
+        if not self.request.GET.get('todos'):
+            filas = [fila for fila in filas if fila.reponer]
+        context.update({'marca': marca, 'filas': filas, 'todos': bool(self.request.GET.get('todos')),
+                        'dias_reposicion': forecast.DIAS_REPOSICION})
+        return context
@@ -0,0 +1,186 @@
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from store import dashboard
+from store.models import ConteoDetalles, DetalleOrden, OrdenMantenimiento
+
+ESTADOS_ABIERTOS = ('NUEVO', 'EN_REVISION', 'REVISADO')
+ESTADOS_CERRADOS = ('CONFIRMADO', 'FINALIZADO')
+
+TRANSICIONES_DETALLE = {
+    None: ('NUEVO',),
+    'NUEVO': ('EN_REVISION', 'CONFIRMADO'),
+    'EN_REVISION': ('REVISADO', 'ARREGLADO', 'CONFIRMADO'),
+    'REVISADO': ('EN_REVISION', 'ARREGLADO', 'CONFIRMADO'),
+    'ARREGLADO': ('EN_REVISION', 'REVISADO', 'CONFIRMADO', 'FINALIZADO'),
+    'CONFIRMADO': ('ARREGLADO', 'FINALIZADO'),
+    'FINALIZADO': (),
+}
+
+TRANSICIONES_ORDEN = {
+    'NUEVO': ('EN_REVISION', 'REVISADO', 'CONFIRMADO'),
+    'EN_REVISION': ('NUEVO', 'REVISADO', 'CONFIRMADO'),
+    'REVISADO': ('NUEVO', 'EN_REVISION', 'CONFIRMADO'),
+    'CONFIRMADO': ('FINALIZADO',),
+    'FINALIZADO': (),
+}
+
+COLUMNAS = tuple(estado.lower() for estado, nombre in DetalleOrden.ESTADO)
+
+
+class TransicionInvalida(ValidationError):
+    """
+    Se lanza cuando se intenta pasar un detalle u orden a un estado que no
+    está permitido desde su estado actual.
+    """
+
+    def __init__(self, anterior, nuevo):
+        nombres = dict(DetalleOrden.ESTADO)
+        super(TransicionInvalida, self).__init__(
+            'No se puede pasar del estado %(anterior)s a %(nuevo)s', code='transicion_invalida',
+            params={'anterior': nombres.get(anterior, anterior or 'inicial'), 'nuevo': nombres.get(nuevo, nuevo)})
+
+
+def validar(transiciones, anterior, nuevo):
+    if nuevo != anterior and nuevo not in transiciones.get(anterior, ()):
+        raise TransicionInvalida(anterior, nuevo)
+
+
+def validar_detalle(anterior, nuevo):
+    validar(TRANSICIONES_DETALLE, anterior, nuevo)
+
+
+def validar_orden(anterior, nuevo):
+    validar(TRANSICIONES_ORDEN, anterior, nuevo)
+
+
+def columna(estado):
+    return estado.lower()
+
+
+def estado_orden(actual, conteo):
+    """
+    Estado que corresponde a una orden abierta según sus contadores: nueva
+    mientras ningún detalle empezó su revisión, revisada cuando todos están
+    revisados o arreglados y en revisión en los demás casos. Las órdenes
+    confirmadas o finalizadas no cambian por sus detalles.
+    """
+    if actual in ESTADOS_CERRADOS:
+        return actual
+    total = conteo['total']
+    if total == 0 or conteo['nuevo'] == total:
+        return 'NUEVO'
+    terminados = sum(conteo[nombre] for nombre in ('revisado', 'arreglado', 'confirmado', 'finalizado'))
+    if terminados == total:
+        return 'REVISADO'
+    return 'EN_REVISION'
+
+
+def todos_en_estado(orden_id, estado):
+    """
+    Indica si todos los detalles de la orden están en el estado indicado con
+    una comparación sobre la fila de contadores.
+    """
+    return ConteoDetalles.objects.filter(orden_id=orden_id, total__gt=0, total=F(columna(estado))).exists()
+
+
+def incrementar(orden_id, cambios):
+    """
+    Suma los cambios a los contadores de la orden con F(). La fila se crea con
+    el primer detalle; las restas sobre una fila que no existe, por ejemplo
+    al eliminar la orden, se descartan.
+    """
+    filas = ConteoDetalles.objects.filter(orden_id=orden_id)
+    incrementos = {nombre: F(nombre) + cantidad for nombre, cantidad in cambios.items() if cantidad}
+    if not incrementos or filas.update(**incrementos) or cambios.get('total', 0) <= 0:
+        return
+    try:
+        with transaction.atomic():
+            ConteoDetalles.objects.create(orden_id=orden_id, **cambios)
+    except IntegrityError:
+        filas.update(**incrementos)
+
+
+def mover_detalle(anterior, nuevo):
+    """
+    Actualiza los contadores cuando un detalle cambia de estado o de orden,
+    anterior y nuevo son tuplas (orden_id, estado) o None si el detalle se
+    crea o se elimina. Devuelve los ids de las órdenes afectadas.
+    """
+    if anterior == nuevo:
+        return []
+    cambios = {}
+    for signo, valor in ((-1, anterior), (1, nuevo)):
+        if valor is None:
+            continue
+        orden_id, estado = valor
+        conteo = cambios.setdefault(orden_id, Counter())
+        conteo[columna(estado)] += signo
+        conteo['total'] += signo
+    for orden_id in sorted(cambios):
+        incrementar(orden_id, dict(cambios[orden_id]))
+    return sorted(cambios)
+
+
+def sincronizar_orden(orden_id):
+    """
+    Pone la orden en el estado que le corresponde según sus contadores,
+    leyendo una sola fila. Devuelve el estado de la orden. estado_orden solo
+    mueve las órdenes abiertas entre estados abiertos, transiciones que
+    TRANSICIONES_ORDEN siempre permite.
+    """
+    fila = ConteoDetalles.objects.filter(orden_id=orden_id).values('orden__estado', 'total', *COLUMNAS).first()
+    if fila is None:
+        return None
+    actual = fila['orden__estado']
+    nuevo = estado_orden(actual, fila)
+    if nuevo != actual:
+        dashboard.cambiar_estado(OrdenMantenimiento.objects.filter(pk=orden_id), nuevo)
+    return nuevo
+
+
+def cambiar_estado_detalle(detalle_id, estado):
+    """
+    Cambia el estado de un detalle si la transición está permitida, los
+    contadores y el estado de su orden se actualizan al guardarlo. Lanza
+    TransicionInvalida si no se permite.
+    """
+    with transaction.atomic():
+        detalle = DetalleOrden.objects.select_for_update().get(pk=detalle_id)
+        validar_detalle(detalle.estado, estado)
+        if detalle.estado != estado:
+            detalle.estado = estado
+            detalle.save(update_fields=['estado'])
+    return detalle
+
+
+def contar_detalles(estados):
+    """
+    Subconsulta con el número de detalles de la orden de cada fila de
+    contadores que están en alguno de los estados indicados.
+    """
+    detalles = DetalleOrden.objects.filter(orden_mantenimiento_id=OuterRef('orden_id'), estado__in=estados).order_by(
+        ).values('orden_mantenimiento_id').annotate(numero=Count('pk')).values('numero')
+    return Coalesce(Subquery(detalles, output_field=IntegerField()), Value(0))
+
+
+def confirmar(ids):
+    """
+    Confirma en bloque las órdenes indicadas y sus detalles. Solo se mueven
+    los detalles desde cuyo estado se permite pasar a confirmado, los
+    finalizados se quedan como están. Los contadores se ajustan antes con un
+    solo UPDATE que resta los detalles movidos de su columna y los suma a la
+    de confirmados.
+    """
+    estados = [estado for estado, siguientes in TRANSICIONES_DETALLE.items()
+               if estado is not None and 'CONFIRMADO' in siguientes]
+    cambios = {columna(estado): F(columna(estado)) - contar_detalles([estado]) for estado in estados}
+    ConteoDetalles.objects.filter(orden_id__in=ids).update(
+        confirmado=F('confirmado') + contar_detalles(estados), **cambios)
+    dashboard.cambiar_estado(
+        DetalleOrden.objects.filter(orden_mantenimiento_id__in=ids, estado__in=estados), 'CONFIRMADO')
+    return dashboard.cambiar_estado(OrdenMantenimiento.objects.filter(id__in=ids), 'CONFIRMADO')
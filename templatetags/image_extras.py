@@ -0,0 +1,37 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from store import images
+
+register = template.Library()
+
+
+@register.simple_tag()
+def srcset(image_hash, formato=images.FORMATO_RESPALDO):
+    """
+    Devuelve el atributo srcset con las miniaturas de una imagen en el formato indicado
+    """
+    if not image_hash:
+        return ''
+    return images.srcset(image_hash, formato)
+
+
+@register.simple_tag()
+def imagen_responsiva(image, image_hash, ancho, alto, alt=''):
+    """
+    Muestra una imagen de producto con sus miniaturas en WebP y JPEG, si las
+    miniaturas aún no se generan muestra la imagen original
+    """
+    nombre = str(image or '')
+    if not nombre:
+        return ''
+    if not image_hash:
+        return format_html('<img width="{}" height="{}" src="{}" alt="{}">',
+                           ancho, alto, images.campo_imagen.storage.url(nombre), alt)
+    fuentes = format_html_join('', '<source type="{}" srcset="{}" sizes="{}px">', (
+        (images.TIPOS[formato], images.srcset(image_hash, formato), ancho)
+        for formato in images.FORMATOS if formato != images.FORMATO_RESPALDO))
+    return format_html(
+        '<picture>{}<img width="{}" height="{}" src="{}" srcset="{}" sizes="{}px" alt="{}"></picture>',
+        fuentes, ancho, alto, images.url_derivado(image_hash, images.ANCHOS[0], images.FORMATO_RESPALDO),
+        images.srcset(image_hash, images.FORMATO_RESPALDO), ancho, alt)
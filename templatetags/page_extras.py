@@ -1,5 +1,7 @@
 from django import template
 
+from utils.permissions import obtener_permisos, obtener_roles
+
 register = template.Library()
 
 
@@ -12,12 +14,7 @@ def has_permission(user, permission_required):
         return False
     if user.is_superuser is True:
         return True
-    groups = user.groups.all()
-    for group in groups:
-        for permission in group.permissions.all():
-            if permission.codename == permission_required:
-                return True
-    return False
+    return permission_required in obtener_permisos(user)
 
 
 @register.simple_tag()
@@ -27,9 +24,4 @@ def has_role(user, group_required):
     """
     if user.is_active is False:
         return False
-
-    groups = user.groups.all()
-    for group in groups:
-        if group.name == group_required:
-            return True
-    return False
+    return group_required in obtener_roles(user)
@@ -0,0 +1,122 @@
+from django.core import signing
+from django.db import connection
+from django.db.models import Q
+from django.http import Http404
+
+CURSOR_SALT = 'utils.pagination.cursor'
+
+
+class CursorPage(object):
+    """
+    Página de resultados obtenida con paginación por cursor
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, approximate_count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approximate_count = approximate_count
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def invertir(campo):
+    return campo[1:] if campo.startswith('-') else '-' + campo
+
+
+def condicion_cursor(ordering, valores, atras=False):
+    """
+    Construye la condición que deja solo las filas posteriores al cursor
+    según el orden indicado, o las anteriores si se pagina hacia atrás.
+    """
+    condicion = Q()
+    iguales = {}
+    for campo, valor in zip(ordering, valores):
+        nombre = campo.lstrip('-')
+        descendente = campo.startswith('-') != atras
+        comparacion = {'{}__{}'.format(nombre, 'lt' if descendente else 'gt'): valor}
+        condicion |= Q(**iguales, **comparacion)
+        iguales[nombre] = valor
+    return condicion
+
+
+def codificar_cursor(objeto, ordering, direccion):
+    valores = [objeto._meta.get_field(campo.lstrip('-')).value_to_string(objeto)
+               for campo in ordering]
+    return signing.dumps([direccion, valores], salt=CURSOR_SALT, compress=True)
+
+
+def decodificar_cursor(model, ordering, cursor):
+    try:
+        direccion, valores = signing.loads(cursor, salt=CURSOR_SALT)
+        valores = [model._meta.get_field(campo.lstrip('-')).to_python(valor)
+                   for campo, valor in zip(ordering, valores)]
+    except (signing.BadSignature, ValueError, TypeError) as e:
+        raise Http404('Cursor inválido') from e
+    if direccion not in ('n', 'p') or len(valores) != len(ordering):
+        raise Http404('Cursor inválido')
+    return direccion, valores
+
+
+def contar_aproximado(model):
+    """
+    Devuelve el número aproximado de filas de la tabla según las estadísticas
+    del motor de base de datos, o None si no están disponibles.
+    """
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+    elif connection.vendor == 'mysql':
+        sql = ('SELECT table_rows FROM information_schema.tables '
+               'WHERE table_schema = DATABASE() AND table_name = %s')
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [model._meta.db_table])
+        fila = cursor.fetchone()
+    if fila is None or fila[0] is None or fila[0] < 0:
+        return None
+    return int(fila[0])
+
+
+def paginar_cursor(queryset, ordering, page_size, cursor=None, approximate_count=False):
+    """
+    Obtiene una página del queryset filtrando desde el cursor por los campos de
+    ordering, por lo que cualquier página cuesta lo mismo que la primera.
+    """
+    direccion, valores = 'n', None
+    if cursor:
+        direccion, valores = decodificar_cursor(queryset.model, ordering, cursor)
+    atras = direccion == 'p'
+    conteo = None
+    if approximate_count and not queryset.query.where:
+        conteo = contar_aproximado(queryset.model)
+    if valores is not None:
+        queryset = queryset.filter(condicion_cursor(ordering, valores, atras))
+    orden = [invertir(campo) for campo in ordering] if atras else list(ordering)
+    filas = list(queryset.order_by(*orden)[:page_size + 1])
+    hay_mas = len(filas) > page_size
+    filas = filas[:page_size]
+    if atras:
+        filas.reverse()
+        has_next, has_previous = True, hay_mas
+    else:
+        has_next, has_previous = hay_mas, valores is not None
+    next_cursor = previous_cursor = None
+    if filas and has_next:
+        next_cursor = codificar_cursor(filas[-1], ordering, 'n')
+    if filas and has_previous:
+        previous_cursor = codificar_cursor(filas[0], ordering, 'p')
+    return CursorPage(filas, next_cursor, previous_cursor, conteo)
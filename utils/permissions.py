@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core import checks
+from django.core.cache import cache
+
+CACHE_VERSION_KEY = 'permisos:version'
+CACHE_TIMEOUT = 60 * 60
+LRU_MAX_USUARIOS = 1024
+# Segundos que un proceso conserva los permisos sin volver a leer la caché compartida
+DURACION_LOCAL = getattr(settings, 'PERMISOS_DURACION_LOCAL', 60)
+CACHES_LOCALES = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+Accesos = namedtuple('Accesos', ('roles', 'permisos'))
+
+
+class CacheLRU(object):
+    """
+    Caché en memoria del proceso con desalojo del elemento usado hace más
+    tiempo. Con duracion los elementos vencen a los segundos indicados, así
+    un cambio que otro proceso no invalidó se ve a más tardar en ese tiempo.
+    """
+
+    def __init__(self, capacidad, duracion=None):
+        self.capacidad = capacidad
+        self.duracion = duracion
+        self.datos = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, clave):
+        with self.lock:
+            if clave not in self.datos:
+                return None
+            valor, vence = self.datos[clave]
+            if vence is not None and vence <= time.monotonic():
+                del self.datos[clave]
+                return None
+            self.datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor):
+        with self.lock:
+            vence = time.monotonic() + self.duracion if self.duracion is not None else None
+            self.datos[clave] = (valor, vence)
+            self.datos.move_to_end(clave)
+            while len(self.datos) > self.capacidad:
+                self.datos.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.datos.clear()
+
+
+permisos_locales = CacheLRU(LRU_MAX_USUARIOS, DURACION_LOCAL)
+
+
+def verificar_cache(app_configs, **kwargs):
+    """
+    Las versiones de permisos, catálogo, empresa y reportes se comparten por
+    la caché, en producción debe ser una caché común a todos los procesos
+    (CACHE_URL) para que las invalidaciones lleguen a todos.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in CACHES_LOCALES:
+        return []
+    return [checks.Error(
+        'La caché por omisión es local de cada proceso',
+        hint='Configure CACHE_URL con una caché compartida, por ejemplo memcache:// o redis://.',
+        id='utils.E001',
+    )]
+
+
+def obtener_version():
+    """
+    Devuelve la versión vigente de los permisos compartida entre procesos.
+    Si la clave no existe se inicia con la hora actual para no reutilizar
+    versiones anteriores que aún estén en caché.
+    """
+    version = cache.get(CACHE_VERSION_KEY)
+    if version is None:
+        cache.add(CACHE_VERSION_KEY, int(time.time()), None)
+        version = cache.get(CACHE_VERSION_KEY)
+    return version
+
+
+def invalidar_permisos():
+    """
+    Invalida los permisos de todos los usuarios incrementando la versión
+    """
+    try:
+        cache.incr(CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(CACHE_VERSION_KEY, int(time.time()), None)
+    permisos_locales.clear()
+
+
+def cargar_accesos(usuario):
+    """
+    Consulta en una sola query los grupos del usuario junto con los permisos
+    de cada grupo.
+    """
+    roles = set()
+    permisos = set()
+    filas = Group.objects.filter(user=usuario).order_by().values_list(
+        'name', 'permissions__codename')
+    for rol, permiso in filas:
+        roles.add(rol)
+        if permiso is not None:
+            permisos.add(permiso)
+    return Accesos(frozenset(roles), frozenset(permisos))
+
+
+def obtener_accesos(usuario):
+    """
+    Devuelve los roles y permisos del usuario. El resultado se guarda en el
+    objeto usuario para el resto de la petición y en caché entre peticiones.
+    """
+    accesos = getattr(usuario, '_accesos', None)
+    if accesos is not None:
+        return accesos
+    clave = 'accesos:{}:{}'.format(obtener_version(), usuario.pk)
+    accesos = permisos_locales.get(clave)
+    if accesos is None:
+        accesos = cache.get(clave)
+        if accesos is None:
+            accesos = cargar_accesos(usuario)
+            cache.set(clave, accesos, CACHE_TIMEOUT)
+        permisos_locales.set(clave, accesos)
+    usuario._accesos = accesos
+    return accesos
+
+
+def obtener_permisos(usuario):
+    """
+    Devuelve el conjunto de codenames de los permisos que el usuario tiene por
+    medio de sus grupos.
+    """
+    return obtener_accesos(usuario).permisos
+
+
+def obtener_roles(usuario):
+    """
+    Devuelve el conjunto de nombres de los grupos del usuario.
+    """
+    return obtener_accesos(usuario).roles
@@ -0,0 +1,86 @@
+import re
+
+from django.db import connection, transaction
+
+
+class QueryProfile(object):
+    """
+    Describe las relaciones y columnas que necesita un listado para evitar
+    consultas adicionales por cada fila mostrada en el template.
+    """
+
+    def __init__(self, select_related=(), prefetch_related=(), only=()):
+        self.select_related = tuple(select_related)
+        self.prefetch_related = tuple(prefetch_related)
+        self.only = tuple(only)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.only:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+
+PATRON_SEQ_SCAN_POSTGRESQL = re.compile(r'Seq Scan on (\w+)')
+PATRON_SCAN_SQLITE = re.compile(r'\bSCAN (?:TABLE )?(\w+)')
+PATRON_ALL_MYSQL = re.compile(r'"table_name":\s*"(\w+)",\s*"access_type":\s*"ALL"')
+NO_TABLAS_SQLITE = ('CONSTANT', 'SUBQUERY')
+
+
+def explicar(queryset):
+    """
+    Devuelve el plan de ejecución del queryset. En PostgreSQL se desactivan
+    los recorridos secuenciales para la consulta, así el plan solo los usa si
+    ningún índice sirve, aunque la tabla tenga pocas filas.
+    """
+    if connection.vendor == 'postgresql':
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+    if connection.vendor == 'mysql':
+        return queryset.explain(format='json')
+    return queryset.explain()
+
+
+def recorridos_secuenciales(plan, recorridos_por_clave=()):
+    """
+    Tablas que el plan recorre completas en lugar de usar un índice.
+    SQLite muestra igual que un recorrido completo la lectura de una tabla en
+    el orden de su clave primaria, que es su propio índice. recorridos_por_clave
+    son las tablas que la consulta lee así, sin filtros y con límite, y no se
+    marcan si el plan no ordena los resultados aparte.
+    """
+    if connection.vendor == 'postgresql':
+        return PATRON_SEQ_SCAN_POSTGRESQL.findall(plan)
+    if connection.vendor == 'mysql':
+        return PATRON_ALL_MYSQL.findall(plan)
+    ordena_aparte = 'TEMP B-TREE FOR ORDER BY' in plan
+    tablas = []
+    for linea in plan.splitlines():
+        coincidencia = PATRON_SCAN_SQLITE.search(linea)
+        if coincidencia and 'USING' not in linea and coincidencia.group(1) not in NO_TABLAS_SQLITE:
+            if coincidencia.group(1) in recorridos_por_clave and not ordena_aparte:
+                continue
+            tablas.append(coincidencia.group(1))
+    return tablas
+
+
+def recorridos_por_clave(queryset):
+    """
+    Tabla del queryset si lo lee por partes en el orden de su clave primaria
+    sin otros filtros, cada página lee solo sus filas.
+    """
+    query = queryset.query
+    if query.where or query.high_mark is None or not query.order_by:
+        return ()
+    opts = queryset.model._meta
+    claves = {'pk', opts.pk.name, opts.pk.attname}
+    if opts.pk.remote_field is not None:
+        # En la herencia de tablas la clave es el id del padre
+        claves.add(opts.pk.target_field.name)
+    if any(not isinstance(campo, str) or campo.lstrip('-') not in claves for campo in query.order_by):
+        return ()
+    return (opts.db_table,)
@@ -1,5 +1,8 @@
 from django.core.exceptions import PermissionDenied
 
+from utils.pagination import CursorPage, paginar_cursor
+from utils.permissions import obtener_permisos
+
 
 class CustomUserOnlyMixin(object):
     """
@@ -12,12 +15,10 @@ class CustomUserOnlyMixin(object):
             return False
         if self.request.user.is_superuser is True:
             return True
-        groups = self.request.user.groups.all()
+        permisos = obtener_permisos(self.request.user)
         for permission_required in self.permissions_required:
-            for group in groups:
-                for permission in group.permissions.all():
-                    if permission.codename == permission_required:
-                        return True
+            if permission_required in permisos:
+                return True
         return False
 
     def dispatch(self, request, *args, **kwargs):
@@ -47,3 +48,54 @@ class CustomGroupOnlyMixin(object):
             raise PermissionDenied
         return super(CustomGroupOnlyMixin, self).dispatch(
             request, *args, **kwargs)
+
+
+class QueryProfileMixin(object):
+    """
+    Permite aplicar un perfil de consulta declarado en el view al queryset
+    base del listado
+    """
+    query_profile = None
+
+    def get_profiled_queryset(self):
+        queryset = self.queryset.all()
+        if self.query_profile is not None:
+            queryset = self.query_profile.apply(queryset)
+        return queryset
+
+
+class CursorPaginationMixin(object):
+    """
+    Permite paginar un ListView por cursor sobre los campos de cursor_ordering
+    en lugar de usar OFFSET, si el queryset ya tiene un orden propio (por
+    ejemplo el de una búsqueda) se usa la paginación normal
+    """
+    cursor_ordering = None
+    cursor_approximate_count = False
+    cursor_kwarg = 'cursor'
+
+    def uses_cursor_pagination(self, queryset):
+        return self.cursor_ordering is not None and not queryset.query.order_by
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.uses_cursor_pagination(queryset):
+            return super(CursorPaginationMixin, self).paginate_queryset(queryset, page_size)
+        page = paginar_cursor(queryset, self.cursor_ordering, page_size,
+                              self.request.GET.get(self.cursor_kwarg),
+                              self.cursor_approximate_count)
+        return (None, page, page.object_list, page.has_other_pages())
+
+    def get_cursor_query(self):
+        """
+        Parámetros de la petición sin el cursor, los enlaces de página los
+        conservan para no perder los filtros
+        """
+        parametros = self.request.GET.copy()
+        parametros.pop(self.cursor_kwarg, None)
+        return parametros.urlencode()
+
+    def get_context_data(self, **kwargs):
+        context = super(CursorPaginationMixin, self).get_context_data(**kwargs)
+        context['cursor_pagination'] = isinstance(context.get('page_obj'), CursorPage)
+        context['cursor_query'] = self.get_cursor_query()
+        return context